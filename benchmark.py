@@ -0,0 +1,550 @@
+'''
+Micro-benchmarks for the hot paths of utils.py
+'''
+
+import argparse, random, time, datetime, gzip, pathlib, tempfile, multiprocessing, struct, zlib, sqlite3, json, uuid, subprocess
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Callable, Iterable, Iterator, Any, Tuple, Dict, Optional
+
+import utils
+
+PLAYERS = ["Steve", "Alex", "Notch", "jeb_", "Dinnerbone", "Grumm"]
+
+def make_log_messages(count: int, seed: int = 0) -> List[str]:
+    return list(iter_log_messages(count=count, seed=seed))
+
+def iter_log_messages(count: int, seed: int = 0) -> Iterator[str]:
+    '''
+    Builds the message part of log lines with a realistic mix: mostly chat, commands and
+    server noise, with a few join/leave and movement lines for the parsers to match.
+    '''
+    rng = random.Random(seed)
+    for i in range(count):
+        player = rng.choice(PLAYERS)
+        roll = rng.random()
+        if roll < 0.45:
+            message = f"<{player}> has anyone seen my diamond pickaxe? I left it near spawn {i}"
+        elif roll < 0.65:
+            message = f"{player} issued server command: /tp {player} {rng.randint(-5000, 5000)} 64 {rng.randint(-5000, 5000)}"
+        elif roll < 0.80:
+            message = f"Can't keep up! Is the server overloaded? Running {rng.randint(2000, 9000)}ms or {rng.randint(40, 180)} ticks behind"
+        elif roll < 0.84:
+            message = f"{player}[/10.0.0.{rng.randint(2, 254)}:{rng.randint(1024, 65535)}] logged in with entity id {rng.randint(1, 99999)} at ({rng.uniform(-5000, 5000):.2f}, 64.0, {rng.uniform(-5000, 5000):.2f})"
+        elif roll < 0.88:
+            message = f"{player} joined the game"
+        elif roll < 0.92:
+            message = f"{player} left the game"
+        elif roll < 0.94:
+            message = f"{player} lost connection: Disconnected"
+        elif roll < 0.96:
+            message = f"UUID of player {player} is 069a79f4-44e9-4726-a5be-fca90e38aaf5"
+        else:
+            message = f"{player} moved too quickly! {rng.uniform(-20, 20):.3f},0.0,{rng.uniform(-20, 20):.3f}"
+        yield message + "\n"
+
+def iter_log_lines(count: int, seed: int = 0) -> Iterator[str]:
+    timestamps = iter_log_timestamps(count=count, seed=seed)
+    for message in iter_log_messages(count=count, seed=seed):
+        yield f"[{next(timestamps)}] [Server thread/INFO] [net.minecraft.server.MinecraftServer/]: {message}"
+
+def make_log_timestamps(count: int, seed: int = 0) -> List[str]:
+    return list(iter_log_timestamps(count=count, seed=seed))
+
+def iter_log_timestamps(count: int, seed: int = 0) -> Iterator[str]:
+    rng = random.Random(seed)
+    timestamp = datetime.datetime(2023, 3, 17, 10, 0, 0)
+    for _ in range(count):
+        timestamp += datetime.timedelta(milliseconds=rng.randint(0, 400))
+        yield f"{timestamp:%d%b%Y %H:%M:%S}.{timestamp.microsecond // 1000:03d}"
+
+def naive_dispatch(line: str):
+    for parser in utils.parsers:
+        m = parser.parse(line)
+        if m:
+            yield parser, m
+
+def lines_per_second(func: Callable[[Any], Iterable[Any]], lines: List[str], repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            for _ in func(line):
+                pass
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return len(lines) / best
+
+def benchmark_dispatch(count: int, repeat: int):
+    lines = make_log_messages(count)
+    dispatcher = utils.LogDispatcher(utils.parsers)
+
+    for line in lines:
+        assert [(p.name, m.groups()) for p, m in naive_dispatch(line)] == [(p.name, m.groups()) for p, m in dispatcher.dispatch(line)]
+
+    before = lines_per_second(naive_dispatch, lines, repeat)
+    after = lines_per_second(dispatcher.dispatch, lines, repeat)
+    print(f"dispatch: {count} lines, every parser: {before:,.0f} lines/sec, LogDispatcher: {after:,.0f} lines/sec ({after / before:.1f}x)")
+
+def benchmark_timestamps(count: int, repeat: int):
+    timestamps = make_log_timestamps(count)
+    parser = utils.TimestampParser()
+
+    for timestamp in timestamps:
+        assert parser.parse_log(timestamp) == datetime.datetime.strptime(timestamp, utils.LOG_TIMESTAMP_FORMAT)
+
+    before = lines_per_second(lambda text: (datetime.datetime.strptime(text, utils.LOG_TIMESTAMP_FORMAT),), timestamps, repeat)
+    after = lines_per_second(lambda text: (parser.parse_log(text),), timestamps, repeat)
+    print(f"timestamps: {count} lines, strptime: {before:,.0f} lines/sec, TimestampParser: {after:,.0f} lines/sec ({after / before:.1f}x)")
+
+def measure_parse_logs(input_path: str, read_buffer_size: int) -> Tuple[int, int, float]:
+    '''
+    Runs parse_logs in a fresh process and returns its peak RSS in KiB before and after, and the time taken.
+
+    The peak RSS of a spawned process starts at its parent's, so the caller has to stream its test data.
+    '''
+    import resource
+
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    options = utils.IngestOptions(read_buffer_size=read_buffer_size)
+    utils.parse_logs(database=str(pathlib.Path(input_path) / "results.db"), input_path=pathlib.Path(input_path), source_id=1, options=options)
+    elapsed = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return before, after, elapsed
+
+def benchmark_memory(count: int, repeat: int, read_buffer_size: int = utils.DEFAULT_READ_BUFFER_SIZE):
+    context = multiprocessing.get_context("spawn")
+    for size in [count // 4, count, count * 4]:
+        with tempfile.TemporaryDirectory() as input_path:
+            logs_path = pathlib.Path(input_path) / "logs"
+            logs_path.mkdir()
+            log_path = logs_path / "2023-03-17-1.log.gz"
+            with gzip.open(log_path, "wt") as fp:
+                fp.writelines(iter_log_lines(size))
+            with gzip.open(log_path, "rb") as fp:
+                megabytes = sum(len(chunk) for chunk in iter(lambda: fp.read(1 << 20), b"")) / 1048576
+
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                before, after, elapsed = executor.submit(measure_parse_logs, input_path, read_buffer_size).result()
+        print(f"memory: {size} lines, {megabytes:.1f} MB decompressed, peak RSS {after / 1024:.1f} MB ({(after - before) / 1024:+.1f} MB while parsing) in {elapsed:.2f}s")
+
+def encode_nbt(tag_type: int, value: Any) -> bytes:
+    '''
+    Encodes the payload of a tag, compounds are dicts of name to (tag_type, value) and lists are (item_type, items)
+    '''
+    if tag_type in utils.NBT_SCALARS:
+        return utils.NBT_SCALARS[tag_type].pack(value)
+    if tag_type == utils.TAG_STRING:
+        data = value.encode("utf-8")
+        return struct.pack(">H", len(data)) + data
+    if tag_type in utils.NBT_ARRAY_ITEM_SIZES:
+        item = {1: "b", 4: "i", 8: "q"}[utils.NBT_ARRAY_ITEM_SIZES[tag_type]]
+        return struct.pack(f">i{len(value)}{item}", len(value), *value)
+    if tag_type == utils.TAG_LIST:
+        item_type, items = value
+        return struct.pack(">bi", item_type, len(items)) + b"".join(encode_nbt(item_type, item) for item in items)
+    if tag_type == utils.TAG_COMPOUND:
+        return b"".join(bytes([item_type]) + encode_nbt(utils.TAG_STRING, name) + encode_nbt(item_type, item) for name, (item_type, item) in value.items()) + b"\0"
+    raise ValueError(tag_type)
+
+def decode_nbt(reader: utils.NBTReader, tag_type: int) -> Any:
+    '''
+    Decodes a whole tag into Python objects, the way a general purpose NBT library would
+    '''
+    if tag_type in utils.NBT_SCALARS or tag_type == utils.TAG_STRING:
+        return reader.read(tag_type)
+    if tag_type in utils.NBT_ARRAY_ITEM_SIZES:
+        size = utils.NBT_ARRAY_ITEM_SIZES[tag_type]
+        (length,) = struct.unpack_from(">i", reader.data, reader.pos)
+        values = struct.unpack_from(f">{length}{ {1: 'b', 4: 'i', 8: 'q'}[size]}", reader.data, reader.pos + 4)
+        reader.pos += 4 + length * size
+        return list(values)
+    if tag_type == utils.TAG_LIST:
+        item_type, length = reader.read_list()
+        return [decode_nbt(reader, item_type) for _ in range(length)]
+    if tag_type == utils.TAG_COMPOUND:
+        compound = {}
+        while True:
+            item_type, name = reader.read_tag()
+            if item_type == utils.TAG_END:
+                return compound
+            compound[name] = decode_nbt(reader, item_type)
+    raise ValueError(tag_type)
+
+def make_chunk(rng: random.Random, x: int, z: int, sections: int = 24) -> bytes:
+    '''
+    Builds the NBT of a 1.18+ chunk with 24 sections of packed block states and a few block entities
+    '''
+    palette = [{"Name": (utils.TAG_STRING, name)} for name in ["minecraft:stone", "minecraft:dirt", "minecraft:air", "minecraft:deepslate"]]
+    sections = [{
+        "Y": (utils.TAG_BYTE, y),
+        "block_states": (utils.TAG_COMPOUND, {
+            "palette": (utils.TAG_LIST, (utils.TAG_COMPOUND, palette)),
+            "data": (utils.TAG_LONG_ARRAY, [rng.getrandbits(63) for _ in range(256)]),
+        }),
+        "biomes": (utils.TAG_COMPOUND, {
+            "palette": (utils.TAG_LIST, (utils.TAG_STRING, ["minecraft:plains"])),
+        }),
+        "BlockLight": (utils.TAG_BYTE_ARRAY, [0] * 2048),
+    } for y in range(-4, sections - 4)]
+    block_entities = [{
+        "id": (utils.TAG_STRING, "minecraft:chest"),
+        "x": (utils.TAG_INT, (x << 4) + i),
+        "y": (utils.TAG_INT, 64),
+        "z": (utils.TAG_INT, z << 4),
+        "Items": (utils.TAG_LIST, (utils.TAG_COMPOUND, [])),
+    } for i in range(rng.randint(0, 4))]
+    chunk = {
+        "DataVersion": (utils.TAG_INT, 3120),
+        "xPos": (utils.TAG_INT, x),
+        "zPos": (utils.TAG_INT, z),
+        "Status": (utils.TAG_STRING, "full"),
+        "LastUpdate": (utils.TAG_LONG, rng.randint(0, 1 << 20)),
+        "InhabitedTime": (utils.TAG_LONG, rng.randint(0, 1 << 16)),
+        "sections": (utils.TAG_LIST, (utils.TAG_COMPOUND, sections)),
+        "block_entities": (utils.TAG_LIST, (utils.TAG_COMPOUND, block_entities)),
+        "Heightmaps": (utils.TAG_COMPOUND, {"WORLD_SURFACE": (utils.TAG_LONG_ARRAY, [rng.getrandbits(63) for _ in range(37)])}),
+    }
+    return bytes([utils.TAG_COMPOUND]) + encode_nbt(utils.TAG_STRING, "") + encode_nbt(utils.TAG_COMPOUND, chunk)
+
+def write_region(path: pathlib.Path, chunks: List[bytes]):
+    header = bytearray(utils.REGION_HEADER_SIZE)
+    body = bytearray()
+    sector = 2
+    for index, chunk in enumerate(chunks):
+        data = zlib.compress(chunk)
+        payload = struct.pack(">IB", len(data) + 1, utils.CHUNK_COMPRESSION_ZLIB) + data
+        payload += b"\0" * (-len(payload) % utils.REGION_SECTOR_SIZE)
+        count = len(payload) // utils.REGION_SECTOR_SIZE
+        struct.pack_into(">I", header, index * 4, (sector << 8) | count)
+        struct.pack_into(">I", header, utils.REGION_SECTOR_SIZE + index * 4, 1678000000 + index)
+        body += payload
+        sector += count
+    path.write_bytes(bytes(header) + bytes(body))
+
+def benchmark_chunks(count: int, repeat: int):
+    rng = random.Random(0)
+    # One region holds at most 1024 chunks, --lines is scaled down as chunks are much larger than lines
+    chunks = [make_chunk(rng, index & 31, index >> 5) for index in range(min(max(count // 1000, 1), 1024))]
+    parser = utils.WorldParser()
+
+    for chunk in chunks:
+        tree = decode_nbt(utils.NBTReader(chunk, 3), utils.TAG_COMPOUND)
+        stats = parser.parse_chunk(chunk)
+        assert (stats.data_version, stats.status, stats.inhabited_time, stats.last_update, stats.block_entities) == (tree["DataVersion"], tree["Status"], tree["InhabitedTime"], tree["LastUpdate"], len(tree["block_entities"]))
+
+    megabytes = sum(len(chunk) for chunk in chunks) / 1048576
+    before = lines_per_second(lambda chunk: (decode_nbt(utils.NBTReader(chunk, 3), utils.TAG_COMPOUND),), chunks, repeat)
+    after = lines_per_second(lambda chunk: (parser.parse_chunk(chunk),), chunks, repeat)
+    print(f"chunks: {len(chunks)} chunks, {megabytes:.1f} MB of NBT, full decode: {before:,.0f} chunks/sec, WorldParser: {after:,.0f} chunks/sec ({after / before:.1f}x)")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = pathlib.Path(directory) / "r.0.0.mca"
+        write_region(path, chunks)
+        start = time.perf_counter()
+        scanned = sum(1 for chunk, stats in parser.parse_region(path) if stats is not None)
+        elapsed = time.perf_counter() - start
+        assert scanned == len(chunks)
+        print(f"chunks: {path.stat().st_size / 1048576:.1f} MB region file with {scanned} chunks decompressed and parsed in {elapsed:.2f}s ({scanned / elapsed:,.0f} chunks/sec)")
+
+def scan_text(log_path: pathlib.Path) -> List[Tuple[str, List[Any]]]:
+    with utils.open_hashed(path=log_path) as hashing, utils.open_log(log_path, raw=hashing) as log_file:
+        rows = list(utils.iter_log_rows(utils.LogReader(log_file=log_file)))
+        hashing.drain()
+    return rows
+
+def scan_mapped(log_path: pathlib.Path) -> List[Tuple[str, List[Any]]]:
+    with utils.MappedLogReader(log_path=log_path) as reader:
+        rows = list(reader.rows())
+        reader.hexdigests()
+    return rows
+
+def benchmark_engines(count: int, repeat: int):
+    '''
+    Compares reading a plain .log line by line with scanning it through mmap, both hashing it as parse_logs does
+    '''
+    with tempfile.TemporaryDirectory() as directory:
+        log_path = pathlib.Path(directory) / "latest.log"
+        with log_path.open("w", encoding=utils.LOG_ENCODING) as fp:
+            fp.writelines(iter_log_lines(count))
+        megabytes = log_path.stat().st_size / 1048576
+
+        rows = scan_text(log_path)
+        assert rows == scan_mapped(log_path)
+
+        results = dict()
+        for name, scan in [("text", scan_text), ("mmap", scan_mapped)]:
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                scan(log_path)
+                elapsed = time.perf_counter() - start
+                if best is None or elapsed < best:
+                    best = elapsed
+            results[name] = best
+            print(f"engines: {name}: {count} lines, {len(rows)} rows, {megabytes:.1f} MB in {best:.2f}s ({count / best:,.0f} lines/sec, {megabytes / best:.1f} MB/sec)")
+        print(f"engines: mmap is {results['text'] / results['mmap']:.1f}x the text engine")
+
+SCHEMA_QUERIES = {
+    "sessions": (utils.SESSION_SELECT_SQL, (1, 1, 1)),
+    "logins per player": ("SELECT player, COUNT(*) FROM MINECRAFT_SERVER_LOGS_LOGGED_IN WHERE source_id = ? GROUP BY player", (1,)),
+    "departures in an hour": ("SELECT COUNT(*) FROM MINECRAFT_SERVER_LOGS_LEFT_GAME WHERE log_datetime BETWEEN ? AND ?", ("2023-03-17 10:00:00", "2023-03-17 11:00:00")),
+    "player history": ("SELECT log_datetime, x, z FROM MINECRAFT_SERVER_LOGS_LOGGED_IN WHERE player = ? ORDER BY log_datetime", ("Steve",)),
+}
+
+def benchmark_schema(count: int, repeat: int):
+    '''
+    Compares the database size and query times of the original and the --compact schemas
+    '''
+    with tempfile.TemporaryDirectory() as directory:
+        input_path = pathlib.Path(directory)
+        logs_path = input_path / "logs"
+        logs_path.mkdir()
+        (input_path / "crash-reports").mkdir()
+        with gzip.open(logs_path / "2023-03-17-1.log.gz", "wt") as fp:
+            fp.writelines(iter_log_lines(count))
+
+        for name, options in [("original", utils.IngestOptions()), ("compact", utils.IngestOptions(compact=True)), ("compact with raw lines", utils.IngestOptions(compact=True, raw_lines=True))]:
+            database = str(input_path / f"{name}.db")
+            start = time.perf_counter()
+            utils.parse_crash_reports(database=database, input_path=input_path, source_id=1, options=options)
+            utils.parse_logs(database=database, input_path=input_path, source_id=1, options=options)
+            utils.parse_sessions(database=database, input_path=input_path, source_id=1, options=options)
+            elapsed = time.perf_counter() - start
+            megabytes = pathlib.Path(database).stat().st_size / 1048576
+            print(f"schema: {name}, {count} lines, {megabytes:.1f} MB database, ingested in {elapsed:.2f}s")
+
+            with sqlite3.connect(database) as con:
+                for query, (sql, parameters) in SCHEMA_QUERIES.items():
+                    best = None
+                    for _ in range(repeat):
+                        start = time.perf_counter()
+                        rows = con.execute(sql, parameters).fetchall()
+                        elapsed = time.perf_counter() - start
+                        if best is None or elapsed < best:
+                            best = elapsed
+                    print(f"schema: {name}, {query}: {len(rows)} rows in {best * 1000:.1f}ms")
+
+LOG_PREFIX = "[{timestamp:%d%b%Y %H:%M:%S}.{millisecond:03d}] [{thread}/{level}] [net.minecraft.server.MinecraftServer/]: "
+
+def iter_server_log_lines(rng: random.Random, start: datetime.datetime, count: int, players: List[Tuple[str, str]]) -> Iterator[str]:
+    '''
+    Simulates a day of a server: players log in, chat, run commands and move too quickly, then leave or
+    lose connection, with the server falling behind now and then and the occasional crash.
+    '''
+    timestamp = start
+    online: Dict[str, Tuple[str, str]] = dict()
+
+    def line(message: str, thread: str = "Server thread", level: str = "INFO") -> str:
+        return LOG_PREFIX.format(timestamp=timestamp, millisecond=timestamp.microsecond // 1000, thread=thread, level=level) + message + "\n"
+
+    yield line("Starting minecraft server version 1.19.3")
+    for _ in range(count - 1):
+        timestamp += datetime.timedelta(milliseconds=rng.randint(0, 2000))
+        roll = rng.random()
+        if roll < 0.03 and len(online) < len(players):
+            name, player_uuid = rng.choice([player for player in players if player[0] not in online])
+            online[name] = (name, player_uuid)
+            yield line(f"UUID of player {name} is {player_uuid}", thread="User Authenticator #1")
+            yield line(f"{name}[/10.0.{rng.randint(0, 255)}.{rng.randint(2, 254)}:{rng.randint(1024, 65535)}] logged in with entity id {rng.randint(1, 99999)} at ({rng.uniform(-3000, 3000):.2f}, {rng.uniform(50, 120):.1f}, {rng.uniform(-3000, 3000):.2f})")
+            yield line(f"{name} joined the game")
+        elif roll < 0.06 and online:
+            name = rng.choice(list(online))
+            del online[name]
+            if rng.random() < 0.5:
+                yield line(f"{name} lost connection: Disconnected")
+            yield line(f"{name} left the game")
+        elif roll < 0.08 and online:
+            yield line(f"{rng.choice(list(online))} moved too quickly! {rng.uniform(-20, 20):.3f},0.0,{rng.uniform(-20, 20):.3f}", level="WARN")
+        elif roll < 0.0805:
+            yield line(f"This crash report has been saved to: ./crash-reports/crash-{timestamp:%Y-%m-%d_%H.%M.%S}-server.txt", level="ERROR")
+        elif roll < 0.15:
+            yield line(f"Can't keep up! Is the server overloaded? Running {rng.randint(2000, 9000)}ms or {rng.randint(40, 180)} ticks behind", level="WARN")
+        elif online and roll < 0.35:
+            name = rng.choice(list(online))
+            yield line(f"{name} issued server command: /tp {name} {rng.randint(-5000, 5000)} 64 {rng.randint(-5000, 5000)}")
+        elif online:
+            yield line(f"<{rng.choice(list(online))}> has anyone seen my diamond pickaxe? I left it near spawn")
+        else:
+            yield line("Saving the game (this may take a moment!)")
+
+def make_crash_report(rng: random.Random, timestamp: datetime.datetime, players: List[Tuple[str, str]]) -> str:
+    details = ", ".join(
+        f"ServerPlayer['{name}'/{rng.randint(1, 99999)}, l='ServerLevel[world]', x={rng.uniform(-3000, 3000):.2f}, y={rng.uniform(50, 120):.2f}, z={rng.uniform(-3000, 3000):.2f}]"
+        for name, player_uuid in players
+    )
+    trace = "".join(f"\tat net.minecraft.server.Class{i}.method{i}(SourceFile:{rng.randint(1, 999)})\n" for i in range(40))
+    return (
+        "---- Minecraft Crash Report ----\n// Oops\n\n"
+        f"Time: {timestamp:%m/%d/%y, %I:%M %p}\nDescription: Exception in server tick loop\n\n"
+        f"java.lang.NullPointerException: boom\n{trace}\n\n"
+        "-- System Details --\nDetails:\n"
+        f"\tPlayer Count: {len(players)} / 20; [{details}]\n\tData Packs: vanilla\n"
+    )
+
+def make_server(path: pathlib.Path, lines: int, seed: int = 0, players: int = 20, days: Optional[int] = None, regions: Optional[int] = None) -> Dict[str, int]:
+    '''
+    Writes a fake server directory with about the given number of log lines, spread over a log per day, and
+    crash reports, player lists, server.properties, region files and stats scaled along with it.
+    '''
+    rng = random.Random(seed)
+    days = days or max(1, lines // 50000)
+    regions = regions if regions is not None else max(1, min(16, lines // 50000))
+    roster = [(f"Player{i}", str(uuid.UUID(int=rng.getrandbits(128), version=4))) for i in range(players)]
+
+    for directory in ["logs", "crash-reports", "world/region", "world/stats"]:
+        (path / directory).mkdir(parents=True, exist_ok=True)
+
+    start = datetime.datetime(2023, 1, 1, 6, 0, 0)
+    for day in range(days):
+        day_start = start + datetime.timedelta(days=day)
+        log_lines = iter_server_log_lines(rng, day_start, lines // days, roster)
+        if day == days - 1:
+            with (path / "logs" / "latest.log").open("w") as fp:
+                fp.writelines(log_lines)
+        else:
+            with gzip.open(path / "logs" / f"{day_start:%Y-%m-%d}-1.log.gz", "wt") as fp:
+                fp.writelines(log_lines)
+
+    crash_reports = max(1, days // 2)
+    for i in range(crash_reports):
+        timestamp = start + datetime.timedelta(days=i * 2, hours=rng.randint(0, 12), seconds=rng.randint(0, 3599))
+        (path / "crash-reports" / f"crash-{timestamp:%Y-%m-%d_%H.%M.%S}-server.txt").write_text(make_crash_report(rng, timestamp, rng.sample(roster, rng.randint(1, min(5, players)))))
+
+    (path / "ops.json").write_text(json.dumps([{"uuid": player_uuid, "name": name, "level": 4, "bypassesPlayerLimit": False} for name, player_uuid in roster[:2]]))
+    (path / "whitelist.json").write_text(json.dumps([{"uuid": player_uuid, "name": name} for name, player_uuid in roster]))
+    (path / "usercache.json").write_text(json.dumps([{"uuid": player_uuid, "name": name, "expiresOn": "2023-04-01 10:00:00 +0000"} for name, player_uuid in roster]))
+    (path / "server.properties").write_text("#Minecraft server properties\nlevel-name=world\nmotd=A Minecraft Server\nmax-players=20\n")
+
+    for i in range(regions):
+        region_x, region_z = i % 4 - 2, i // 4 - 2
+        write_region(path / "world" / "region" / f"r.{region_x}.{region_z}.mca", [make_chunk(rng, (region_x << 5) + index % 32, (region_z << 5) + index // 32, sections=2) for index in range(256)])
+
+    for name, player_uuid in roster:
+        stats = {
+            "minecraft:mined": {f"minecraft:{block}": rng.randint(0, 10000) for block in ["stone", "dirt", "deepslate", "oak_log"]},
+            "minecraft:crafted": {f"minecraft:{item}": rng.randint(0, 500) for item in ["torch", "stick", "crafting_table"]},
+            "minecraft:custom": {"minecraft:walk_one_cm": rng.randint(0, 10 ** 7), "minecraft:play_time": rng.randint(0, 10 ** 6), "minecraft:deaths": rng.randint(0, 50)},
+        }
+        (path / "world" / "stats" / f"{player_uuid}.json").write_text(json.dumps({"stats": stats, "DataVersion": 3218}))
+
+    return {"days": days, "crash_reports": crash_reports, "regions": regions, "players": players}
+
+# The stages of utils.main, with the files each one reads
+STAGES = {
+    "parse_crash_reports": ["crash-reports/*"],
+    "parse_ops": ["ops.json"],
+    "parse_whitelist": ["whitelist.json"],
+    "parse_usercache": ["usercache.json"],
+    "parse_server_properties": ["server.properties"],
+    "parse_world_regions": ["world/region/*"],
+    "parse_world_stats": ["world/stats/*"],
+    "parse_logs": ["logs/*"],
+    "parse_sessions": [],
+}
+
+def count_rows(database: str) -> int:
+    with sqlite3.connect(database) as con:
+        tables = [name for (name,) in con.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND sql NOT LIKE 'CREATE VIRTUAL%' AND name NOT LIKE '%RTREE%'")]
+        return sum(con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in tables)
+
+def measure_stage(stage: str, database: str, input_path: str, source_id: int) -> Tuple[int, int, float]:
+    '''
+    Runs one stage in a fresh process and returns its peak RSS in KiB before and after, and the time taken
+    '''
+    import resource
+
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    getattr(utils, stage)(database=database, input_path=pathlib.Path(input_path), source_id=source_id, options=utils.IngestOptions())
+    elapsed = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return before, after, elapsed
+
+def git_version() -> str:
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=pathlib.Path(__file__).parent, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def store_result(results: str, version: str, benchmark: str, stage: str, parameters: str, rows: int, megabytes: float, seconds: float, peak_rss: float) -> Optional[Tuple[str, float]]:
+    '''
+    Records a result and returns the version and seconds of the previous result for the same stage and parameters
+    '''
+    with sqlite3.connect(results) as con:
+        con.execute("CREATE TABLE IF NOT EXISTS BENCHMARK_RESULTS(run_date timestamp, version TEXT, benchmark TEXT, stage TEXT, parameters TEXT, rows INTEGER, megabytes REAL, seconds REAL, peak_rss_megabytes REAL)")
+        previous = con.execute(
+            "SELECT version, seconds FROM BENCHMARK_RESULTS WHERE benchmark = ? AND stage = ? AND parameters = ? ORDER BY rowid DESC LIMIT 1",
+            (benchmark, stage, parameters),
+        ).fetchone()
+        con.execute("INSERT INTO BENCHMARK_RESULTS VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)", (datetime.datetime.now(), version, benchmark, stage, parameters, rows, megabytes, seconds, peak_rss))
+        con.commit()
+        return previous
+
+def benchmark_stages(count: int, repeat: int, results: str = "benchmark.db"):
+    '''
+    Ingests a generated server one stage at a time, each in its own process, reporting rows/sec, MB/sec and peak RSS
+    '''
+    context = multiprocessing.get_context("spawn")
+    version = git_version()
+    parameters = json.dumps({"lines": count})
+
+    with tempfile.TemporaryDirectory() as directory:
+        input_path = pathlib.Path(directory) / "server"
+        scale = make_server(input_path, lines=count)
+        print(f"stages: generated {count} log lines over {scale['days']} days, {scale['crash_reports']} crash reports, {scale['regions']} regions and {scale['players']} players")
+
+        database = str(pathlib.Path(directory) / "results.db")
+        source_id = utils.write_source(database=database, input_path=input_path)
+        for stage, patterns in STAGES.items():
+            megabytes = sum(path.stat().st_size for pattern in patterns for path in input_path.glob(pattern)) / 1048576
+            rows_before = count_rows(database)
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                before, after, elapsed = executor.submit(measure_stage, stage, database, str(input_path), source_id).result()
+            rows = count_rows(database) - rows_before
+
+            previous = store_result(results, version, "stages", stage, parameters, rows, megabytes, elapsed, after / 1024)
+            change = f", {(elapsed - previous[1]) / previous[1]:+.0%} time vs {previous[0]}" if previous and previous[1] else ""
+            print(f"stages: {stage}: {rows} rows, {megabytes:.1f} MB in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/sec, {megabytes / elapsed:.1f} MB/sec), peak RSS {after / 1024:.1f} MB{change}")
+
+benchmarks = {
+    "dispatch": benchmark_dispatch,
+    "timestamps": benchmark_timestamps,
+    "memory": benchmark_memory,
+    "chunks": benchmark_chunks,
+    "engines": benchmark_engines,
+    "schema": benchmark_schema,
+    "stages": benchmark_stages,
+}
+
+def create_parser():
+    parser = argparse.ArgumentParser(
+        prog='MinecraftLogBenchmark',
+    )
+
+    parser.add_argument('-b', '--benchmark', action='append', choices=list(benchmarks), help="benchmark to run, can be repeated, all of them by default")
+    parser.add_argument('-n', '--lines', type=int, default=200000)
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('--results', default="benchmark.db", help="database the stages benchmark records its results in, to compare against earlier versions")
+    parser.add_argument('--generate', help="write a generated server directory with --lines log lines here instead of running benchmarks")
+
+    return parser
+
+def main(args=None, namespace=None):
+    parser = create_parser()
+    args = parser.parse_args(args=args, namespace=namespace)
+
+    if args.generate:
+        scale = make_server(pathlib.Path(args.generate), lines=args.lines)
+        print(f"Generated {args.generate}: {args.lines} log lines over {scale['days']} days, {scale['crash_reports']} crash reports, {scale['regions']} regions and {scale['players']} players")
+        return
+
+    for name in args.benchmark or benchmarks:
+        if name == "stages":
+            benchmark_stages(count=args.lines, repeat=args.repeat, results=args.results)
+        else:
+            benchmarks[name](count=args.lines, repeat=args.repeat)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+import sqlite3, pathlib, datetime, argparse, json, os, shutil
+from typing import Union, Text, Iterable, Any, Dict, List, Tuple, Optional
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Exports event tables column by column, so analytics read arrays instead of fetching rows from SQLite
+
+DEFAULT_CHUNK_SIZE = 100000
+FORMATS = ("auto", "parquet", "numpy")
+MANIFEST_NAME = "_manifest.json"
+
+# Columns the --since and --until range applies to, the first one a table has is used
+DATETIME_COLUMNS = ("log_datetime", "login_time")
+
+def table_exists(con: sqlite3.Connection, name: str) -> bool:
+    return con.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone() is not None
+
+def default_tables(con: sqlite3.Connection) -> List[str]:
+    # The log event tables, or their views in a --compact database, and the sessions built from them
+    tables = [name for (name,) in con.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND name LIKE 'MINECRAFT\\_SERVER\\_LOGS\\_%' ESCAPE '\\' AND name NOT LIKE '%\\_COMPACT' ESCAPE '\\' ORDER BY name")]
+    if table_exists(con, "MINECRAFT_SERVER_SESSIONS"):
+        tables.append("MINECRAFT_SERVER_SESSIONS")
+    return tables
+
+# Kinds a column can be widened to, narrowest first
+WIDER_KINDS = {"int": ("int", "float", "str"), "float": ("float", "str"), "timestamp": ("timestamp", "str"), "str": ("str",)}
+
+def column_storage(con: sqlite3.Connection, table: str, columns: List[str], where: str = "1", parameters: Iterable[Any] = ()) -> Dict[str, set]:
+    '''
+    The storage classes typeof() finds in each column, in one pass over the rows matching where
+    '''
+    if not columns:
+        return dict()
+    row = con.execute(f"SELECT {', '.join(f'group_concat(DISTINCT typeof({column}))' for column in columns)} FROM {table} WHERE {where}", tuple(parameters)).fetchone()
+    return {column: set(classes.split(",")) - {"null"} if classes else set() for column, classes in zip(columns, row)}
+
+def column_kind(declared: str, values: Iterable[Any], storage: Optional[set] = None) -> str:
+    '''
+    Picks int, float, timestamp or str for a column from its declared type. An untyped column is picked from the
+    storage classes of all its rows, so a float in a later chunk widens it, or else from the values of its first chunk.
+    '''
+    declared = declared.upper()
+    if "INT" in declared:
+        return "int"
+    if any(name in declared for name in ("REAL", "FLOA", "DOUB")):
+        return "float"
+    if "TIMESTAMP" in declared:
+        return "timestamp"
+    if declared:
+        return "str"
+
+    kinds = {type(value) for value in values if value is not None}
+    if kinds and kinds <= {datetime.datetime}:
+        return "timestamp"
+    if storage is None:
+        storage = {"integer" if kind is int else "real" if kind is float else "text" for kind in kinds}
+    if storage and storage <= {"integer"}:
+        return "int"
+    if storage and storage <= {"integer", "real"}:
+        return "float"
+    return "str"
+
+def select_format(name: str) -> str:
+    if name == "auto":
+        name = "parquet" if pyarrow is not None else "numpy"
+    if name == "parquet" and pyarrow is None:
+        raise SystemExit("--format parquet needs pyarrow, install it or use --format numpy")
+    if name == "numpy" and numpy is None:
+        raise SystemExit("exporting needs pyarrow or numpy, install one of them")
+    return name
+
+class ParquetPart:
+    '''
+    Writes the rows of one source to a single zstd compressed Parquet file, a row group per chunk
+    '''
+    types = {
+        "int": lambda: pyarrow.int64(),
+        "float": lambda: pyarrow.float64(),
+        "timestamp": lambda: pyarrow.timestamp("us"),
+        "str": lambda: pyarrow.string(),
+    }
+
+    def __init__(self, path: pathlib.Path, kinds: Dict[str, str], compress: bool = True):
+        self.path = path.with_name(f"{path.name}.parquet")
+        self.kinds = kinds
+        self.schema = pyarrow.schema([(column, self.types[kind]()) for column, kind in kinds.items()])
+        self.writer = pyarrow.parquet.ParquetWriter(self.path, self.schema, compression="zstd")
+
+    def write(self, columns: Dict[str, List[Any]]):
+        arrays = list()
+        for column, kind in self.kinds.items():
+            values = columns[column]
+            if kind == "str":
+                values = [value if value is None else str(value) for value in values]
+            arrays.append(pyarrow.array(values, type=self.schema.field(column).type))
+        self.writer.write_table(pyarrow.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self) -> pathlib.Path:
+        self.writer.close()
+        return self.path
+
+class NumpyPart:
+    '''
+    Writes the rows of one source to a directory of chunks.
+
+    Each chunk is a directory with a .npy file per column, which can be opened with numpy.load(mmap_mode="r"),
+    or with compress a single compressed .npz. Strings are fixed width, NULL numbers are NaN and NULL timestamps NaT.
+    '''
+    def __init__(self, path: pathlib.Path, kinds: Dict[str, str], compress: bool = False):
+        self.path = path
+        self.kinds = kinds
+        self.compress = compress
+        self.parts = 0
+        path.mkdir(parents=True)
+
+    def array(self, values: List[Any], kind: str) -> "numpy.ndarray":
+        if kind == "timestamp":
+            return numpy.array(values, dtype="datetime64[us]")
+        if kind in ("int", "float"):
+            if kind == "int" and None not in values:
+                return numpy.array(values, dtype=numpy.int64)
+            return numpy.array([numpy.nan if value is None else value for value in values], dtype=numpy.float64)
+        return numpy.array(["" if value is None else str(value) for value in values], dtype=str)
+
+    def write(self, columns: Dict[str, List[Any]]):
+        arrays = {column: self.array(columns[column], kind) for column, kind in self.kinds.items()}
+        name = f"part-{self.parts:05d}"
+        self.parts += 1
+        if self.compress:
+            numpy.savez_compressed(self.path / f"{name}.npz", **arrays)
+            return
+        part_path = self.path / name
+        part_path.mkdir()
+        for column, array in arrays.items():
+            numpy.save(part_path / f"{column}.npy", array)
+
+    def close(self) -> pathlib.Path:
+        return self.path
+
+part_formats = {
+    "parquet": ParquetPart,
+    "numpy": NumpyPart,
+}
+
+def remove_path(path: pathlib.Path):
+    if path.is_dir():
+        shutil.rmtree(path)
+    elif path.exists():
+        path.unlink()
+
+def export_source(con: sqlite3.Connection, table: str, table_path: pathlib.Path, source_id: int, export_format: str, kinds: Optional[Dict[str, str]], chunk_size: int = DEFAULT_CHUNK_SIZE, since: Optional[datetime.datetime] = None, until: Optional[datetime.datetime] = None, compress: bool = False) -> Tuple[Optional[str], int, Optional[Dict[str, str]]]:
+    '''
+    Streams one source of a table to a new part in chunks of chunk_size rows. Returns its file name, the rows written and the column kinds.
+    '''
+    info = con.execute(f"PRAGMA table_info({table})").fetchall()
+    columns = [row[1] for row in info]
+    declared = {row[1]: row[2] for row in info}
+    # Views of the compact schema already expose the rowid, that SESSIONS reference events by
+    selects = columns if "rowid" in columns else ["rowid", *columns]
+    if "rowid" not in columns:
+        declared["rowid"] = "INTEGER"
+
+    where, parameters = ["source_id = ?"], [source_id]
+    datetime_column = next((column for column in DATETIME_COLUMNS if column in columns), None)
+    if datetime_column is not None and since is not None:
+        where.append(f"{datetime_column} >= ?")
+        parameters.append(since)
+    if datetime_column is not None and until is not None:
+        where.append(f"{datetime_column} < ?")
+        parameters.append(until)
+
+    cur = con.execute(f"SELECT {', '.join(selects)} FROM {table} WHERE {' AND '.join(where)} ORDER BY rowid", parameters)
+
+    # Written under a temporary name and renamed once complete, so an interrupted export is started again
+    name = f"source_id={source_id}"
+    temporary_path = table_path / f".{name}.tmp"
+    remove_path(temporary_path)
+    remove_path(temporary_path.with_name(f"{temporary_path.name}.parquet"))
+
+    part = None
+    rows = 0
+    try:
+        while True:
+            chunk = cur.fetchmany(chunk_size)
+            if not chunk:
+                break
+            values = dict(zip(selects, map(list, zip(*chunk))))
+            if part is None:
+                untyped = [column for column in selects if not declared[column]]
+                if kinds is None:
+                    # Every source of the table, so the parts exported now agree
+                    storage = column_storage(con=con, table=table, columns=untyped)
+                    kinds = {column: column_kind(declared[column], values[column], storage.get(column)) for column in selects}
+                else:
+                    # An appended source has to fit the kinds of the parts already exported
+                    storage = column_storage(con=con, table=table, columns=untyped, where=" AND ".join(where), parameters=parameters)
+                    for column in untyped:
+                        kind = column_kind(declared[column], values[column], storage[column])
+                        if kind not in WIDER_KINDS[kinds[column]] or kind == kinds[column]:
+                            continue
+                        raise SystemExit(f"{table}.{column} of source {source_id} holds {kind} values, but was exported as {kinds[column]}, export it again without --append")
+                part = part_formats[export_format](temporary_path, kinds, compress)
+            part.write(values)
+            rows += len(chunk)
+    finally:
+        if part is not None:
+            written = part.close()
+
+    if part is None:
+        return None, 0, kinds
+
+    file_name = name + written.name[len(temporary_path.name):]
+    os.replace(written, table_path / file_name)
+    return file_name, rows, kinds
+
+def export_table(con: sqlite3.Connection, table: str, output_path: pathlib.Path, export_format: str, append: bool = False, chunk_size: int = DEFAULT_CHUNK_SIZE, since: Optional[datetime.datetime] = None, until: Optional[datetime.datetime] = None, compress: bool = False) -> int:
+    '''
+    Exports a table to output_path/table, a part per source_id listed in its manifest. Returns the rows written.
+
+    With append, only sources missing from the manifest are exported, as long as the format and range are the same
+    and their values fit the column types of the manifest.
+    '''
+    table_path = output_path / table
+    manifest_path = table_path / MANIFEST_NAME
+    settings = {
+        "format": export_format,
+        "compress": compress,
+        "since": since.isoformat() if since is not None else None,
+        "until": until.isoformat() if until is not None else None,
+    }
+
+    manifest = None
+    if append and manifest_path.exists():
+        manifest = json.loads(manifest_path.read_text())
+        if manifest["settings"] != settings:
+            raise SystemExit(f"{table} was exported with {manifest['settings']}, export it again without --append to change them")
+    if manifest is None:
+        remove_path(table_path)
+        manifest = {"settings": settings, "columns": None, "sources": dict()}
+    table_path.mkdir(parents=True, exist_ok=True)
+
+    rows = 0
+    for (source_id,) in con.execute("SELECT rowid FROM MINECRAFT_SERVER_SOURCE ORDER BY rowid").fetchall():
+        if str(source_id) in manifest["sources"]:
+            continue
+        file_name, source_rows, kinds = export_source(con=con, table=table, table_path=table_path, source_id=source_id, export_format=export_format, kinds=manifest["columns"], chunk_size=chunk_size, since=since, until=until, compress=compress)
+        # Every part of a table keeps the column types picked over the whole table when it was first exported
+        manifest["columns"] = kinds
+        manifest["sources"][str(source_id)] = {"path": file_name, "rows": source_rows}
+        rows += source_rows
+
+        # Saved after every source, so an interrupted export is resumed with --append
+        temporary_path = manifest_path.with_name(f".{MANIFEST_NAME}.tmp")
+        temporary_path.write_text(json.dumps(manifest, indent=1))
+        os.replace(temporary_path, manifest_path)
+
+    return rows
+
+def export_tables(database: Union[bytes, Text], output_path: pathlib.Path, tables: Optional[List[str]] = None, export_format: str = "auto", append: bool = False, chunk_size: int = DEFAULT_CHUNK_SIZE, since: Optional[datetime.datetime] = None, until: Optional[datetime.datetime] = None, compress: bool = False):
+    export_format = select_format(export_format)
+
+    with sqlite3.connect(database=database, detect_types=sqlite3.PARSE_DECLTYPES) as con:
+        if not table_exists(con, "MINECRAFT_SERVER_SOURCE"):
+            raise SystemExit(f"{database} has nothing to export, run utils.py on it first")
+        for table in tables or default_tables(con):
+            if not table_exists(con, table):
+                raise SystemExit(f"{database} has no table {table}")
+            print(f"Exporting {table}")
+            rows = export_table(con=con, table=table, output_path=output_path, export_format=export_format, append=append, chunk_size=chunk_size, since=since, until=until, compress=compress)
+            print(f"Exported {rows} rows to {output_path / table}")
+
+def parse_tables(value: str) -> List[str]:
+    return [table.strip() for table in value.split(",") if table.strip()]
+
+def create_parser():
+    parser = argparse.ArgumentParser(
+        prog='MinecraftExport',
+    )
+
+    parser.add_argument('-i', '--input', default="results.db", help="database written by utils.py")
+    parser.add_argument('-o', '--output', default="export", help="directory a directory per table is written to")
+    parser.add_argument('-t', '--tables', type=parse_tables, help="comma separated tables to export, defaults to the log event tables and MINECRAFT_SERVER_SESSIONS")
+    parser.add_argument('--format', choices=FORMATS, default="auto", help="Parquet with pyarrow, or .npy files with numpy, auto picks the first one installed")
+    parser.add_argument('--since', type=datetime.datetime.fromisoformat, help="only export events logged at or after this time")
+    parser.add_argument('--until', type=datetime.datetime.fromisoformat, help="only export events logged before this time")
+    parser.add_argument('--append', action='store_true', help="only export the sources missing from a previous export")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="rows fetched and written at a time")
+    parser.add_argument('--compress', action='store_true', help="compress numpy chunks into .npz files, which can not be memory mapped")
+
+    return parser
+
+def main(args=None, namespace=None):
+    parser = create_parser()
+    args = parser.parse_args(args=args, namespace=namespace)
+
+    export_tables(
+        database=args.input,
+        output_path=pathlib.Path(args.output),
+        tables=args.tables,
+        export_format=args.format,
+        append=args.append,
+        chunk_size=args.chunk_size,
+        since=args.since,
+        until=args.until,
+        compress=args.compress,
+    )
+
+if __name__ == "__main__":
+    main()
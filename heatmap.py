@@ -0,0 +1,206 @@
+import sqlite3, pathlib, argparse, itertools, struct, zlib, time
+from typing import Union, Text, Tuple, Optional
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Bins where players were seen into chunks and regions with array operations, rather than a coordinate object per point
+
+# Tables with block coordinates of players, and the columns holding them. The moved too quickly
+# events are left out, their x, y and z are how far the player moved rather than where they were.
+POSITION_TABLES = {
+    "MINECRAFT_SERVER_LOGS_LOGGED_IN": ("x", "z"),
+    "MINECRAFT_SERVER_CRASH_REPORTS_PLAYER_DETAILS": ("x", "z"),
+}
+
+# The widest image written, larger worlds are drawn with a pixel per square of chunks
+MAX_IMAGE_SIZE = 1024
+
+HEATMAP_CHUNKS_CREATE_SQL = "CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_HEATMAP_CHUNKS(source_id INTEGER, chunk_x INTEGER, chunk_z INTEGER, region_x INTEGER, region_z INTEGER, points INTEGER, PRIMARY KEY(source_id, chunk_x, chunk_z))"
+HEATMAP_REGIONS_CREATE_SQL = "CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_HEATMAP_REGIONS(source_id INTEGER, region_x INTEGER, region_z INTEGER, points INTEGER, PRIMARY KEY(source_id, region_x, region_z))"
+
+def table_exists(con: sqlite3.Connection, name: str) -> bool:
+    return con.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone() is not None
+
+def block_to_chunk(blocks: "numpy.ndarray") -> "numpy.ndarray":
+    '''
+    The chunk of each block coordinate, the inverse of ChunkCoordinate.getMinBlock for fractional and negative blocks
+    '''
+    return numpy.floor(blocks).astype(numpy.int64) >> 4
+
+def chunk_to_region(chunks: "numpy.ndarray") -> "numpy.ndarray":
+    '''
+    The region of each chunk coordinate, the inverse of RegionCoordinate.getMinChunk
+    '''
+    return chunks >> 5
+
+def load_positions(con: sqlite3.Connection, source_id: int) -> Tuple["numpy.ndarray", "numpy.ndarray"]:
+    '''
+    Loads the x and z of every recorded position of a source into two float arrays
+    '''
+    batches = list()
+    for table, (x, z) in POSITION_TABLES.items():
+        if not table_exists(con, table):
+            continue
+        # Coordinates are text unless the log tables are --compact
+        cur = con.execute(f"SELECT CAST({x} AS REAL), CAST({z} AS REAL) FROM {table} WHERE source_id = ? AND {x} IS NOT NULL AND {z} IS NOT NULL", (source_id,))
+        batches.append(numpy.fromiter(itertools.chain.from_iterable(cur), dtype=numpy.float64))
+    points = numpy.concatenate(batches) if batches else numpy.empty(0, dtype=numpy.float64)
+    points = points.reshape(-1, 2)
+    return points[:, 0], points[:, 1]
+
+def bin_positions(x: "numpy.ndarray", z: "numpy.ndarray") -> Tuple[Tuple["numpy.ndarray", "numpy.ndarray", "numpy.ndarray"], Tuple["numpy.ndarray", "numpy.ndarray", "numpy.ndarray"]]:
+    '''
+    Counts the points in each chunk in one pass over them, then the chunks in each region.
+
+    Returns (chunk_x, chunk_z, points) and (region_x, region_z, points), with only the chunks and regions that have points.
+    '''
+    chunk_x, chunk_z = block_to_chunk(x), block_to_chunk(z)
+    if not len(chunk_x):
+        empty = numpy.empty(0, dtype=numpy.int64)
+        return (empty, empty, empty), (empty, empty, empty)
+
+    # Each chunk as one integer, so they are counted with a single sort instead of per point
+    min_x, min_z = chunk_x.min(), chunk_z.min()
+    span_z = int(chunk_z.max() - min_z) + 1
+    keys, points = numpy.unique((chunk_x - min_x) * span_z + (chunk_z - min_z), return_counts=True)
+    chunk_x, chunk_z = keys // span_z + min_x, keys % span_z + min_z
+
+    region_x, region_z = chunk_to_region(chunk_x), chunk_to_region(chunk_z)
+    region_min_x, region_min_z = region_x.min(), region_z.min()
+    region_span_z = int(region_z.max() - region_min_z) + 1
+    region_keys, inverse = numpy.unique((region_x - region_min_x) * region_span_z + (region_z - region_min_z), return_inverse=True)
+    region_points = numpy.bincount(inverse, weights=points).astype(numpy.int64)
+    regions = (region_keys // region_span_z + region_min_x, region_keys % region_span_z + region_min_z, region_points)
+
+    return (chunk_x, chunk_z, points), regions
+
+def write_heatmap(con: sqlite3.Connection, source_id: int) -> int:
+    '''
+    Replaces the heatmap rows of a source, returning how many points were binned
+    '''
+    x, z = load_positions(con, source_id)
+    (chunk_x, chunk_z, points), (region_x, region_z, region_points) = bin_positions(x, z)
+
+    con.execute("DELETE FROM MINECRAFT_SERVER_HEATMAP_CHUNKS WHERE source_id = ?", (source_id,))
+    con.execute("DELETE FROM MINECRAFT_SERVER_HEATMAP_REGIONS WHERE source_id = ?", (source_id,))
+    con.executemany(
+        "INSERT INTO MINECRAFT_SERVER_HEATMAP_CHUNKS VALUES(?, ?, ?, ?, ?, ?)",
+        zip(itertools.repeat(source_id), chunk_x.tolist(), chunk_z.tolist(), chunk_to_region(chunk_x).tolist(), chunk_to_region(chunk_z).tolist(), points.tolist()),
+    )
+    con.executemany(
+        "INSERT INTO MINECRAFT_SERVER_HEATMAP_REGIONS VALUES(?, ?, ?, ?)",
+        zip(itertools.repeat(source_id), region_x.tolist(), region_z.tolist(), region_points.tolist()),
+    )
+    con.commit()
+    return len(x)
+
+def heat_colors(values: "numpy.ndarray") -> "numpy.ndarray":
+    '''
+    Maps counts to RGB on a log scale, from black through red and yellow to white
+    '''
+    scale = numpy.log1p(values.astype(numpy.float64))
+    if scale.size and scale.max() > 0:
+        scale /= scale.max()
+    red = numpy.clip(scale * 3, 0, 1)
+    green = numpy.clip(scale * 3 - 1, 0, 1)
+    blue = numpy.clip(scale * 3 - 2, 0, 1)
+    return (numpy.stack([red, green, blue], axis=-1) * 255).astype(numpy.uint8)
+
+def write_png(path: pathlib.Path, pixels: "numpy.ndarray"):
+    '''
+    Writes an RGB image, one row of pixels per z, without an imaging library
+    '''
+    height, width, _ = pixels.shape
+    # Every scanline starts with filter type 0
+    raw = numpy.hstack([numpy.zeros((height, 1), dtype=numpy.uint8), pixels.reshape(height, width * 3)]).tobytes()
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    temporary_path = path.with_name(f".{path.name}.tmp")
+    temporary_path.write_bytes(
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(raw, 6))
+        + chunk(b"IEND", b"")
+    )
+    temporary_path.replace(path)
+
+def write_image(con: sqlite3.Connection, path: pathlib.Path, sources: str = "latest") -> Optional[Tuple[int, int, int]]:
+    '''
+    Draws the chunk heatmap of the sources, north up. Returns the chunk at the top left and the chunks per pixel.
+    '''
+    if sources == "all":
+        where, parameters = "1", ()
+    else:
+        where, parameters = "source_id = (SELECT MAX(source_id) FROM MINECRAFT_SERVER_HEATMAP_CHUNKS)", ()
+    rows = con.execute(f"SELECT chunk_x, chunk_z, SUM(points) FROM MINECRAFT_SERVER_HEATMAP_CHUNKS WHERE {where} GROUP BY chunk_x, chunk_z", parameters).fetchall()
+    if not rows:
+        return None
+    chunk_x, chunk_z, points = numpy.array(rows, dtype=numpy.int64).T
+
+    min_x, min_z = int(chunk_x.min()), int(chunk_z.min())
+    width, height = int(chunk_x.max()) - min_x + 1, int(chunk_z.max()) - min_z + 1
+    scale = 1
+    while max(width, height) > MAX_IMAGE_SIZE * scale:
+        scale *= 2
+    width, height = -(-width // scale), -(-height // scale)
+
+    grid = numpy.zeros(height * width, dtype=numpy.int64)
+    numpy.add.at(grid, (chunk_z - min_z) // scale * width + (chunk_x - min_x) // scale, points)
+    write_png(path, heat_colors(grid).reshape(height, width, 3))
+    return min_x, min_z, scale
+
+def generate_heatmap(database: Union[bytes, Text], image_path: Optional[pathlib.Path] = None, sources: str = "latest", force: bool = False):
+    '''
+    Bins the positions of every source that has none yet, and always the latest, which --follow may still add to
+    '''
+    if numpy is None:
+        raise SystemExit("heatmaps need numpy, install it first")
+
+    with sqlite3.connect(database=database) as con:
+        if not table_exists(con, "MINECRAFT_SERVER_SOURCE"):
+            raise SystemExit(f"{database} has no positions, run utils.py on it first")
+        con.execute(HEATMAP_CHUNKS_CREATE_SQL)
+        con.execute(HEATMAP_REGIONS_CREATE_SQL)
+        con.commit()
+
+        source_ids = [source_id for (source_id,) in con.execute("SELECT rowid FROM MINECRAFT_SERVER_SOURCE ORDER BY rowid")]
+        binned = {source_id for (source_id,) in con.execute("SELECT DISTINCT source_id FROM MINECRAFT_SERVER_HEATMAP_REGIONS")}
+        for source_id in source_ids:
+            if source_id in binned and source_id != source_ids[-1] and not force:
+                continue
+            start = time.perf_counter()
+            points = write_heatmap(con, source_id)
+            print(f"Binned {points} positions of source {source_id} in {time.perf_counter() - start:.2f}s")
+
+        if image_path is not None:
+            image_path.parent.mkdir(parents=True, exist_ok=True)
+            drawn = write_image(con, image_path, sources=sources)
+            if drawn is not None:
+                min_x, min_z, scale = drawn
+                print(f"Wrote {image_path}, chunk {min_x}, {min_z} at the top left, {scale}x{scale} chunks per pixel")
+
+def create_parser():
+    parser = argparse.ArgumentParser(
+        prog='MinecraftHeatmap',
+    )
+
+    parser.add_argument('-i', '--input', default="results.db", help="database written by utils.py")
+    parser.add_argument('-o', '--output', default="report/heatmap.png", help="image of the chunk heatmap, shown on the report's heatmap page")
+    parser.add_argument('--sources', choices=["latest", "all"], default="latest", help="draw the latest ingest only, or every source for databases built with --incremental")
+    parser.add_argument('--force', action='store_true', help="bin the positions of every source again")
+
+    return parser
+
+def main(args=None, namespace=None):
+    parser = create_parser()
+    args = parser.parse_args(args=args, namespace=namespace)
+
+    generate_heatmap(database=args.input, image_path=pathlib.Path(args.output), sources=args.sources, force=args.force)
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,79 @@
-import sqlite3, pathlib, datetime
+import sqlite3, pathlib, datetime, argparse, json, os, html, math
+from typing import Union, Text, Iterable, Iterator, Any, Tuple, Optional, TextIO
 
-sessions_select_sql = '''
+# Pages read the playtime rollups maintained by utils.parse_sessions, rather than aggregating every session
+
+login_times_select_sql = '''
 SELECT
-	source_id,
-	MINECRAFT_SERVER_SESSIONS.player, 
-	SUM(MINECRAFT_SERVER_SESSIONS.duration) as duration,
-	MAX(MINECRAFT_SERVER_SESSIONS.left_time) as left_time,
-	MIN(MINECRAFT_SERVER_SESSIONS.login_time) as login_time
+	MINECRAFT_SERVER_PLAYTIME_DAILY.player,
+	SUM(MINECRAFT_SERVER_PLAYTIME_DAILY.duration) as duration,
+	MAX(MINECRAFT_SERVER_PLAYTIME_DAILY.last_left) as left_time,
+	MIN(MINECRAFT_SERVER_PLAYTIME_DAILY.first_login) as login_time
 FROM
-	MINECRAFT_SERVER_SESSIONS
-WHERE source_id = (
-	SELECT MAX(source_id) FROM MINECRAFT_SERVER_SESSIONS
-)
+	MINECRAFT_SERVER_PLAYTIME_DAILY
+WHERE {sources}
 GROUP BY 
-	MINECRAFT_SERVER_SESSIONS.player
+	MINECRAFT_SERVER_PLAYTIME_DAILY.player
 ORDER BY duration DESC
 '''
 
+daily_select_sql = '''
+SELECT
+	MINECRAFT_SERVER_PLAYTIME_DAILY.period,
+	COUNT(DISTINCT MINECRAFT_SERVER_PLAYTIME_DAILY.player) as players,
+	SUM(MINECRAFT_SERVER_PLAYTIME_DAILY.sessions) as sessions,
+	SUM(MINECRAFT_SERVER_PLAYTIME_DAILY.duration) as duration
+FROM
+	MINECRAFT_SERVER_PLAYTIME_DAILY
+WHERE {sources}
+GROUP BY 
+	MINECRAFT_SERVER_PLAYTIME_DAILY.period
+ORDER BY MINECRAFT_SERVER_PLAYTIME_DAILY.period DESC
+'''
+
+weekly_select_sql = '''
+SELECT
+	MINECRAFT_SERVER_PLAYTIME_WEEKLY.period,
+	MINECRAFT_SERVER_PLAYTIME_WEEKLY.player,
+	SUM(MINECRAFT_SERVER_PLAYTIME_WEEKLY.sessions) as sessions,
+	SUM(MINECRAFT_SERVER_PLAYTIME_WEEKLY.duration) as duration
+FROM
+	MINECRAFT_SERVER_PLAYTIME_WEEKLY
+WHERE {sources}
+GROUP BY 
+	MINECRAFT_SERVER_PLAYTIME_WEEKLY.period,
+	MINECRAFT_SERVER_PLAYTIME_WEEKLY.player
+ORDER BY MINECRAFT_SERVER_PLAYTIME_WEEKLY.period DESC, duration DESC
+'''
+
+leaderboards_select_sql = '''
+SELECT
+	MINECRAFT_SERVER_STATS_LEADERBOARD.leaderboard,
+	COALESCE((
+		SELECT MINECRAFT_SERVER_USERCACHE.name FROM MINECRAFT_SERVER_USERCACHE
+		WHERE MINECRAFT_SERVER_USERCACHE.uuid = MINECRAFT_SERVER_STATS_LEADERBOARD.uuid
+		ORDER BY MINECRAFT_SERVER_USERCACHE.source_id DESC LIMIT 1
+	), MINECRAFT_SERVER_STATS_LEADERBOARD.uuid) as player,
+	MINECRAFT_SERVER_STATS_LEADERBOARD.value
+FROM
+	MINECRAFT_SERVER_STATS_LEADERBOARD
+ORDER BY MINECRAFT_SERVER_STATS_LEADERBOARD.leaderboard, MINECRAFT_SERVER_STATS_LEADERBOARD.value DESC
+'''
+
+heatmap_select_sql = '''
+SELECT
+	MINECRAFT_SERVER_HEATMAP_REGIONS.region_x,
+	MINECRAFT_SERVER_HEATMAP_REGIONS.region_z,
+	SUM(MINECRAFT_SERVER_HEATMAP_REGIONS.points) as points
+FROM
+	MINECRAFT_SERVER_HEATMAP_REGIONS
+WHERE {sources}
+GROUP BY 
+	MINECRAFT_SERVER_HEATMAP_REGIONS.region_x,
+	MINECRAFT_SERVER_HEATMAP_REGIONS.region_z
+ORDER BY points DESC
+'''
+
 def format_seconds(total_seconds: float):
     days, remainder = divmod(total_seconds, 86400)
     hours, seconds = divmod(remainder, 3600)
@@ -34,56 +91,214 @@ def format_seconds(total_seconds: float):
 
     return result
 
-def main():
-    database = "results.db"
-    output_path = pathlib.Path("out_report.html")
+def format_hours(total_seconds: float):
+    return f"{total_seconds / 3600:.1f} hours"
+
+def table_exists(con: sqlite3.Connection, name: str) -> bool:
+    return con.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone() is not None
+
+def select_sources(con: sqlite3.Connection, sources: str) -> Tuple[str, Tuple[Any, ...]]:
+    '''
+    Returns the WHERE clause restricting rollups to the reported sources.
+
+    A full ingest records every session again under a new source, so by default only the latest of each server
+    is reported. Databases built with --incremental spread sessions across sources, and are reported with all of them.
+    '''
+    if sources == "all":
+        return "1", ()
+    source_ids = [source_id for (source_id,) in con.execute('''
+        SELECT MAX(daily.source_id)
+        FROM MINECRAFT_SERVER_PLAYTIME_DAILY AS daily
+        JOIN MINECRAFT_SERVER_SOURCE AS source ON source.rowid = daily.source_id
+        GROUP BY source.input_path
+    ''')]
+    return f"source_id IN ({', '.join('?' * len(source_ids))})", tuple(source_ids)
+
+def report_state(con: sqlite3.Connection, sources: str) -> dict:
+    '''
+    Identifies what the pages were generated from: the latest source, whether or not it added sessions, the last
+    session so --follow counts too, the stats behind the leaderboards, and the heatmap
+    '''
+    (source_id,) = con.execute("SELECT MAX(rowid) FROM MINECRAFT_SERVER_SOURCE").fetchone()
+    (session_id,) = con.execute("SELECT MAX(rowid) FROM MINECRAFT_SERVER_SESSIONS").fetchone()
+    stats = dict()
+    for table in ("MINECRAFT_SERVER_STATS", "MINECRAFT_SERVER_STATS_LEADERBOARD", "MINECRAFT_SERVER_USERCACHE"):
+        if table_exists(con, table):
+            # Replaced rows get new rowids, so changed values are caught even when the count stays the same
+            stats[table] = list(con.execute(f"SELECT COUNT(*), MAX(rowid) FROM {table}").fetchone())
+    heatmap = None
+    if table_exists(con, "MINECRAFT_SERVER_HEATMAP_REGIONS"):
+        # A list, as the state read back from JSON is compared with it
+        heatmap = list(con.execute("SELECT COUNT(*), SUM(points) FROM MINECRAFT_SERVER_HEATMAP_REGIONS").fetchone())
+    return {"sources": sources, "source_id": source_id, "session_id": session_id, "stats": stats, "heatmap": heatmap}
+
+def write_header(file: TextIO, title: str):
+    file.write(f'''
+    <!DOCTYPE html>
+    <html lang="en">
+    <head>
+        <meta charset="UTF-8">
+        <title>Minecraft-Utils - {title}</title>
+    </head>
+    <body>
+        <main>
+            <h1>Welcome to Minecraft-Utils</h1>
+            <nav>
+                <a href="index.html">Login Times</a> |
+                <a href="daily.html">Daily Activity</a> |
+                <a href="weekly.html">Weekly Play Time</a> |
+                <a href="leaderboards.html">Leaderboards</a> |
+                <a href="heatmap.html">Heatmap</a>
+            </nav>
+            <h3>{title}</h3>
+    ''')
+
+def write_footer(file: TextIO):
+    file.write('''
+        </main>
+    </body>
+    </html>
+    ''')
+
+def write_table(file: TextIO, headers: Iterable[str], rows: Iterator[Iterable[str]]):
+    '''
+    Writes each row as it is read from the cursor, so no page is held in memory
+    '''
+    file.write("<table border=1 frame=BOX rules=all>\n<tr>")
+    for header in headers:
+        file.write(f"<th>{header}</th>")
+    file.write("</tr>\n")
+    for row in rows:
+        file.write("<tr>")
+        for cell in row:
+            file.write(cell)
+        file.write("</tr>\n")
+    file.write("</table>\n")
+
+def cell(text: Any, title: Optional[Any] = None) -> str:
+    if title is None:
+        return f"<td>{html.escape(str(text))}</td>\n"
+    return f"<td title=\"{html.escape(str(title))}\">{html.escape(str(text))}</td>\n"
+
+def login_times_rows(con: sqlite3.Connection, sources: str) -> Iterator[Iterable[str]]:
+    where, parameters = select_sources(con, sources)
+    for player, duration, left_time, login_time in con.execute(login_times_select_sql.format(sources=where), parameters):
+        duration = float(duration)
+        left_time = datetime.datetime.fromisoformat(left_time)
+        login_time = datetime.datetime.fromisoformat(login_time)
+        seconds_since_first = (left_time - login_time).total_seconds()
+        yield [
+            cell(player),
+            cell(format_seconds(duration), f"{duration} seconds"),
+            cell(f"{login_time:%Y-%m-%d}", login_time),
+            cell(f"{left_time:%Y-%m-%d}", left_time),
+            cell(format_seconds(seconds_since_first), f"{seconds_since_first} seconds"),
+        ]
+
+def daily_rows(con: sqlite3.Connection, sources: str) -> Iterator[Iterable[str]]:
+    where, parameters = select_sources(con, sources)
+    for period, players, sessions, duration in con.execute(daily_select_sql.format(sources=where), parameters):
+        yield [cell(period), cell(players), cell(sessions), cell(format_hours(duration), f"{duration} seconds")]
+
+def weekly_rows(con: sqlite3.Connection, sources: str) -> Iterator[Iterable[str]]:
+    where, parameters = select_sources(con, sources)
+    for period, player, sessions, duration in con.execute(weekly_select_sql.format(sources=where), parameters):
+        yield [cell(period), cell(player), cell(sessions), cell(format_hours(duration), f"{duration} seconds")]
+
+def leaderboard_rows(con: sqlite3.Connection, sources: str, top: int = 10) -> Iterator[Iterable[str]]:
+    if not table_exists(con, "MINECRAFT_SERVER_STATS_LEADERBOARD"):
+        return
+    current, rank = None, 0
+    for leaderboard, player, value in con.execute(leaderboards_select_sql):
+        if leaderboard != current:
+            current, rank = leaderboard, 0
+        rank += 1
+        if rank <= top:
+            yield [cell(leaderboard), cell(rank), cell(player), cell(f"{value:,}", value)]
+
+def heatmap_rows(con: sqlite3.Connection, sources: str, top: int = 100) -> Iterator[Iterable[str]]:
+    '''
+    The regions players were seen in most, binned by heatmap.py, each shaded by its share of the busiest
+    '''
+    if not table_exists(con, "MINECRAFT_SERVER_HEATMAP_REGIONS"):
+        return
+    where, parameters = select_sources(con, sources)
+    busiest = None
+    for region_x, region_z, points in con.execute(f"{heatmap_select_sql.format(sources=where)} LIMIT ?", (*parameters, top)):
+        busiest = busiest or points
+        shade = 255 - int(255 * math.log1p(points) / math.log1p(busiest))
+        blocks = f"{region_x << 9}, {region_z << 9} to {(region_x + 1 << 9) - 1}, {(region_z + 1 << 9) - 1}"
+        yield [cell(f"r.{region_x}.{region_z}.mca"), cell(blocks), f'<td style="background: rgb(255, {shade}, {shade})">{points:,}</td>\n']
+
+def heatmap_image(output_path: pathlib.Path) -> str:
+    if not (output_path / "heatmap.png").exists():
+        return "<p>Run heatmap.py to bin where players were seen.</p>\n"
+    return '<p><img src="heatmap.png" alt="Chunks players were seen in, north up"></p>\n'
+
+pages = {
+    "index.html": ("Login Times", ["Player", "Total Play Time", "First Login", "Last Login", "Days Since First Login"], login_times_rows),
+    "daily.html": ("Daily Activity", ["Day", "Players", "Sessions", "Play Time"], daily_rows),
+    "weekly.html": ("Weekly Play Time", ["Week Starting", "Player", "Sessions", "Play Time"], weekly_rows),
+    "leaderboards.html": ("Leaderboards", ["Leaderboard", "Rank", "Player", "Value"], leaderboard_rows),
+    "heatmap.html": ("Heatmap", ["Region", "Blocks", "Positions"], heatmap_rows),
+}
+
+# Written above the table of a page
+page_intros = {
+    "heatmap.html": heatmap_image,
+}
+
+def write_page(con: sqlite3.Connection, path: pathlib.Path, title: str, headers: Iterable[str], rows: Iterator[Iterable[str]], intro: str = ""):
+    # Written next to the page and renamed over it, so a page being published is never half written
+    temporary_path = path.with_name(f".{path.name}.tmp")
+    with temporary_path.open("w") as file:
+        write_header(file, title)
+        file.write(intro)
+        write_table(file, headers, rows)
+        write_footer(file)
+    os.replace(temporary_path, path)
+
+def generate_report(database: Union[bytes, Text], output_path: pathlib.Path, sources: str = "latest", force: bool = False) -> bool:
+    '''
+    Writes every page to output_path, unless they were already generated from the same data. Returns whether they were written.
+    '''
+    output_path.mkdir(parents=True, exist_ok=True)
+    state_path = output_path / ".report-state.json"
 
     with sqlite3.connect(database=database) as con:
-        cur = con.cursor()
-        result = cur.execute(sessions_select_sql)
-
-        with output_path.open("w") as file:
-            file.write('''
-            <!DOCTYPE html>
-            <html lang="en">
-            <head>
-                <meta charset="UTF-8">
-                <title>Minecraft-Utils</title>
-            </head>
-            <body>
-                <main>
-                    <h1>Welcome to Minecraft-Utils</h1>
-                    <h3>Login Times</h3>
-                    <table border=1 frame=BOX rules=all>
-                        <tr>
-                            <th>Player</th>
-                            <th>Total Play Time</th>
-                            <th>First Login</th>
-                            <th>Last Login</th>
-                            <th>Days Since First Login</th>
-                        </tr>
-            ''')
-            for row in result:
-                source_id, player, duration, left_time, login_time = row
-                duration = float(duration)
-                left_time = datetime.datetime.fromisoformat(left_time)
-                login_time = datetime.datetime.fromisoformat(login_time)
-                seconds_since_first = (left_time - login_time).total_seconds()
-
-                file.write("<tr>")
-                file.write(f"<td>{player}</td>\n")
-                file.write(f"<td title=\"{duration} seconds\">{format_seconds(duration)}</td>\n")
-                file.write(f"<td title=\"{login_time}\">{login_time:%Y-%m-%d}</td>\n")
-                file.write(f"<td title=\"{left_time}\">{left_time:%Y-%m-%d}</td>\n")
-                file.write(f"<td title=\"{seconds_since_first} seconds\">{format_seconds(seconds_since_first)}</td>\n")
-                file.write("</tr>\n")
-            
-            file.write('''
-                        </table>  
-                    </main>
-                </body>
-            </html>
-            ''')
+        if not table_exists(con, "MINECRAFT_SERVER_PLAYTIME_DAILY"):
+            raise SystemExit(f"{database} has no playtime rollups, run utils.py on it first")
+        state = report_state(con, sources)
+        if not force and state_path.exists() and all((output_path / name).exists() for name in pages):
+            if json.loads(state_path.read_text()) == state:
+                print(f"Report in {output_path} is up to date")
+                return False
+
+        for name, (title, headers, rows) in pages.items():
+            print(f"Writing {output_path / name}")
+            intro = page_intros[name](output_path) if name in page_intros else ""
+            write_page(con, output_path / name, title, headers, rows(con, sources), intro)
+
+    state_path.write_text(json.dumps(state))
+    return True
+
+def create_parser():
+    parser = argparse.ArgumentParser(
+        prog='MinecraftReport',
+    )
+
+    parser.add_argument('-i', '--input', default="results.db", help="database written by utils.py")
+    parser.add_argument('-o', '--output', default="report", help="directory the pages are written to")
+    parser.add_argument('--sources', choices=["latest", "all"], default="latest", help="report the latest ingest of each server only, or every source for databases built with --incremental")
+    parser.add_argument('--force', action='store_true', help="regenerate the pages even if the data has not changed")
+
+    return parser
+
+def main(args=None, namespace=None):
+    parser = create_parser()
+    args = parser.parse_args(args=args, namespace=namespace)
+
+    generate_report(database=args.input, output_path=pathlib.Path(args.output), sources=args.sources, force=args.force)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
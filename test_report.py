@@ -0,0 +1,44 @@
+import contextlib, io, json, pathlib, sqlite3, tempfile, unittest
+
+import heatmap, report, utils
+
+LOG = '''[01Mar2023 10:00:00.000] [Server thread/INFO] [net.minecraft.server.MinecraftServer/]: Steve[/127.0.0.1:5000] logged in with entity id 1 at (10.5, 64.0, -20.5)
+[01Mar2023 11:00:00.000] [Server thread/INFO] [net.minecraft.server.MinecraftServer/]: Steve left the game
+'''
+
+def write_server(path: pathlib.Path):
+    for directory in ["logs", "crash-reports", "world/region", "world/stats"]:
+        (path / directory).mkdir(parents=True)
+    (path / "logs/latest.log").write_text(LOG)
+    (path / "ops.json").write_text("[]")
+    (path / "whitelist.json").write_text("[]")
+    (path / "usercache.json").write_text(json.dumps([{"uuid": "u1", "name": "Steve", "expiresOn": "2023-04-01 10:00:00 +0000"}]))
+    (path / "server.properties").write_text("level-name=world\n")
+
+class ReportCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = pathlib.Path(directory.name)
+        write_server(self.root / "server")
+        self.database = str(self.root / "results.db")
+        with contextlib.redirect_stdout(io.StringIO()):
+            utils.main(["-i", str(self.root / "server"), "-o", self.database])
+
+    def generate(self) -> str:
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            report.generate_report(database=self.database, output_path=self.root / "report")
+        return output.getvalue()
+
+    def test_second_run_is_up_to_date_with_heatmap(self):
+        # The rows heatmap.py writes, without needing numpy to bin them
+        with sqlite3.connect(self.database) as con:
+            con.execute(heatmap.HEATMAP_REGIONS_CREATE_SQL)
+            con.execute("INSERT INTO MINECRAFT_SERVER_HEATMAP_REGIONS VALUES(1, 0, -1, 1)")
+
+        self.assertIn("Writing", self.generate())
+        self.assertIn("up to date", self.generate())
+
+if __name__ == "__main__":
+    unittest.main()
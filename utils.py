@@ -2,10 +2,311 @@
 This is where the module documentation goes 
 '''
 
-import pathlib, gzip, datetime, json, re, argparse, sqlite3, hashlib
-from io import TextIOWrapper
-from typing import Union, Text, AnyStr, Optional, Match, Iterable, Any
+import pathlib, gzip, datetime, json, re, argparse, sqlite3, hashlib, itertools, time, collections, io, os, sys, threading, mmap, struct, zlib, math, heapq, contextlib, functools, importlib, types
+# multiprocessing, profiling and the optional decoders are imported by the stages that use them, to keep startup fast.
+# concurrent.futures is light, and its Future is in the signatures.
+import concurrent.futures
+from concurrent.futures import Future
+from io import BufferedIOBase
+from typing import Union, Text, AnyStr, Optional, Match, Pattern, Iterable, Iterator, Any, Dict, List, Tuple, Callable
 from dataclasses import dataclass
+import dataclasses
+
+@functools.lru_cache(maxsize=None)
+def optional_module(name: str) -> Optional[types.ModuleType]:
+    '''
+    Imports an optional dependency the first time it is needed, None when it is not installed
+    '''
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+@functools.lru_cache(maxsize=None)
+def compiled(pattern: str) -> Pattern[str]:
+    '''
+    Compiles a pattern the first time a stage uses it rather than on import
+    '''
+    return re.compile(pattern)
+
+DEFAULT_BATCH_SIZE = 10000
+DEFAULT_COMMIT_INTERVAL = 100000
+DEFAULT_READ_BUFFER_SIZE = 1 << 20
+LOG_ENCODING = "utf-8"
+DIGESTS = ("md5", "sha1", "blake2b")
+DEFAULT_DIGESTS = ("md5", "sha1")
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+TEMP_STORES = ("DEFAULT", "FILE", "MEMORY")
+DEFAULT_CACHE_SIZE = 65536
+DEFAULT_MMAP_SIZE = 1 << 28
+LOG_ENGINES = ("text", "mmap")
+DEFAULT_STAGE_THREADS = 1
+# Seconds a stage waits for the others to commit, a large log is written in one transaction
+BUSY_TIMEOUT = 3600.0
+
+@dataclass
+class IngestOptions:
+    batch_size: int = DEFAULT_BATCH_SIZE
+    commit_interval: int = DEFAULT_COMMIT_INTERVAL
+    incremental: bool = False
+    jobs: int = 1
+    read_buffer_size: int = DEFAULT_READ_BUFFER_SIZE
+    digests: Tuple[str, ...] = DEFAULT_DIGESTS
+    chunk_stats: bool = False
+    compact: bool = False
+    raw_lines: bool = False
+    metrics: Optional["RunMetrics"] = None
+    synchronous: str = "NORMAL"
+    # KiB of page cache
+    cache_size: int = DEFAULT_CACHE_SIZE
+    mmap_size: int = DEFAULT_MMAP_SIZE
+    temp_store: str = "MEMORY"
+    log_engine: str = "mmap"
+    # Stages run at once when they do not depend on each other
+    stage_threads: int = DEFAULT_STAGE_THREADS
+    # The output database regions are compared against, when ingesting into a staging database that is merged into it
+    compared_database: Optional[str] = None
+    session: Optional["IngestSession"] = None
+
+@dataclass
+class Metrics:
+    stage: str
+    path: Optional[str] = None
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    bytes_read: int = 0
+    lines: int = 0
+    rows: int = 0
+    commits: int = 0
+    matches: Optional[Dict[str, int]] = None
+
+progress_lock = threading.Lock()
+
+def log_progress(message: str):
+    '''
+    Writes a line of progress. Stages run at once share stdout, and print writes the line and its end separately.
+    '''
+    with progress_lock:
+        sys.stdout.write(f"{message}\n")
+        sys.stdout.flush()
+
+def cpu_time() -> float:
+    '''
+    CPU time of this process and of the worker processes it has waited for
+    '''
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+class RunMetrics:
+    '''
+    Collects what each stage, and each file within it, cost while ingesting.
+
+    Rows, commits and matches come from the BatchWriters created during a stage, bytes and lines
+    from what the readers report to them, and stages that insert directly add their rows with count.
+    The wall and CPU time of a stage include the stages run inside it, its rows do not. Stages run at
+    once each keep their own stack of active stages, but share the process, so their CPU time overlaps.
+    '''
+    def __init__(self):
+        self.stages: List[Metrics] = list()
+        self.files: List[Metrics] = list()
+        # The stages active in each thread, innermost last
+        self.threads: Dict[int, List[Tuple[Metrics, List["BatchWriter"]]]] = dict()
+
+    @property
+    def active(self) -> List[Tuple[Metrics, List["BatchWriter"]]]:
+        return self.threads.setdefault(threading.get_ident(), list())
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[Metrics]:
+        metrics = Metrics(stage=name, matches=collections.Counter())
+        writers = list()
+        self.active.append((metrics, writers))
+        start, start_cpu = time.perf_counter(), cpu_time()
+        try:
+            yield metrics
+        finally:
+            metrics.wall_seconds = time.perf_counter() - start
+            metrics.cpu_seconds = cpu_time() - start_cpu
+            self.active.pop()
+            for writer in writers:
+                metrics.bytes_read += writer.bytes_read
+                metrics.lines += writer.lines
+                metrics.rows += writer.inserted
+                metrics.commits += writer.commits
+                metrics.matches.update(writer.matches)
+            self.stages.append(metrics)
+            log_progress(f"Finished {name}: {metrics.rows} rows, {metrics.lines} lines, {metrics.bytes_read / 1048576:.2f} MB, {metrics.commits} commits in {metrics.wall_seconds:.2f}s ({metrics.cpu_seconds:.2f}s CPU)")
+
+    def track(self, writer: "BatchWriter"):
+        if self.active:
+            self.active[-1][1].append(writer)
+
+    def count(self, rows: int = 0, commits: int = 0, bytes_read: int = 0, lines: int = 0):
+        if self.active:
+            metrics = self.active[-1][0]
+            metrics.rows += rows
+            metrics.commits += commits
+            metrics.bytes_read += bytes_read
+            metrics.lines += lines
+
+    def write(self, database: Union[bytes, Text], source_id: int, options: Optional[IngestOptions] = None):
+        # Log events are counted by the parser that matched them, other rows by their table
+        names = {parser.insert_sql: parser.name for parser in parsers}
+        with connect(database, options) as con:
+            for metrics in itertools.chain(self.stages, self.files):
+                matches = dict()
+                for insert_sql, count in (metrics.matches or dict()).items():
+                    name = names.get(insert_sql, insert_sql.split()[2])
+                    matches[name] = matches.get(name, 0) + count
+                con.execute("INSERT INTO MINECRAFT_SERVER_RUN_METRICS VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+                    source_id, # source_id
+                    metrics.stage, # stage
+                    metrics.path, # path, NULL for the stage as a whole
+                    metrics.wall_seconds, # wall_seconds
+                    metrics.cpu_seconds, # cpu_seconds
+                    metrics.bytes_read, # bytes_read
+                    metrics.lines, # lines
+                    metrics.rows, # rows
+                    metrics.commits, # commits
+                    json.dumps(matches, sort_keys=True), # matches
+                ))
+            con.commit()
+
+class BatchWriter:
+    '''
+    Buffers rows per insert statement and writes them with executemany.
+
+    Each file is written inside a savepoint, so a file that fails partway through
+    is rolled back and skipped, while the files before it are still committed.
+    The transaction is only committed at a file boundary, once commit_interval
+    rows have been written.
+    '''
+    def __init__(self, con: sqlite3.Connection, batch_size: int = DEFAULT_BATCH_SIZE, commit_interval: int = DEFAULT_COMMIT_INTERVAL, schema: Optional["CompactSchema"] = None, metrics: Optional[RunMetrics] = None):
+        self.con = con
+        self.batch_size = batch_size
+        self.commit_interval = commit_interval
+        # Rows for tables in the compact schema are converted as they are buffered
+        self.schema = schema
+        self.rows: Dict[str, List[Iterable[Any]]] = dict()
+        self.buffered = 0
+        self.pending = 0
+        self.commits = 0
+
+        # Totals for RunMetrics, matches are counted by the statement a row was inserted with
+        self.metrics = metrics
+        self.inserted = 0
+        self.bytes_read = 0
+        self.lines = 0
+        self.worker_cpu_seconds = 0.0
+        self.matches = collections.Counter()
+        if metrics is not None:
+            metrics.track(self)
+
+    def insert(self, insert_sql: str, parameters: Iterable[Any]):
+        self.matches[insert_sql] += 1
+        self.inserted += 1
+        if self.schema is not None:
+            insert_sql, parameters = self.schema.convert(insert_sql, parameters)
+        rows = self.rows.get(insert_sql)
+        if rows is None:
+            rows = self.rows[insert_sql] = list()
+        rows.append(parameters)
+        self.pending += 1
+        self.buffered += 1
+        # Bound the rows held across all tables, not per table
+        if self.buffered >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        for insert_sql, rows in self.rows.items():
+            if rows:
+                self.con.executemany(insert_sql, rows)
+                rows.clear()
+        self.buffered = 0
+
+    def commit(self):
+        self.flush()
+        self.con.commit()
+        self.pending = 0
+        self.commits += 1
+
+    def discard(self):
+        for rows in self.rows.values():
+            rows.clear()
+        self.buffered = 0
+        if self.schema is not None:
+            # Strings interned since the last savepoint are rolled back with it
+            self.schema.forget()
+
+    def rollback(self):
+        self.discard()
+        self.con.rollback()
+        self.pending = 0
+
+    def read(self, bytes_read: int = 0, lines: int = 0, cpu_seconds: float = 0.0):
+        '''
+        Records what was read for the rows, cpu_seconds being time spent in a worker process
+        '''
+        self.bytes_read += bytes_read
+        self.lines += lines
+        self.worker_cpu_seconds += cpu_seconds
+
+    def file(self, path: Optional[pathlib.Path] = None) -> "BatchFile":
+        return BatchFile(self, path)
+
+class BatchFile:
+    def __init__(self, writer: BatchWriter, path: Optional[pathlib.Path] = None):
+        self.writer = writer
+        # Files with a path are recorded in the writer's RunMetrics
+        self.path = path
+
+    def __enter__(self) -> BatchWriter:
+        writer = self.writer
+        self.pending = writer.pending
+        if self.path is not None and writer.metrics is not None:
+            self.start = (time.perf_counter(), time.process_time(), writer.worker_cpu_seconds, writer.inserted, writer.commits, writer.bytes_read, writer.lines, collections.Counter(writer.matches))
+        if not writer.con.in_transaction:
+            # Stages running at once take turns on the database. A transaction that reads before it writes
+            # cannot wait for its turn, so the write lock is taken up front.
+            writer.con.execute("BEGIN IMMEDIATE")
+        writer.con.execute("SAVEPOINT batch_file")
+        return writer
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        writer = self.writer
+        if exc_type is not None:
+            writer.discard()
+            writer.con.execute("ROLLBACK TO batch_file")
+            writer.con.execute("RELEASE batch_file")
+            writer.pending = self.pending
+            if not issubclass(exc_type, Exception):
+                # KeyboardInterrupt and SystemExit still stop the run
+                return False
+            log_progress(f"Skipped {self.path}, rolled back after {exc_type.__name__}: {exc_value}")
+            return True
+
+        writer.flush()
+        writer.con.execute("RELEASE batch_file")
+        if writer.pending >= writer.commit_interval:
+            writer.commit()
+        if self.path is not None and writer.metrics is not None:
+            self.record()
+        return False
+
+    def record(self):
+        writer = self.writer
+        start, start_cpu, worker_cpu_seconds, inserted, commits, bytes_read, lines, matches = self.start
+        writer.metrics.files.append(Metrics(
+            stage=writer.metrics.active[-1][0].stage if writer.metrics.active else "",
+            path=str(self.path),
+            wall_seconds=time.perf_counter() - start,
+            cpu_seconds=time.process_time() - start_cpu + writer.worker_cpu_seconds - worker_cpu_seconds,
+            bytes_read=writer.bytes_read - bytes_read,
+            lines=writer.lines - lines,
+            rows=writer.inserted - inserted,
+            commits=writer.commits - commits,
+            matches=writer.matches - matches,
+        ))
 
 @dataclass
 class BlockCoordinate:
@@ -52,6 +353,16 @@ class RegionCoordinate:
             z = (self.z + 1 << 5) - 1,
         )
 
+    def getChunk(self, index: int):
+        '''
+        Returns the chunk at an index of the region file header, which is ordered by z then x
+        '''
+        return ChunkCoordinate(
+            x = (self.x << 5) + (index & 31),
+            y = 0,
+            z = (self.z << 5) + (index >> 5),
+        )
+
     def getMinBlock(self):
         coords = self.getMinChunk()
         return coords.getMinBlock()
@@ -60,26 +371,216 @@ class RegionCoordinate:
         coords = self.getMaxChunk()
         return coords.getMaxBlock()
 
+LOG_TIMESTAMP_FORMAT = "%d%b%Y %H:%M:%S.%f"
+CRASH_REPORT_TIMESTAMP_FORMAT = "%Y-%m-%d_%H.%M.%S"
+CRASH_REPORT_NAME_PATTERN = r"\d{4}-\d{2}-\d{2}_\d{2}\.\d{2}\.\d{2}"
+# The Time: line of a report, used when its name has no timestamp, was localized before 1.18
+CRASH_REPORT_TIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%m/%d/%y, %I:%M %p", "%d/%m/%y %H:%M")
+MONTHS = {
+    "Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6,
+    "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12,
+}
+
+def _digits(text: str) -> bool:
+    return text.isascii() and text.isdigit()
+
+class TimestampParser:
+    '''
+    Decodes the fixed width timestamps used in log headers and crash report names.
+
+    Consecutive log lines almost always share a date and usually a second, so the decoded
+    fields of the last second are cached. Anything that is not in the expected layout falls
+    back to datetime.strptime, which keeps the results and errors identical to it.
+    '''
+    def __init__(self):
+        self.cache: Tuple[Optional[str], Tuple[int, ...]] = (None, ())
+        self.date_cache: Tuple[Optional[str], Tuple[int, ...]] = (None, ())
+
+    def parse_log(self, text: str) -> datetime.datetime:
+        # 17Mar2023 12:34:56.789
+        key, fields = self.cache
+        if text[:18] != key:
+            fields = self._log_fields(text)
+            if fields is None:
+                return datetime.datetime.strptime(text, LOG_TIMESTAMP_FORMAT)
+            self.cache = (text[:18], fields)
+
+        fraction = text[19:]
+        if text[18:19] != "." or not 0 < len(fraction) <= 6 or not _digits(fraction):
+            return datetime.datetime.strptime(text, LOG_TIMESTAMP_FORMAT)
+        return datetime.datetime(*fields, int(fraction.ljust(6, "0")))
+
+    def _log_fields(self, text: str) -> Optional[Tuple[int, ...]]:
+        date_key, date = self.date_cache
+        if text[:9] != date_key:
+            month = MONTHS.get(text[2:5])
+            if month is None or not _digits(text[0:2]) or not _digits(text[5:9]):
+                return None
+            date = (int(text[5:9]), month, int(text[0:2]))
+            self.date_cache = (text[:9], date)
+
+        clock = text[10:12], text[13:15], text[16:18]
+        if text[9:10] != " " or text[12:13] != ":" or text[15:16] != ":" or not all(_digits(field) for field in clock):
+            return None
+        fields = (*date, *(int(field) for field in clock))
+        try:
+            datetime.datetime(*fields)
+        except ValueError:
+            return None
+        return fields
+
+    def parse_crash_report(self, name: str) -> Optional[datetime.datetime]:
+        # crash-2023-03-17_12.34.56-server.txt, renamed and copied reports are searched for the timestamp
+        text = name[6:25]
+        fields = text[0:4], text[5:7], text[8:10], text[11:13], text[14:16], text[17:19]
+        if text[4:5] != "-" or text[7:8] != "-" or text[10:11] != "_" or text[13:14] != "." or text[16:17] != "." or not all(_digits(field) for field in fields):
+            match = compiled(CRASH_REPORT_NAME_PATTERN).search(name)
+            if match is None:
+                return None
+            text = match.group()
+            fields = text[0:4], text[5:7], text[8:10], text[11:13], text[14:16], text[17:19]
+        try:
+            return datetime.datetime(*(int(field) for field in fields))
+        except ValueError:
+            return None
+
+def required_literal(pattern: str) -> str:
+    '''
+    Returns the longest run of plain characters that every match of the pattern must contain.
+
+    Only text outside of groups, character classes and optional quantifiers counts, so the
+    result is safe to use as a substring prefilter. An empty string means there is no such run.
+    '''
+    runs = [""]
+    depth = 0
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        literal = None
+        if char == "\\" and index + 1 < len(pattern):
+            escaped = pattern[index + 1]
+            index += 2
+            if not escaped.isalnum():
+                literal = escaped
+        elif char == "[":
+            index += 1
+            if index < len(pattern) and pattern[index] == "^":
+                index += 1
+            if index < len(pattern) and pattern[index] == "]":
+                index += 1
+            while index < len(pattern) and pattern[index] != "]":
+                index += 2 if pattern[index] == "\\" else 1
+            index += 1
+        elif char == "(":
+            depth += 1
+            index += 1
+        elif char == ")":
+            depth -= 1
+            index += 1
+        elif char == "|":
+            if depth == 0:
+                return ""
+            index += 1
+        elif char == "{":
+            end = pattern.find("}", index)
+            index = len(pattern) if end < 0 else end + 1
+        elif char in ".^$*+?}":
+            index += 1
+        else:
+            literal = char
+            index += 1
+
+        if literal is not None and depth == 0:
+            if index < len(pattern) and pattern[index] in "*+?{":
+                if pattern[index] == "+":
+                    runs[-1] += literal
+                runs.append("")
+            else:
+                runs[-1] += literal
+        else:
+            runs.append("")
+
+    return max(runs, key=len)
+
 class LogParser:
-    def __init__(self, name: str, pattern: str, create_sql: str, insert_sql: str):
+    def __init__(self, name: str, pattern: str, create_sql: str, insert_sql: str, literal: Optional[str] = None, positions: bool = False, types: Optional[Dict[str, type]] = None):
         self.name = name
-        self.pattern = re.compile(pattern)
+        # Compiled the first time a line is parsed, so stages that never read a log do not pay for it
+        self.regex = pattern
+        # Captures converted to numbers in the compact schema
+        self.types = types or dict()
         self.create_sql = create_sql
         self.insert_sql = insert_sql
+        self.table = insert_sql.split()[2]
+        # Rows with player, x and z columns are also kept in MINECRAFT_SERVER_POSITIONS_RTREE
+        self.positions = positions
+        if literal is not None:
+            self.literal = literal
+
+    @functools.cached_property
+    def pattern(self) -> Pattern[str]:
+        return re.compile(self.regex)
+
+    @functools.cached_property
+    def groups(self) -> List[str]:
+        return sorted(self.pattern.groupindex, key=self.pattern.groupindex.get)
+
+    @functools.cached_property
+    def literal(self) -> str:
+        return "" if self.pattern.flags & re.IGNORECASE else required_literal(self.regex)
 
     def parse(self, line:AnyStr) -> Optional[Match[AnyStr]]:
         return self.pattern.match(line)
 
     def insert(self, con: sqlite3.Connection, parameters: Iterable[Any]):
-        cur = con.cursor()
         return con.execute(self.insert_sql, parameters)
 
     def create(self, con: sqlite3.Connection):
         cur = con.cursor()
-        return cur.execute(self.create_sql)
-
-class WorldParser:
-    ...
+        cur.execute(self.create_sql)
+        if self.positions:
+            create_position_index(con=con, table=self.table)
+        return cur
+
+class LogDispatcher:
+    '''
+    Runs a line against only the parsers whose required literal occurs in it.
+
+    Most log lines match no parser, so they are rejected after a few substring
+    searches instead of running every regex.
+    '''
+    def __init__(self, parsers: Iterable[LogParser]):
+        self.parsers = list(parsers)
+        self.unfiltered = [parser for parser in self.parsers if not parser.literal]
+        self.literals: Dict[str, List[LogParser]] = dict()
+        for parser in self.parsers:
+            if parser.literal:
+                self.literals.setdefault(parser.literal, list()).append(parser)
+
+        # The same filter for whole files of bytes. A parser without a literal could match any log line, which contains [
+        if self.unfiltered:
+            self.scan_literals = [b"["]
+        else:
+            self.scan_literals = [literal.encode(LOG_ENCODING) for literal in self.literals]
+
+    def dispatch(self, line: str) -> Iterator[Tuple[LogParser, Match[str]]]:
+        candidates = None
+        for literal, literal_parsers in self.literals.items():
+            if literal in line:
+                if candidates is None:
+                    candidates = set()
+                candidates.update(literal_parsers)
+
+        if candidates is None and not self.unfiltered:
+            return
+
+        # Keep the registration order so rows are written in the same order as before
+        for parser in self.parsers:
+            if parser.literal and (candidates is None or parser not in candidates):
+                continue
+            m = parser.parse(line)
+            if m:
+                yield parser, m
 
 parsers = [
     LogParser(
@@ -87,6 +588,8 @@ parsers = [
         pattern='(?P<player>.+)\[\/(?P<ip>\d+\.\d+.\d+.\d+):(?P<port>\d+)\] logged in with entity id (?P<entityid>\d+) at \((?P<x>-?\d+.\d+), (?P<y>-?\d+.\d+), (?P<z>-?\d+.\d+)\)',
         create_sql="CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_LOGS_LOGGED_IN(source_id, file_id, log_path, line, end_line, log_datetime timestamp, level, player, ip, port, entityid, x, y, z)",
         insert_sql="INSERT INTO MINECRAFT_SERVER_LOGS_LOGGED_IN VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        positions=True,
+        types={"port": int, "entityid": int, "x": float, "y": float, "z": float},
     ),
     LogParser(
         name='joined_game',
@@ -117,6 +620,7 @@ parsers = [
         pattern='(?P<player>.+) moved too quickly! (?P<x>-?\d+.\d+),(?P<y>-?\d+.\d+),(?P<z>-?\d+.\d+)',
         create_sql="CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_LOGS_MOVED_TOO_QUICKLY(source_id, file_id, log_path, line, end_line, log_datetime timestamp, level, player, x, y, z)",
         insert_sql="INSERT INTO MINECRAFT_SERVER_LOGS_MOVED_TOO_QUICKLY VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        types={"x": float, "y": float, "z": float},
     ),
     LogParser(
         name="crash_report_saved",
@@ -126,13 +630,130 @@ parsers = [
     ),
 ]
 
-def write_source(database: Union[bytes, Text], input_path: pathlib.Path):
+# Captures interned into MINECRAFT_SERVER_STRINGS in the compact schema
+INTERNED_GROUPS = {"player"}
+
+class CompactSchema:
+    '''
+    Stores the log event tables typed and interned, behind views with the original table names and columns.
+
+    Each LogParser table becomes a {table}_COMPACT table, where the level and player are ids into
+    MINECRAFT_SERVER_STRINGS, the log path is only kept as the file_id, numeric captures are INTEGER or REAL
+    and the raw line is only kept with raw_lines. Queries written against the original tables, such as
+    SESSION_SELECT_SQL, keep working against the views, and are served by covering indexes.
+    '''
+    def __init__(self, con: sqlite3.Connection, raw_lines: bool = False):
+        self.con = con
+        self.raw_lines = raw_lines
+        self.strings: Dict[str, int] = dict()
+        self.parsers: Dict[str, Tuple[str, LogParser]] = dict()
+
+    def create(self, parser: LogParser):
+        table = parser.table
+        compact_table = f"{table}_COMPACT"
+        existing = self.con.execute("SELECT type FROM sqlite_master WHERE name = ?", (table,)).fetchone()
+        if existing is not None and existing[0] != "view":
+            raise ValueError(f"{table} was created without --compact, use a new output database")
+
+        self.con.execute("CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_STRINGS(string_id INTEGER PRIMARY KEY, value TEXT UNIQUE)")
+        create_file_info(self.con)
+
+        columns = ["source_id INTEGER", "file_id INTEGER", "log_datetime timestamp", "level_id INTEGER"]
+        selects = ["data.rowid AS rowid", "data.source_id AS source_id", "data.file_id AS file_id", "file.path AS log_path", "data.line AS line", "data.end_line AS end_line", "data.log_datetime AS log_datetime", "level.value AS level"]
+        joins = ["LEFT JOIN MINECRAFT_SERVER_FILE AS file ON file.rowid = data.file_id", "LEFT JOIN MINECRAFT_SERVER_STRINGS AS level ON level.string_id = data.level_id"]
+        for group in parser.groups:
+            if group in INTERNED_GROUPS:
+                columns.append(f"{group}_id INTEGER")
+                selects.append(f"{group}.value AS {group}")
+                joins.append(f"LEFT JOIN MINECRAFT_SERVER_STRINGS AS {group} ON {group}.string_id = data.{group}_id")
+            else:
+                columns.append(f"{group} {'INTEGER' if parser.types.get(group) is int else 'REAL' if parser.types.get(group) is float else 'TEXT'}")
+                selects.append(f"data.{group} AS {group}")
+        columns += ["line TEXT", "end_line TEXT"]
+
+        self.con.execute(f"CREATE TABLE IF NOT EXISTS {compact_table}({', '.join(columns)})")
+        self.con.execute(f"CREATE VIEW IF NOT EXISTS {table} AS SELECT {', '.join(selects)} FROM {compact_table} AS data {' '.join(joins)}")
+
+        # Covering indexes for SESSION_SELECT_SQL, per player reports and time ranges
+        if "player" in parser.groups:
+            self.con.execute(f"CREATE INDEX IF NOT EXISTS {compact_table}_SOURCE_PLAYER ON {compact_table}(source_id, player_id, log_datetime)")
+            self.con.execute(f"CREATE INDEX IF NOT EXISTS {compact_table}_PLAYER ON {compact_table}(player_id, log_datetime)")
+        else:
+            self.con.execute(f"CREATE INDEX IF NOT EXISTS {compact_table}_SOURCE ON {compact_table}(source_id, log_datetime)")
+        self.con.execute(f"CREATE INDEX IF NOT EXISTS {compact_table}_DATETIME ON {compact_table}(log_datetime)")
+
+        if parser.positions:
+            create_position_index(con=self.con, table=compact_table, player="player_id", interned=True)
+
+        insert_sql = f"INSERT INTO {compact_table} VALUES({', '.join('?' for _ in columns)})"
+        self.parsers[parser.insert_sql] = (insert_sql, parser)
+
+    def intern(self, value: Optional[str]) -> Optional[int]:
+        if value is None:
+            return None
+        string_id = self.strings.get(value)
+        if string_id is None:
+            self.con.execute("INSERT OR IGNORE INTO MINECRAFT_SERVER_STRINGS(value) VALUES(?)", (value,))
+            (string_id,) = self.con.execute("SELECT string_id FROM MINECRAFT_SERVER_STRINGS WHERE value = ?", (value,)).fetchone()
+            self.strings[value] = string_id
+        return string_id
+
+    def forget(self):
+        self.strings.clear()
+
+    def bind(self, con: sqlite3.Connection) -> "CompactSchema":
+        '''
+        The same schema written through another connection, with its own cache of interned strings
+        '''
+        schema = CompactSchema(con=con, raw_lines=self.raw_lines)
+        schema.parsers = self.parsers
+        return schema
+
+    def convert(self, insert_sql: str, parameters: Iterable[Any]) -> Tuple[str, Iterable[Any]]:
+        '''
+        Converts a row for a parser's original table into a row for its compact table
+        '''
+        compact = self.parsers.get(insert_sql)
+        if compact is None:
+            return insert_sql, parameters
+        compact_insert_sql, parser = compact
+
+        source_id, file_id, log_path, line, end_line, log_datetime, level, *groups = parameters
+        row = [source_id, file_id, log_datetime, self.intern(level)]
+        for group, value in zip(parser.groups, groups):
+            if group in INTERNED_GROUPS:
+                value = self.intern(value)
+            elif group in parser.types and value is not None:
+                try:
+                    value = parser.types[group](value)
+                except ValueError:
+                    pass
+            row.append(value)
+        if self.raw_lines:
+            row += [line, end_line]
+        else:
+            row += [None, None]
+        return compact_insert_sql, row
+
+def create_log_tables(con: sqlite3.Connection, options: IngestOptions) -> Optional[CompactSchema]:
+    '''
+    Creates the tables of every parser, returning the compact schema rows have to be converted for if it is used
+    '''
+    if not options.compact:
+        for parser in parsers:
+            parser.create(con)
+        return None
+
+    schema = CompactSchema(con=con, raw_lines=options.raw_lines)
+    for parser in parsers:
+        schema.create(parser)
+    return schema
+
+def write_source(database: Union[bytes, Text], input_path: pathlib.Path, options: Optional[IngestOptions] = None):
     run_date = datetime.datetime.now()
 
-    with sqlite3.connect(database=database) as con:
+    with connect(database, options) as con:
         cur = con.cursor()
-        cur.execute("CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_SOURCE(run_date timestamp, input_path TEXT)")
-        con.commit()
         cur.execute(
             "INSERT INTO MINECRAFT_SERVER_SOURCE VALUES(?, ?)", (
                 run_date,
@@ -143,51 +764,177 @@ def write_source(database: Union[bytes, Text], input_path: pathlib.Path):
 
         return cur.lastrowid
 
-def calculate_hash(path: pathlib.Path, buffer_size: int = 32768):
-    md5 = hashlib.md5()
-    sha1 = hashlib.sha1()
-
-    with path.open("rb") as fp:
-        while True:
-            data = fp.read(buffer_size)
-            if not data:
-                break
-            md5.update(data)
-            sha1.update(data)
-
-    return (md5, sha1)
+class HashingReader(io.RawIOBase):
+    '''
+    Wraps a raw binary stream and feeds every byte read through it to a set of digests,
+    so a file is hashed in the same pass that parses it.
+    '''
+    def __init__(self, raw: io.RawIOBase, algorithms: Iterable[str] = DEFAULT_DIGESTS):
+        self.raw = raw
+        self.hashes = {algorithm: hashlib.new(algorithm) for algorithm in algorithms}
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        count = self.raw.readinto(buffer)
+        if count:
+            with memoryview(buffer) as view:
+                for digest in self.hashes.values():
+                    digest.update(view[:count])
+        return count
+
+    def drain(self, buffer_size: int = 32768):
+        '''
+        Reads the rest of the stream, for when parsing stopped before the end of the file
+        '''
+        buffer = bytearray(buffer_size)
+        while self.readinto(buffer):
+            pass
+
+    def hexdigests(self) -> Dict[str, str]:
+        return {algorithm: digest.hexdigest() for algorithm, digest in self.hashes.items()}
+
+    def close(self):
+        self.raw.close()
+        super().close()
+
+def open_hashed(path: pathlib.Path, algorithms: Iterable[str] = DEFAULT_DIGESTS) -> HashingReader:
+    return HashingReader(raw=path.open('rb', buffering=0), algorithms=algorithms)
+
+def calculate_digests(path: pathlib.Path, algorithms: Iterable[str] = DEFAULT_DIGESTS, buffer_size: int = 32768) -> Dict[str, str]:
+    with open_hashed(path=path, algorithms=algorithms) as reader:
+        reader.drain(buffer_size=buffer_size)
+        return reader.hexdigests()
 
-def write_file_info(database: Union[bytes, Text], path: pathlib.Path, source_id: int, buffer_size: int = 32768):
-    md5, sha1 = calculate_hash(path=path, buffer_size=buffer_size)
+def calculate_hash(path: pathlib.Path, buffer_size: int = 32768):
+    '''
+    Returns the md5 and sha1 hash objects of a file, kept for callers from before calculate_digests
+    '''
+    with open_hashed(path=path, algorithms=("md5", "sha1")) as reader:
+        reader.drain(buffer_size=buffer_size)
+        return (reader.hashes["md5"], reader.hashes["sha1"])
+
+def read_hashed(path: pathlib.Path, algorithms: Iterable[str] = DEFAULT_DIGESTS) -> Tuple[bytes, Dict[str, str]]:
+    '''
+    Reads a small file whole, hashing it in the same read
+    '''
+    with open_hashed(path=path, algorithms=algorithms) as reader:
+        data = reader.readall()
+        return data, reader.hexdigests()
+
+def loads_json(data: bytes) -> Any:
+    # orjson is several times faster at decoding, but optional
+    orjson = optional_module("orjson")
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def ensure_columns(con: sqlite3.Connection, table: str, columns: Dict[str, str]):
+    '''
+    Adds columns missing from a table created by an older version
+    '''
+    existing = {row[1] for row in con.execute(f"PRAGMA table_info({table})")}
+    for name, declaration in columns.items():
+        if name not in existing:
+            con.execute(f"ALTER TABLE {table} ADD COLUMN {name} {declaration}")
+
+def create_file_info(con: sqlite3.Connection):
+    con.execute("CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_FILE(source_id, path TEXT, st_atime REAL, st_ctime REAL, st_mtime REAL, st_size REAL, md5 TEXT, sha1 TEXT, blake2b TEXT)")
+    ensure_columns(con, "MINECRAFT_SERVER_FILE", {"blake2b": "TEXT"})
+    con.execute("CREATE INDEX IF NOT EXISTS MINECRAFT_SERVER_FILE_PATH ON MINECRAFT_SERVER_FILE(path)")
+
+def insert_file_info(con: sqlite3.Connection, path: pathlib.Path, source_id: int, buffer_size: int = 32768, hexdigests: Optional[Dict[str, str]] = None, algorithms: Iterable[str] = DEFAULT_DIGESTS):
+    if hexdigests is None:
+        hexdigests = calculate_digests(path=path, algorithms=algorithms, buffer_size=buffer_size)
     
     # TODO: Split time stats into FILE_INFO_JOIN_SOURCE_INFO
     stat = path.stat()
 
-    with sqlite3.connect(database=database) as con:
-        cur = con.cursor()
-        cur.execute("CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_FILE(source_id, path TEXT, st_atime REAL, st_ctime REAL, st_mtime REAL, st_size REAL, md5 TEXT, sha1 TEXT)")
-        con.commit()
-        cur.execute(
-            "INSERT INTO MINECRAFT_SERVER_FILE VALUES(?, ?, ?, ?, ?, ?, ?, ?)", (
-                source_id,
-                str(path),
-                stat.st_atime,
-                stat.st_ctime, 
-                stat.st_mtime,
-                stat.st_size,
-                md5.hexdigest(),
-                sha1.hexdigest(),
-            )
+    cur = con.cursor()
+    cur.execute(
+        "INSERT INTO MINECRAFT_SERVER_FILE(source_id, path, st_atime, st_ctime, st_mtime, st_size, md5, sha1, blake2b) VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+            source_id,
+            str(path),
+            stat.st_atime,
+            stat.st_ctime, 
+            stat.st_mtime,
+            stat.st_size,
+            hexdigests.get("md5"),
+            hexdigests.get("sha1"),
+            hexdigests.get("blake2b"),
         )
-        con.commit()
+    )
 
-        return cur.lastrowid
+    return cur.lastrowid
+
+def update_file_digests(con: sqlite3.Connection, file_id: int, hexdigests: Dict[str, str]):
+    con.execute(
+        "UPDATE MINECRAFT_SERVER_FILE SET md5 = ?, sha1 = ?, blake2b = ? WHERE rowid = ?", (
+            hexdigests.get("md5"),
+            hexdigests.get("sha1"),
+            hexdigests.get("blake2b"),
+            file_id,
+        )
+    )
 
-def parse_log_line(con: sqlite3.Connection, log_path: pathlib.Path, line: str, source_id: int, file_id: int):
+def find_file_info(con: sqlite3.Connection, path: pathlib.Path) -> Optional[Tuple[int, int, float, float, Dict[str, Optional[str]]]]:
+    '''
+    Returns (file_id, source_id, st_size, st_mtime, hexdigests) of the last time the path was recorded
+    '''
+    row = con.execute(
+        "SELECT rowid, source_id, st_size, st_mtime, md5, sha1, blake2b FROM MINECRAFT_SERVER_FILE WHERE path = ? ORDER BY rowid DESC LIMIT 1",
+        (str(path),),
+    ).fetchone()
+    if row is None:
+        return None
+    return (*row[:4], dict(zip(DIGESTS, row[4:])))
+
+def is_file_unchanged(con: sqlite3.Connection, path: pathlib.Path, buffer_size: int = 32768, algorithms: Iterable[str] = DEFAULT_DIGESTS) -> bool:
+    '''
+    Compares a file to the last time it was recorded, by size and mtime first and by hash only when those differ
+    '''
+    previous = find_file_info(con=con, path=path)
+    if previous is None:
+        return False
+
+    file_id, source_id, st_size, st_mtime, hexdigests = previous
+    stat = path.stat()
+    if stat.st_size != st_size:
+        return False
+    if stat.st_mtime == st_mtime:
+        return True
+
+    # Only digests recorded last time can be compared
+    algorithms = [algorithm for algorithm in algorithms if hexdigests.get(algorithm)]
+    if not algorithms:
+        return False
+    return calculate_digests(path=path, algorithms=algorithms, buffer_size=buffer_size) == {algorithm: hexdigests[algorithm] for algorithm in algorithms}
+
+def write_file_info(database: Union[bytes, Text], path: pathlib.Path, source_id: int, buffer_size: int = 32768, hexdigests: Optional[Dict[str, str]] = None, algorithms: Iterable[str] = DEFAULT_DIGESTS, options: Optional[IngestOptions] = None):
+    with connect(database, options) as con:
+        file_id = insert_file_info(con=con, path=path, source_id=source_id, buffer_size=buffer_size, hexdigests=hexdigests, algorithms=algorithms)
+        con.commit()
+
+        return file_id
+
+def load_json(path: pathlib.Path, algorithms: Iterable[str] = DEFAULT_DIGESTS) -> Tuple[Any, Dict[str, str]]:
+    '''
+    Loads a JSON file and hashes it in the same read
+    '''
+    with open_hashed(path=path, algorithms=algorithms) as reader, io.TextIOWrapper(io.BufferedReader(reader)) as fp:
+        data = json.load(fp)
+        reader.drain()
+        return data, reader.hexdigests()
+
+def match_log_line(line: str, dispatcher: Optional[LogDispatcher] = None, timestamps: Optional[TimestampParser] = None) -> Iterator[Tuple[LogParser, List[Any]]]:
+    '''
+    Yields each parser matching the line, with the line, end_line, log_datetime, level and captured groups
+    '''
     if not line[0] == "[":
         return
     
-    log_datetime = datetime.datetime.strptime(line[1:23], "%d%b%Y %H:%M:%S.%f")
+    log_datetime = None
     
     start = line.find('[', 24)
     end = line.find(']', start)
@@ -199,15 +946,16 @@ def parse_log_line(con: sqlite3.Connection, log_path: pathlib.Path, line: str, s
     end = line.find(':', end)
     end_line = line[end+2:]
 
-    for parser in parsers:
-        m = parser.parse(end_line)
-        if not m:
-            continue
-        
+    if dispatcher is None:
+        dispatcher = LogDispatcher(parsers)
+
+    for parser, m in dispatcher.dispatch(end_line):
+        if log_datetime is None:
+            if timestamps is None:
+                timestamps = TimestampParser()
+            log_datetime = timestamps.parse_log(line[1:23])
+
         parameters = [
-            source_id, # source_id
-            file_id, # file_id
-            str(log_path), # log_path
             line, # line
             end_line, # end_line
             log_datetime, # log_datetime
@@ -217,108 +965,855 @@ def parse_log_line(con: sqlite3.Connection, log_path: pathlib.Path, line: str, s
         for group in m.groups():
             parameters.append(group)
 
-        parser.insert(
-            con=con, 
-            parameters=parameters,
+        yield parser, parameters
+
+def parse_log_line(writer: BatchWriter, log_path: pathlib.Path, line: str, source_id: int, file_id: int, dispatcher: Optional[LogDispatcher] = None, timestamps: Optional[TimestampParser] = None):
+    '''
+    Writes the rows of a single line, kept for callers outside iter_log_rows
+    '''
+    for parser, parameters in match_log_line(line=line, dispatcher=dispatcher, timestamps=timestamps):
+        writer.insert(
+            insert_sql=parser.insert_sql, 
+            parameters=[
+                source_id, # source_id
+                file_id, # file_id
+                str(log_path), # log_path
+                *parameters,
+            ],
         )
 
-def parse_log(database: Union[bytes, Text], log_path: pathlib.Path, log_file: TextIOWrapper, source_id: int):
-    file_id = write_file_info(database=database, path=log_path, source_id=source_id)
-    
-    with sqlite3.connect(database=database) as con:
-        for line in log_file.readlines():
-            data = parse_log_line(
-                source_id = source_id,
-                file_id = file_id,
-                con = con, 
-                log_path = log_path, 
-                line= line
+class LogReader:
+    '''
+    Iterates the decoded lines of a binary log stream, tracking the byte and line offset reached
+    '''
+    def __init__(self, log_file: BufferedIOBase, complete_lines_only: bool = False):
+        self.log_file = log_file
+        self.complete_lines_only = complete_lines_only
+        self.head = log_file.readline()
+        self.head_sha1 = hashlib.sha1(self.head).hexdigest() if self.head else None
+        self.byte_offset = 0
+        self.line_offset = 0
+
+    def seek(self, byte_offset: int, line_offset: int):
+        if byte_offset and self.log_file.seekable():
+            self.log_file.seek(byte_offset)
+        elif byte_offset:
+            # A hashed plain log is not seekable, so the lines already ingested are read and skipped
+            remaining = byte_offset - len(self.head)
+            while remaining > 0:
+                skipped = self.log_file.read(min(remaining, 1 << 20))
+                if not skipped:
+                    break
+                remaining -= len(skipped)
+        self.byte_offset = byte_offset
+        self.line_offset = line_offset
+
+    def __iter__(self) -> Iterator[str]:
+        if not self.head:
+            return
+
+        if self.byte_offset:
+            lines = self.log_file
+        else:
+            lines = itertools.chain((self.head,), self.log_file)
+
+        for raw_line in lines:
+            # A plain log may still be written to, so an unfinished last line is left for the next run
+            if self.complete_lines_only and not raw_line.endswith(b"\n"):
+                break
+            self.byte_offset += len(raw_line)
+            self.line_offset += 1
+            yield decode_log_line(raw_line)
+
+def decode_log_line(raw_line: bytes, errors: str = "strict") -> str:
+    # Normalise line endings the same way a text mode file would
+    line = raw_line.decode(LOG_ENCODING, errors)
+    if line.endswith("\r\n"):
+        line = line[:-2] + "\n"
+    return line
+
+# Bytes of a mapped log hashed at a time as it is scanned
+MAPPED_HASH_SIZE = 1 << 22
+
+class MappedLogReader:
+    '''
+    Scans a plain log through mmap instead of reading and decoding it line by line.
+
+    Each of LogDispatcher.scan_literals is searched for across the whole mapping to find the lines that
+    could match a parser. Only those lines are decoded and passed to match_log_line, so the rows are
+    the same as LogReader's. The other lines are only counted, and never become Python objects, which
+    also means an undecodable line is skipped rather than failing the file as it does in text mode.
+
+    The file's digests are fed as rows scans forward, so the mapping is read once. A resumed log still
+    has its start hashed, as the digests are of the whole file, but it is not scanned again.
+    '''
+    def __init__(self, log_path: pathlib.Path, complete_lines_only: bool = False, algorithms: Iterable[str] = DEFAULT_DIGESTS):
+        self.log_path = log_path
+        self.hashes = {algorithm: hashlib.new(algorithm) for algorithm in algorithms}
+        self.hashed = 0
+        with log_path.open('rb') as log_file:
+            size = os.fstat(log_file.fileno()).st_size
+            # An empty file cannot be mapped
+            self.buffer = mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+        head_end = self.buffer.find(b"\n")
+        head = self.buffer[:head_end + 1 if head_end >= 0 else len(self.buffer)]
+        self.head_sha1 = hashlib.sha1(head).hexdigest() if head else None
+        self.byte_offset = 0
+        self.line_offset = 0
+        # A plain log may still be written to, so an unfinished last line is left for the next run
+        self.end = self.buffer.rfind(b"\n") + 1 if complete_lines_only else len(self.buffer)
+
+    def seek(self, byte_offset: int, line_offset: int):
+        self.byte_offset = byte_offset
+        self.line_offset = line_offset
+
+    def hash_to(self, offset: int):
+        if offset <= self.hashed:
+            return
+        with memoryview(self.buffer) as view:
+            for digest in self.hashes.values():
+                digest.update(view[self.hashed:offset])
+        self.hashed = offset
+
+    def hexdigests(self) -> Dict[str, str]:
+        # Whatever rows did not reach, such as an unfinished last line
+        self.hash_to(len(self.buffer))
+        return {algorithm: digest.hexdigest() for algorithm, digest in self.hashes.items()}
+
+    def count_lines(self, start: int, end: int, chunk_size: int = 1 << 24) -> int:
+        lines = sum(self.buffer[offset:min(offset + chunk_size, end)].count(b"\n") for offset in range(start, end, chunk_size))
+        if end > start and self.buffer[end - 1:end] != b"\n":
+            lines += 1
+        return lines
+
+    def rows(self, dispatcher: Optional[LogDispatcher] = None, timestamps: Optional[TimestampParser] = None) -> Iterator[Tuple[str, List[Any]]]:
+        if dispatcher is None:
+            dispatcher = LogDispatcher(parsers)
+        if timestamps is None:
+            timestamps = TimestampParser()
+
+        buffer, start, end = self.buffer, self.byte_offset, max(self.end, self.byte_offset)
+        # The next occurrence of each literal, bytes.find is several times faster than a regex alternating them
+        hits = [(buffer.find(literal, start, end), literal) for literal in dispatcher.scan_literals]
+        hits = [hit for hit in hits if hit[0] >= 0]
+        heapq.heapify(hits)
+        while hits:
+            position = hits[0][0]
+            line_start = buffer.rfind(b"\n", start, position) + 1 or start
+            line_end = buffer.find(b"\n", position, end) + 1 or end
+
+            # Hashed in steps behind the scan, while the pages it searched are still cached
+            if line_end - self.hashed >= MAPPED_HASH_SIZE:
+                self.hash_to(line_end)
+
+            line = decode_log_line(buffer[line_start:line_end])
+            for parser, parameters in match_log_line(line=line, dispatcher=dispatcher, timestamps=timestamps):
+                yield parser.insert_sql, parameters
+
+            # Every literal in this line is searched for again after it
+            while hits and hits[0][0] < line_end:
+                literal = hits[0][1]
+                position = buffer.find(literal, line_end, end)
+                if position < 0:
+                    heapq.heappop(hits)
+                else:
+                    heapq.heapreplace(hits, (position, literal))
+
+        self.line_offset += self.count_lines(start, end)
+        self.byte_offset = end
+        self.hash_to(end)
+
+    def close(self):
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+    def __enter__(self) -> "MappedLogReader":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def is_log(log_path: pathlib.Path) -> bool:
+    return log_path.name.endswith(".log") or log_path.name.endswith(".log.gz")
+
+def open_log(log_path: pathlib.Path, buffer_size: int = DEFAULT_READ_BUFFER_SIZE, raw: Optional[io.RawIOBase] = None) -> BufferedIOBase:
+    '''
+    Opens a log as a buffered binary stream, decompressing .gz logs as they are read.
+
+    The bytes can be read from an already open raw stream instead, such as a HashingReader.
+    '''
+    if log_path.name.endswith(".gz"):
+        if raw is None:
+            compressed = log_path.open('rb', buffering=buffer_size)
+        else:
+            compressed = io.BufferedReader(raw, buffer_size=buffer_size)
+        return io.BufferedReader(gzip.GzipFile(fileobj=compressed, mode='rb'), buffer_size=buffer_size)
+    if raw is None:
+        return log_path.open('rb', buffering=buffer_size)
+    return io.BufferedReader(raw, buffer_size=buffer_size)
+
+def iter_log_rows(reader: Iterable[str], dispatcher: Optional[LogDispatcher] = None, timestamps: Optional[TimestampParser] = None) -> Iterator[Tuple[str, List[Any]]]:
+    if dispatcher is None:
+        dispatcher = LogDispatcher(parsers)
+    if timestamps is None:
+        timestamps = TimestampParser()
+
+    for line in reader:
+        for parser, parameters in match_log_line(line=line, dispatcher=dispatcher, timestamps=timestamps):
+            yield parser.insert_sql, parameters
+
+def batched(iterable: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def find_log_offset(con: sqlite3.Connection, log_path: pathlib.Path, head_sha1: str) -> Tuple[int, int]:
+    '''
+    Returns the (byte_offset, line_offset) already ingested from a log that starts with the same first line.
+
+    The same path is preferred, so latest.log resumes where the last run stopped. Otherwise any log in the
+    same directory is used, so a rotated .log.gz only ingests what was appended after latest.log was last read.
+    '''
+    rows = con.execute(
+        "SELECT path, byte_offset, line_offset FROM MINECRAFT_SERVER_LOG_OFFSET WHERE head_sha1 = ? ORDER BY rowid DESC",
+        (head_sha1,),
+    ).fetchall()
+
+    for path, byte_offset, line_offset in rows:
+        if path == str(log_path):
+            return byte_offset, line_offset
+
+    for path, byte_offset, line_offset in rows:
+        if pathlib.Path(path).parent == log_path.parent:
+            return byte_offset, line_offset
+
+    return 0, 0
+
+def find_log_resume(con: sqlite3.Connection, log_path: pathlib.Path) -> Tuple[int, int]:
+    with open_log(log_path, buffer_size=io.DEFAULT_BUFFER_SIZE) as log_file:
+        reader = LogReader(log_file)
+    if reader.head_sha1 is None:
+        return 0, 0
+    return find_log_offset(con=con, log_path=log_path, head_sha1=reader.head_sha1)
+
+def insert_log_offset(con: sqlite3.Connection, log_path: pathlib.Path, source_id: int, file_id: int, head_sha1: str, byte_offset: int, line_offset: int) -> int:
+    return con.execute(
+        "INSERT INTO MINECRAFT_SERVER_LOG_OFFSET VALUES(?, ?, ?, ?, ?, ?)", (
+            source_id,
+            file_id,
+            str(log_path),
+            head_sha1,
+            byte_offset,
+            line_offset,
+        )
+    ).lastrowid
+
+def parse_log(writer: BatchWriter, log_path: pathlib.Path, log_file: BufferedIOBase, source_id: int, dispatcher: Optional[LogDispatcher] = None, incremental: bool = False, hashing: Optional[HashingReader] = None):
+    '''
+    Parses an open log. When the log is read through a HashingReader, the file's digests come from the same pass.
+    '''
+    if dispatcher is None:
+        dispatcher = LogDispatcher(parsers)
+    timestamps = TimestampParser()
+
+    with writer.file(log_path):
+        reader = LogReader(log_file=log_file, complete_lines_only=incremental and not log_path.name.endswith(".gz"))
+        if incremental and reader.head_sha1 is not None:
+            reader.seek(*find_log_offset(con=writer.con, log_path=log_path, head_sha1=reader.head_sha1))
+        start_byte, start_line = reader.byte_offset, reader.line_offset
+
+        # Without a HashingReader the digests are calculated up front
+        file_id = insert_file_info(con=writer.con, path=log_path, source_id=source_id, hexdigests=None if hashing is None else dict())
+
+        for insert_sql, parameters in iter_log_rows(reader=reader, dispatcher=dispatcher, timestamps=timestamps):
+            writer.insert(
+                insert_sql=insert_sql,
+                parameters=[
+                    source_id, # source_id
+                    file_id, # file_id
+                    str(log_path), # log_path
+                    *parameters,
+                ],
             )
-            con.commit()
+        writer.read(bytes_read=reader.byte_offset - start_byte, lines=reader.line_offset - start_line)
+
+        if hashing is not None:
+            hashing.drain()
+            update_file_digests(con=writer.con, file_id=file_id, hexdigests=hashing.hexdigests())
+
+        if reader.head_sha1 is not None:
+            insert_log_offset(con=writer.con, log_path=log_path, source_id=source_id, file_id=file_id, head_sha1=reader.head_sha1, byte_offset=reader.byte_offset, line_offset=reader.line_offset)
+
+def parse_mapped_log(writer: BatchWriter, log_path: pathlib.Path, source_id: int, dispatcher: Optional[LogDispatcher] = None, incremental: bool = False, algorithms: Iterable[str] = DEFAULT_DIGESTS):
+    '''
+    Parses a plain log with MappedLogReader, hashing the mapping as it is scanned rather than the stream
+    '''
+    with writer.file(log_path), MappedLogReader(log_path=log_path, complete_lines_only=incremental, algorithms=algorithms) as reader:
+        if incremental and reader.head_sha1 is not None:
+            reader.seek(*find_log_offset(con=writer.con, log_path=log_path, head_sha1=reader.head_sha1))
+        start_byte, start_line = reader.byte_offset, reader.line_offset
+
+        # The digests are filled in once the scan has hashed the file
+        file_id = insert_file_info(con=writer.con, path=log_path, source_id=source_id, hexdigests=dict())
+
+        for insert_sql, parameters in reader.rows(dispatcher=dispatcher):
+            writer.insert(
+                insert_sql=insert_sql,
+                parameters=[
+                    source_id, # source_id
+                    file_id, # file_id
+                    str(log_path), # log_path
+                    *parameters,
+                ],
+            )
+        writer.read(bytes_read=reader.byte_offset - start_byte, lines=reader.line_offset - start_line)
+        update_file_digests(con=writer.con, file_id=file_id, hexdigests=reader.hexdigests())
 
-def parse_ops(database: Union[bytes, Text], input_path: pathlib.Path, source_id: int):
-    path = input_path / 'ops.json'
-    write_file_info(database=database, path=path, source_id=source_id)
+        if reader.head_sha1 is not None:
+            insert_log_offset(con=writer.con, log_path=log_path, source_id=source_id, file_id=file_id, head_sha1=reader.head_sha1, byte_offset=reader.byte_offset, line_offset=reader.line_offset)
 
-    with sqlite3.connect(database=database) as con:
-        con.execute("CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_OPS(source_id, uuid, name, level, bypassesPlayerLimit)")
-        con.commit()
+def is_mappable(log_path: pathlib.Path, log_engine: str) -> bool:
+    # Compressed logs have to be streamed through gzip
+    return log_engine == "mmap" and not log_path.name.endswith(".gz")
 
-        print(f"Parsing {path}")
-        with path.open("r") as fp:
-            for player in json.load(fp):
-                con.execute(
-                    "INSERT INTO MINECRAFT_SERVER_OPS VALUES(?, ?, ?, ?, ?)", (
-                        source_id,
-                        player["uuid"],
-                        player["name"],
-                        player["level"],
-                        player["bypassesPlayerLimit"],
-                    ),
-                )
-        con.commit()
+@dataclass
+class LogScan:
+    hexdigests: Dict[str, str]
+    head_sha1: Optional[str]
+    start_offset: int
+    byte_offset: int
+    line_offset: int
+    lines: int
+    elapsed: float
+    cpu_seconds: float
+
+def scan_log_file(log_path: pathlib.Path, queue: "multiprocessing.Queue", byte_offset: int = 0, line_offset: int = 0, incremental: bool = False, batch_size: int = DEFAULT_BATCH_SIZE, buffer_size: int = DEFAULT_READ_BUFFER_SIZE, algorithms: Iterable[str] = DEFAULT_DIGESTS, log_engine: str = "text") -> LogScan:
+    '''
+    Parses a log without a database, so it can run in a worker process.
+
+    Rows are put on the queue in batches as they are parsed, followed by None. The queue is bounded,
+    so a worker waits for the writer instead of holding a whole file of rows in memory.
+    '''
+    start, start_cpu = time.perf_counter(), time.process_time()
+
+    try:
+        if is_mappable(log_path, log_engine):
+            with MappedLogReader(log_path=log_path, complete_lines_only=incremental, algorithms=algorithms) as reader:
+                reader.seek(byte_offset, line_offset)
+                for batch in batched(reader.rows(), batch_size):
+                    queue.put(batch)
+                hexdigests = reader.hexdigests()
+        else:
+            with open_hashed(path=log_path, algorithms=algorithms) as hashing, open_log(log_path, buffer_size=buffer_size, raw=hashing) as log_file:
+                reader = LogReader(log_file=log_file, complete_lines_only=incremental and not log_path.name.endswith(".gz"))
+                reader.seek(byte_offset, line_offset)
+                for batch in batched(iter_log_rows(reader), batch_size):
+                    queue.put(batch)
+                hashing.drain()
+            hexdigests = hashing.hexdigests()
+    finally:
+        queue.put(None)
+
+    return LogScan(
+        hexdigests=hexdigests,
+        head_sha1=reader.head_sha1,
+        start_offset=byte_offset,
+        byte_offset=reader.byte_offset,
+        line_offset=reader.line_offset,
+        lines=reader.line_offset - line_offset,
+        elapsed=time.perf_counter() - start,
+        cpu_seconds=time.process_time() - start_cpu,
+    )
 
-def parse_whitelist(database: Union[bytes, Text], input_path: pathlib.Path, source_id: int):
-    path = input_path / 'whitelist.json'
-    write_file_info(database=database, path=path, source_id=source_id)
+def write_log_scan(writer: BatchWriter, log_path: pathlib.Path, queue: "multiprocessing.Queue", future: Future, source_id: int):
+    scan = None
+    with writer.file(log_path):
+        # The worker hashes the file while parsing it, so the digests are filled in once it is done
+        file_id = insert_file_info(con=writer.con, path=log_path, source_id=source_id, hexdigests=dict())
+
+        batches = iter(queue.get, None)
+        try:
+            for batch in batches:
+                for insert_sql, parameters in batch:
+                    writer.insert(
+                        insert_sql=insert_sql,
+                        parameters=[
+                            source_id, # source_id
+                            file_id, # file_id
+                            str(log_path), # log_path
+                            *parameters,
+                        ],
+                    )
+        except Exception:
+            # A log that failed to be written is still read to the end, or its worker would wait on the full queue
+            for batch in batches:
+                pass
+            raise
+
+        scan: LogScan = future.result()
+        writer.read(bytes_read=scan.byte_offset - scan.start_offset, lines=scan.lines, cpu_seconds=scan.cpu_seconds)
+        update_file_digests(con=writer.con, file_id=file_id, hexdigests=scan.hexdigests)
+        if scan.head_sha1 is not None:
+            insert_log_offset(con=writer.con, log_path=log_path, source_id=source_id, file_id=file_id, head_sha1=scan.head_sha1, byte_offset=scan.byte_offset, line_offset=scan.line_offset)
+    if scan is None:
+        return
 
-    with sqlite3.connect(database=database) as con:
-        con.execute("CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_WHITELIST(source_id, uuid, name)")
+    megabytes = (scan.byte_offset - scan.start_offset) / 1048576
+    elapsed = max(scan.elapsed, 1e-9)
+    log_progress(f"Parsed {log_path}: {scan.lines} lines, {megabytes:.2f} MB in {scan.elapsed:.2f}s ({scan.lines / elapsed:,.0f} lines/sec, {megabytes / elapsed:.2f} MB/sec)")
+
+def parse_logs_parallel(writer: BatchWriter, log_paths: Iterable[pathlib.Path], source_id: int, options: IngestOptions):
+    '''
+    Parses logs in worker processes while this process stays the only writer.
+
+    Results are written in the order the logs were submitted, so the database ends up the same as a serial run.
+    Each log in flight gets its own bounded queue of row batches, which keeps memory flat however large a log is.
+    '''
+    import multiprocessing
+
+    with multiprocessing.Manager() as manager, concurrent.futures.ProcessPoolExecutor(max_workers=options.jobs) as executor:
+        pending = collections.deque()
+        for log_path in log_paths:
+            byte_offset, line_offset = 0, 0
+            if options.incremental:
+                byte_offset, line_offset = find_log_resume(con=writer.con, log_path=log_path)
+            queue = manager.Queue(maxsize=4)
+            future = executor.submit(scan_log_file, log_path, queue, byte_offset, line_offset, options.incremental, options.batch_size, options.read_buffer_size, options.digests, options.log_engine)
+            pending.append((log_path, queue, future))
+
+            # Keep a bounded number of logs in flight
+            if len(pending) >= options.jobs * 2:
+                log_path, queue, future = pending.popleft()
+                write_log_scan(writer=writer, log_path=log_path, queue=queue, future=future, source_id=source_id)
+
+        while pending:
+            log_path, queue, future = pending.popleft()
+            write_log_scan(writer=writer, log_path=log_path, queue=queue, future=future, source_id=source_id)
+
+def parse_ops(database: Union[bytes, Text], input_path: pathlib.Path, source_id: int, options: Optional[IngestOptions] = None):
+    options = options or IngestOptions()
+    path = input_path / 'ops.json'
+    players, hexdigests = load_json(path=path, algorithms=options.digests)
+    write_file_info(database=database, path=path, source_id=source_id, hexdigests=hexdigests, options=options)
+
+    with connect(database, options) as con:
+        log_progress(f"Parsing {path}")
+        for player in players:
+            con.execute(
+                "INSERT INTO MINECRAFT_SERVER_OPS VALUES(?, ?, ?, ?, ?)", (
+                    source_id,
+                    player["uuid"],
+                    player["name"],
+                    player["level"],
+                    player["bypassesPlayerLimit"],
+                ),
+            )
         con.commit()
+        if options.metrics is not None:
+            options.metrics.count(rows=len(players), commits=1, bytes_read=path.stat().st_size)
 
-        print(f"Parsing {path}")
-        with path.open("r") as fp:
-            for player in json.load(fp):
-                con.execute(
-                    "INSERT INTO MINECRAFT_SERVER_WHITELIST VALUES(?, ?, ?)", (
-                        source_id,
-                        player["uuid"],
-                        player["name"],
-                    ),
-                )
+def parse_whitelist(database: Union[bytes, Text], input_path: pathlib.Path, source_id: int, options: Optional[IngestOptions] = None):
+    options = options or IngestOptions()
+    path = input_path / 'whitelist.json'
+    players, hexdigests = load_json(path=path, algorithms=options.digests)
+    write_file_info(database=database, path=path, source_id=source_id, hexdigests=hexdigests, options=options)
+
+    with connect(database, options) as con:
+        log_progress(f"Parsing {path}")
+        for player in players:
+            con.execute(
+                "INSERT INTO MINECRAFT_SERVER_WHITELIST VALUES(?, ?, ?)", (
+                    source_id,
+                    player["uuid"],
+                    player["name"],
+                ),
+            )
         con.commit()
+        if options.metrics is not None:
+            options.metrics.count(rows=len(players), commits=1, bytes_read=path.stat().st_size)
 
-def parse_usercache(database: Union[bytes, Text], input_path: pathlib.Path, source_id: int):
+def parse_usercache(database: Union[bytes, Text], input_path: pathlib.Path, source_id: int, options: Optional[IngestOptions] = None):
+    options = options or IngestOptions()
     path = input_path / 'usercache.json'
-    write_file_info(database=database, path=path, source_id=source_id)
-
-    with sqlite3.connect(database=database) as con:
-        con.execute("CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_USERCACHE(source_id, uuid, name, expiresOn)")
+    players, hexdigests = load_json(path=path, algorithms=options.digests)
+    write_file_info(database=database, path=path, source_id=source_id, hexdigests=hexdigests, options=options)
+
+    with connect(database, options) as con:
+        log_progress(f"Parsing {path}")
+        for player in players:
+            con.execute(
+                "INSERT INTO MINECRAFT_SERVER_USERCACHE VALUES(?, ?, ?, ?)", (
+                    source_id,
+                    player["uuid"],
+                    player["name"],
+                    player["expiresOn"],
+                ),
+            )
         con.commit()
+        if options.metrics is not None:
+            options.metrics.count(rows=len(players), commits=1, bytes_read=path.stat().st_size)
 
-        print(f"Parsing {path}")
-        with path.open("r") as fp:
-            for player in json.load(fp):
-                con.execute(
-                    "INSERT INTO MINECRAFT_SERVER_USERCACHE VALUES(?, ?, ?, ?)", (
-                        source_id,
-                        player["uuid"],
-                        player["name"],
-                        player["expiresOn"],
-                    ),
+REGIONS_PATTERN = "r\.(?P<region_x>-?\d+)\.(?P<region_z>-?\d+)\.mca"
+
+REGION_SECTOR_SIZE = 4096
+REGION_HEADER_SIZE = 2 * REGION_SECTOR_SIZE
+REGION_CHUNK_COUNT = 1024
+
+@dataclass
+class RegionChunk:
+    index: int
+    sector_offset: int
+    sector_count: int
+    timestamp: int
+    length: Optional[int] = None
+    compression: Optional[int] = None
+
+def read_region_header(path: pathlib.Path) -> List[RegionChunk]:
+    '''
+    Reads the chunk locations and timestamps of a region file through a memory map.
+
+    Only the 8 KiB header and the 5 byte header in front of each chunk's payload (its length and
+    compression type) are touched, so a region file costs a page per chunk rather than its whole size.
+    '''
+    with path.open('rb') as fp:
+        size = os.fstat(fp.fileno()).st_size
+        if size < REGION_HEADER_SIZE:
+            # Freshly created region files can be empty until the first chunk is saved
+            return []
+
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as region:
+            locations = struct.unpack_from(f">{REGION_CHUNK_COUNT}I", region, 0)
+            timestamps = struct.unpack_from(f">{REGION_CHUNK_COUNT}I", region, REGION_SECTOR_SIZE)
+
+            chunks = []
+            for index, location in enumerate(locations):
+                if location == 0:
+                    continue
+                chunk = RegionChunk(
+                    index=index,
+                    sector_offset=location >> 8,
+                    sector_count=location & 0xFF,
+                    timestamp=timestamps[index],
                 )
-        con.commit()
+                start = chunk.sector_offset * REGION_SECTOR_SIZE
+                if start + 5 <= size:
+                    chunk.length, chunk.compression = struct.unpack_from(">IB", region, start)
+                chunks.append(chunk)
+            return chunks
+
+TAG_END = 0
+TAG_BYTE = 1
+TAG_SHORT = 2
+TAG_INT = 3
+TAG_LONG = 4
+TAG_FLOAT = 5
+TAG_DOUBLE = 6
+TAG_BYTE_ARRAY = 7
+TAG_STRING = 8
+TAG_LIST = 9
+TAG_COMPOUND = 10
+TAG_INT_ARRAY = 11
+TAG_LONG_ARRAY = 12
+
+NBT_SCALARS = {
+    TAG_BYTE: struct.Struct(">b"),
+    TAG_SHORT: struct.Struct(">h"),
+    TAG_INT: struct.Struct(">i"),
+    TAG_LONG: struct.Struct(">q"),
+    TAG_FLOAT: struct.Struct(">f"),
+    TAG_DOUBLE: struct.Struct(">d"),
+}
+NBT_ARRAY_ITEM_SIZES = {
+    TAG_BYTE_ARRAY: 1,
+    TAG_INT_ARRAY: 4,
+    TAG_LONG_ARRAY: 8,
+}
+NBT_UNSIGNED_SHORT = struct.Struct(">H")
+NBT_INT = NBT_SCALARS[TAG_INT]
+NBT_LIST_HEADER = struct.Struct(">bi")
+
+class NBTReader:
+    '''
+    Walks uncompressed NBT one tag at a time, so callers can read the tags they want and skip the rest without decoding them
+    '''
+    def __init__(self, data: bytes, pos: int = 0):
+        self.data = data
+        self.pos = pos
+
+    def read_tag(self) -> Tuple[int, Optional[str]]:
+        '''
+        Reads the type and name of the next tag of a compound, the name is None at its end
+        '''
+        tag_type = self.data[self.pos]
+        self.pos += 1
+        if tag_type == TAG_END:
+            return tag_type, None
+        return tag_type, self.read_string()
+
+    def read_string(self) -> str:
+        (length,) = NBT_UNSIGNED_SHORT.unpack_from(self.data, self.pos)
+        start = self.pos + 2
+        self.pos = start + length
+        return bytes(self.data[start:self.pos]).decode("utf-8", errors="replace")
+
+    def read_list(self) -> Tuple[int, int]:
+        '''
+        Reads the item type and length of a list, leaving the reader at its first item
+        '''
+        item_type, length = NBT_LIST_HEADER.unpack_from(self.data, self.pos)
+        self.pos += NBT_LIST_HEADER.size
+        return item_type, max(length, 0)
+
+    def read(self, tag_type: int) -> Any:
+        if tag_type in NBT_SCALARS:
+            scalar = NBT_SCALARS[tag_type]
+            (value,) = scalar.unpack_from(self.data, self.pos)
+            self.pos += scalar.size
+            return value
+        if tag_type == TAG_STRING:
+            return self.read_string()
+        # Anything larger is not needed as a value
+        self.skip(tag_type)
+        return None
+
+    def skip(self, tag_type: int):
+        if tag_type in NBT_SCALARS:
+            self.pos += NBT_SCALARS[tag_type].size
+        elif tag_type == TAG_STRING:
+            (length,) = NBT_UNSIGNED_SHORT.unpack_from(self.data, self.pos)
+            self.pos += 2 + length
+        elif tag_type in NBT_ARRAY_ITEM_SIZES:
+            (length,) = NBT_INT.unpack_from(self.data, self.pos)
+            self.pos += 4 + max(length, 0) * NBT_ARRAY_ITEM_SIZES[tag_type]
+        elif tag_type == TAG_LIST:
+            self.skip_list(*self.read_list())
+        elif tag_type == TAG_COMPOUND:
+            while True:
+                item_type, name = self.read_tag()
+                if item_type == TAG_END:
+                    break
+                self.skip(item_type)
+        elif tag_type != TAG_END:
+            raise ValueError(f"Unknown NBT tag type {tag_type} at {self.pos}")
+
+    def skip_list(self, item_type: int, length: int):
+        if item_type in NBT_SCALARS:
+            # Lists of numbers are skipped in one step
+            self.pos += length * NBT_SCALARS[item_type].size
+        else:
+            for _ in range(length):
+                self.skip(item_type)
+
+CHUNK_COMPRESSION_GZIP = 1
+CHUNK_COMPRESSION_ZLIB = 2
+CHUNK_COMPRESSION_NONE = 3
+CHUNK_COMPRESSION_EXTERNAL = 128
+
+def decompress_chunk(compression: int, data: bytes) -> Optional[bytes]:
+    if compression == CHUNK_COMPRESSION_ZLIB:
+        return zlib.decompress(data)
+    if compression == CHUNK_COMPRESSION_GZIP:
+        return gzip.decompress(data)
+    if compression == CHUNK_COMPRESSION_NONE:
+        return bytes(data)
+    # LZ4 and custom compression need libraries that are not available
+    return None
 
-regions_pattern = re.compile("r\.(?P<region_x>-?\d+)\.(?P<region_z>-?\d+)\.mca")
+@dataclass
+class ChunkStats:
+    data_version: Optional[int] = None
+    status: Optional[str] = None
+    inhabited_time: Optional[int] = None
+    last_update: Optional[int] = None
+    entities: Optional[int] = None
+    block_entities: Optional[int] = None
+
+class WorldParser:
+    '''
+    Reads per chunk statistics from the region files of a world.
+
+    Each chunk is decompressed, then only the tags in fields and counts are read from its NBT. Everything
+    else, including the block sections that make up most of a chunk, is skipped without being decoded.
+    '''
+    # NBT tag name, for chunks saved before and after 1.18, to ChunkStats attribute
+    fields = {
+        "DataVersion": "data_version",
+        "Status": "status",
+        "InhabitedTime": "inhabited_time",
+        "LastUpdate": "last_update",
+    }
+    counts = {
+        "Entities": "entities",
+        "entities": "entities",
+        "TileEntities": "block_entities",
+        "block_entities": "block_entities",
+    }
+    # Chunks saved before 1.18 keep everything but DataVersion in a Level compound
+    nested = {"Level"}
+
+    def parse_chunk(self, data: bytes) -> ChunkStats:
+        stats = ChunkStats()
+        reader = NBTReader(data)
+        tag_type, name = reader.read_tag()
+        if tag_type == TAG_COMPOUND:
+            self.parse_compound(reader, stats)
+        return stats
+
+    def parse_compound(self, reader: NBTReader, stats: ChunkStats):
+        while True:
+            tag_type, name = reader.read_tag()
+            if tag_type == TAG_END:
+                return
+            if name in self.fields:
+                setattr(stats, self.fields[name], reader.read(tag_type))
+            elif name in self.counts and tag_type == TAG_LIST:
+                item_type, length = reader.read_list()
+                setattr(stats, self.counts[name], length)
+                reader.skip_list(item_type, length)
+            elif name in self.nested and tag_type == TAG_COMPOUND:
+                self.parse_compound(reader, stats)
+            else:
+                reader.skip(tag_type)
+
+    def parse_region(self, path: pathlib.Path) -> Iterator[Tuple[RegionChunk, Optional[ChunkStats]]]:
+        '''
+        Yields each chunk of a region file with its statistics, or None when its payload can not be read
+        '''
+        chunks = read_region_header(path)
+        if not chunks:
+            return
+
+        with path.open('rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as region:
+            for chunk in chunks:
+                if chunk.length is None or chunk.length < 1:
+                    yield chunk, None
+                    continue
 
-def parse_region(database: Union[bytes, Text], path: pathlib.Path, source_id: int):
-    m = regions_pattern.match(path.name)
+                start = chunk.sector_offset * REGION_SECTOR_SIZE + 5
+                try:
+                    if chunk.compression & CHUNK_COMPRESSION_EXTERNAL:
+                        # Chunks larger than 1 MiB are saved next to the region file
+                        coords = RegionCoordinate(*region_coordinates(path)).getChunk(chunk.index)
+                        external_path = path.with_name(f"c.{coords.x}.{coords.z}.mcc")
+                        if not external_path.exists():
+                            yield chunk, None
+                            continue
+                        data = decompress_chunk(chunk.compression & ~CHUNK_COMPRESSION_EXTERNAL, external_path.read_bytes())
+                    else:
+                        data = decompress_chunk(chunk.compression, region[start:start + chunk.length - 1])
+                except (zlib.error, OSError, EOFError):
+                    # A corrupt payload, BadGzipFile is an OSError
+                    yield chunk, None
+                    continue
+
+                if data is None:
+                    yield chunk, None
+                    continue
+                try:
+                    yield chunk, self.parse_chunk(data)
+                except (struct.error, IndexError, ValueError):
+                    yield chunk, None
+
+def region_coordinates(path: pathlib.Path) -> Optional[Tuple[int, int]]:
+    m = compiled(REGIONS_PATTERN).match(path.name)
     if not m:
+        return None
+    return int(m.group("region_x")), int(m.group("region_z"))
+
+def scan_region_chunks(path: pathlib.Path) -> List[Tuple[Any, ...]]:
+    '''
+    Reads the statistics of every chunk in a region file, this runs in the worker processes
+    '''
+    region = RegionCoordinate(*region_coordinates(path))
+    rows = []
+    for chunk, stats in WorldParser().parse_region(path):
+        coords = region.getChunk(chunk.index)
+        stats = stats or ChunkStats()
+        rows.append((
+            coords.x, # chunk_x
+            coords.z, # chunk_z
+            chunk.compression, # compression
+            stats.data_version, # data_version
+            stats.status, # status
+            stats.inhabited_time, # inhabited_time
+            stats.last_update, # last_update
+            stats.entities, # entities
+            stats.block_entities, # block_entities
+        ))
+    return rows
+
+def parse_chunk_stats(database: Union[bytes, Text], region_files: List[Tuple[pathlib.Path, int]], source_id: int, options: Optional[IngestOptions] = None):
+    options = options or IngestOptions()
+    if not region_files:
         return
+
+    with connect(database, options) as con:
+        writer = BatchWriter(con=con, batch_size=options.batch_size, commit_interval=options.commit_interval, metrics=options.metrics)
+        paths = [path for path, file_id in region_files]
+        if options.jobs > 1:
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=options.jobs)
+            results = executor.map(scan_region_chunks, paths)
+        else:
+            executor = None
+            results = map(scan_region_chunks, paths)
+
+        try:
+            for (path, file_id), rows in zip(region_files, results):
+                log_progress(f"Parsing chunks of {path}")
+                with writer.file(path):
+                    for row in rows:
+                        writer.insert("INSERT INTO MINECRAFT_SERVER_CHUNK_STATS VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (source_id, file_id, *row))
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+        writer.commit()
+
+def parse_region(database: Union[bytes, Text], path: pathlib.Path, source_id: int, options: Optional[IngestOptions] = None, hexdigests: Optional[Dict[str, str]] = None) -> Optional[Tuple[int, int, int]]:
+    '''
+    Records a region file and the chunks in its header, returning (file_id, region_id, chunks)
+    '''
+    options = options or IngestOptions()
+    m = compiled(REGIONS_PATTERN).match(path.name)
+    if not m:
+        return None
     groups = m.groupdict()
 
-    file_id = write_file_info(database=database, path=path, source_id=source_id)
-    with sqlite3.connect(database=database) as con:
+    with connect(database, options) as con:
+        # Region files are only indexed from their header, so they are only hashed when parse_regions needed to compare them
+        file_id = insert_file_info(con=con, path=path, source_id=source_id, hexdigests=hexdigests or dict())
+
         region = RegionCoordinate(
             x = int(groups["region_x"]),
             z = int(groups["region_z"]),
         )
 
+        chunks = []
+        for chunk in read_region_header(path):
+            coords = region.getChunk(chunk.index)
+            chunks.append((
+                source_id, # source_id
+                file_id, # file_id
+                region.x, # region_x
+                region.z, # region_z
+                coords.x, # chunk_x
+                coords.z, # chunk_z
+                chunk.sector_offset, # sector_offset
+                chunk.sector_count, # sector_count
+                chunk.length, # length
+                chunk.compression, # compression
+                datetime.datetime.fromtimestamp(chunk.timestamp), # last_modified
+            ))
+        con.executemany("INSERT INTO MINECRAFT_SERVER_CHUNKS VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", chunks)
+
         min_block = region.getMinBlock() 
         max_block = region.getMaxBlock()
 
-        con.execute(
-            "INSERT INTO MINECRAFT_SERVER_REGIONS VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+        region_id = con.execute(
+            "INSERT INTO MINECRAFT_SERVER_REGIONS(source_id, file_id, path, region_x, region_z, min_x, min_y, min_z, max_x, max_y, max_z, chunks) VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (
                 source_id, # source_id
                 file_id, # file_id
                 str(path), # path
@@ -330,45 +1825,387 @@ def parse_region(database: Union[bytes, Text], path: pathlib.Path, source_id: in
                 max_block.x, # max_x 
                 max_block.y, # max_y 
                 max_block.z, # max_z
+                len(chunks), # chunks
             ),
-        )
+        ).lastrowid
     con.commit()
+    if options.metrics is not None:
+        options.metrics.count(rows=len(chunks) + 1, commits=1, bytes_read=REGION_HEADER_SIZE)
+
+    return file_id, region_id, len(chunks)
+
+def find_world_regions(con: sqlite3.Connection, region_path: pathlib.Path) -> Dict[str, Tuple[int, int, int, int, float, Optional[int], Dict[str, Optional[str]]]]:
+    '''
+    Returns the current region of each path in a region directory, as
+    (region_id, region_x, region_z, file_id, st_size, st_mtime, chunks, hexdigests), from whichever source last recorded it
+    '''
+    regions = dict()
+    for region_id, path, region_x, region_z, file_id, st_size, st_mtime, chunks, *digests in con.execute(
+        '''
+        SELECT regions.rowid, regions.path, regions.region_x, regions.region_z, regions.file_id, file.st_size, file.st_mtime, regions.chunks, file.md5, file.sha1, file.blake2b
+        FROM MINECRAFT_SERVER_REGIONS AS regions
+        JOIN MINECRAFT_SERVER_FILE AS file ON file.rowid = regions.file_id
+        WHERE regions.path >= ? AND regions.path < ? AND regions.superseded_source_id IS NULL
+        ORDER BY regions.rowid
+        ''',
+        (str(region_path) + os.sep, str(region_path) + os.sep + "\uffff"),
+    ):
+        regions[path] = (region_id, region_x, region_z, file_id, st_size, st_mtime, chunks, dict(zip(DIGESTS, digests)))
+    return regions
+
+def open_compared_database(options: IngestOptions) -> Optional[sqlite3.Connection]:
+    '''
+    A read only connection to options.compared_database, None when there is none or it has no regions yet
+    '''
+    if options.compared_database is None or not os.path.exists(options.compared_database):
+        return None
+    con = sqlite3.connect(f"{pathlib.Path(options.compared_database).resolve().as_uri()}?mode=ro", uri=True, timeout=BUSY_TIMEOUT)
+    if con.execute("SELECT 1 FROM sqlite_master WHERE name = 'MINECRAFT_SERVER_REGIONS'").fetchone() is None:
+        con.close()
+        return None
+    return con
+
+def insert_region_diff(con: sqlite3.Connection, source_id: int, path: str, region_x: int, region_z: int, change: str, region_id: Optional[int], previous_region_id: Optional[int], st_size: int, size_delta: int, chunks: int, chunks_delta: Optional[int]):
+    con.execute(
+        "INSERT INTO MINECRAFT_SERVER_REGION_DIFF VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+            source_id, # source_id
+            region_id, # region_id
+            previous_region_id, # previous_region_id
+            path, # path
+            region_x, # region_x
+            region_z, # region_z
+            change, # change
+            st_size, # st_size
+            size_delta, # size_delta
+            chunks, # chunks
+            chunks_delta, # chunks_delta
+        )
+    )
 
-def parse_regions(database: Union[bytes, Text], world_path: pathlib.Path, source_id: int):
+def parse_regions(database: Union[bytes, Text], world_path: pathlib.Path, source_id: int, options: Optional[IngestOptions] = None):
     region_path = world_path / 'region'
 
-    print(f"Parsing {region_path}")
-    with sqlite3.connect(database=database) as con:
-        con.execute("CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_REGIONS(source_id, file_id, path TEXT, region_x INTEGER, region_z INTEGER, min_x INTEGER, min_y INTEGER, min_z INTEGER, max_x INTEGER, max_y INTEGER, max_z INTEGER)")
+    log_progress(f"Parsing {region_path}")
+    # Every region file is written through the same connection
+    with ingest_session(database, options) as options, connect(database, options) as con:
+        # Regions are compared to the last source that recorded them. Unchanged ones keep their rows, which
+        # stay current until a later source supersedes them, so only added, changed and deleted regions are written.
+        # A staging database compares against the output it is merged into, and merge_database supersedes the rows there.
+        compared = open_compared_database(options)
+        staged = compared is not None
+        if staged:
+            with contextlib.closing(compared):
+                previous = find_world_regions(con=compared, region_path=region_path)
+        else:
+            previous = find_world_regions(con=con, region_path=region_path)
+        changes = collections.Counter()
+        region_files = []
+        for path in region_path.iterdir():
+            m = compiled(REGIONS_PATTERN).match(path.name)
+            if not m:
+                continue
+
+            stat = path.stat()
+            hexdigests = dict()
+            recorded = previous.pop(str(path), None)
+            if recorded is not None:
+                previous_region_id, region_x, region_z, previous_file_id, st_size, st_mtime, previous_chunks, recorded_digests = recorded
+                if stat.st_size == st_size and stat.st_mtime == st_mtime:
+                    changes["unchanged"] += 1
+                    continue
+                if stat.st_size == st_size:
+                    # Saving a region rewrites it even when nothing in it changed, so only the size and mtime are ambiguous
+                    hexdigests = calculate_digests(path=path, algorithms=options.digests)
+                    digests = [algorithm for algorithm in options.digests if recorded_digests.get(algorithm)]
+                    if digests and all(recorded_digests[algorithm] == hexdigests[algorithm] for algorithm in digests):
+                        if not staged:
+                            # Kept so the next run does not hash it again
+                            con.execute("UPDATE MINECRAFT_SERVER_FILE SET st_mtime = ? WHERE rowid = ?", (stat.st_mtime, previous_file_id))
+                        changes["unchanged"] += 1
+                        continue
+
+            file_id, region_id, chunks = parse_region(database=database, path=path, source_id=source_id, options=options, hexdigests=hexdigests)
+            region_files.append((path, file_id))
+
+            if recorded is None:
+                insert_region_diff(con=con, source_id=source_id, path=str(path), region_x=int(m["region_x"]), region_z=int(m["region_z"]), change="added", region_id=region_id, previous_region_id=None, st_size=stat.st_size, size_delta=stat.st_size, chunks=chunks, chunks_delta=chunks)
+                changes["added"] += 1
+            else:
+                if not staged:
+                    con.execute("UPDATE MINECRAFT_SERVER_REGIONS SET superseded_source_id = ? WHERE rowid = ?", (source_id, previous_region_id))
+                insert_region_diff(con=con, source_id=source_id, path=str(path), region_x=region_x, region_z=region_z, change="changed", region_id=region_id, previous_region_id=previous_region_id, st_size=stat.st_size, size_delta=stat.st_size - int(st_size), chunks=chunks, chunks_delta=None if previous_chunks is None else chunks - previous_chunks)
+                changes["changed"] += 1
+
+        # Whatever was not found again was deleted
+        for path, (previous_region_id, region_x, region_z, previous_file_id, st_size, st_mtime, previous_chunks, recorded_digests) in previous.items():
+            if not staged:
+                con.execute("UPDATE MINECRAFT_SERVER_REGIONS SET superseded_source_id = ? WHERE rowid = ?", (source_id, previous_region_id))
+            insert_region_diff(con=con, source_id=source_id, path=path, region_x=region_x, region_z=region_z, change="deleted", region_id=None, previous_region_id=previous_region_id, st_size=0, size_delta=-int(st_size), chunks=0, chunks_delta=None if previous_chunks is None else -previous_chunks)
+            changes["deleted"] += 1
         con.commit()
+        if options.metrics is not None:
+            options.metrics.count(rows=changes["added"] + changes["changed"] + changes["deleted"], commits=1)
+        log_progress(f"Regions of {region_path}: {changes['added']} added, {changes['changed']} changed, {changes['deleted']} deleted, {changes['unchanged']} unchanged")
+
+        if options.chunk_stats:
+            parse_chunk_stats(database=database, region_files=region_files, source_id=source_id, options=options)
+
+# Leaderboard name to the (category, key) stats summed into it, a key of None sums the whole category
+STATS_LEADERBOARDS = {
+    "blocks_mined": [("minecraft:mined", None)],
+    "items_crafted": [("minecraft:crafted", None)],
+    "distance_walked": [("minecraft:custom", "minecraft:walk_one_cm"), ("minecraft:custom", "minecraft:sprint_one_cm"), ("minecraft:custom", "minecraft:crouch_one_cm")],
+    "play_time": [("minecraft:custom", "minecraft:play_time"), ("minecraft:custom", "minecraft:play_one_minute")],
+    "deaths": [("minecraft:custom", "minecraft:deaths")],
+    "mob_kills": [("minecraft:custom", "minecraft:mob_kills")],
+    "player_kills": [("minecraft:custom", "minecraft:player_kills")],
+}
+
+def iter_stats(data: Dict[str, Any]) -> Iterator[Tuple[str, str, Any]]:
+    '''
+    Yields (category, key, value) from a stats file, either the 1.13+ layout or the older flat one
+    '''
+    stats = data.get("stats")
+    if isinstance(stats, dict):
+        for category, values in stats.items():
+            for key, value in values.items():
+                yield category, key, value
+        return
 
-    for path in region_path.iterdir():
-        parse_region(database=database, path=path, source_id=source_id)
+    # Before 1.13 stats were flat, like "stat.mineBlock.minecraft.stone": 10
+    for name, value in data.items():
+        if not isinstance(value, (int, float)):
+            continue
+        parts = name.split(".", 2)
+        if len(parts) == 3:
+            yield f"{parts[0]}.{parts[1]}", parts[2], value
+        else:
+            yield parts[0], parts[-1], value
+
+def sum_leaderboards(data: Dict[str, Any]) -> Dict[str, int]:
+    stats = data.get("stats")
+    if not isinstance(stats, dict):
+        return dict()
+
+    leaderboards = dict()
+    for leaderboard, sources in STATS_LEADERBOARDS.items():
+        total = None
+        for category, key in sources:
+            values = stats.get(category)
+            if not values:
+                continue
+            value = sum(values.values()) if key is None else values.get(key)
+            if value is not None:
+                total = (total or 0) + value
+        if total is not None:
+            leaderboards[leaderboard] = total
+    return leaderboards
+
+def table_exists(con: sqlite3.Connection, name: str) -> bool:
+    return con.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone() is not None
+
+def create_region_index(con: sqlite3.Connection):
+    '''
+    Keeps the block bounds of each region in an R*Tree, which a trigger fills as regions are inserted
+    '''
+    exists = table_exists(con, "MINECRAFT_SERVER_REGIONS_RTREE")
+    con.execute("CREATE VIRTUAL TABLE IF NOT EXISTS MINECRAFT_SERVER_REGIONS_RTREE USING rtree(id, min_x, max_x, min_z, max_z)")
+    con.execute('''
+        CREATE TRIGGER IF NOT EXISTS MINECRAFT_SERVER_REGIONS_RTREE_INSERT AFTER INSERT ON MINECRAFT_SERVER_REGIONS BEGIN
+            INSERT INTO MINECRAFT_SERVER_REGIONS_RTREE VALUES(NEW.rowid, NEW.min_x, NEW.max_x, NEW.min_z, NEW.max_z);
+        END
+    ''')
+    if not exists:
+        # Regions recorded before the index existed
+        con.execute("INSERT INTO MINECRAFT_SERVER_REGIONS_RTREE SELECT rowid, min_x, max_x, min_z, max_z FROM MINECRAFT_SERVER_REGIONS")
+
+def create_region_history(con: sqlite3.Connection):
+    '''
+    A region row is current from its source until superseded_source_id, when a later source recorded the file
+    changing or gone. MINECRAFT_SERVER_WORLD_REGIONS lists the regions current at each source of the same server.
+    '''
+    existing = {row[1] for row in con.execute("PRAGMA table_info(MINECRAFT_SERVER_REGIONS)")}
+    ensure_columns(con, "MINECRAFT_SERVER_REGIONS", {"chunks": "INTEGER", "superseded_source_id": "INTEGER"})
+    con.execute("CREATE INDEX IF NOT EXISTS MINECRAFT_SERVER_REGIONS_PATH ON MINECRAFT_SERVER_REGIONS(path, superseded_source_id)")
+    if "superseded_source_id" not in existing:
+        # Older versions recorded every region again for each source, each copy is superseded by the next
+        con.execute('''
+            UPDATE MINECRAFT_SERVER_REGIONS SET superseded_source_id = (
+                SELECT MIN(later.source_id) FROM MINECRAFT_SERVER_REGIONS AS later
+                WHERE later.path = MINECRAFT_SERVER_REGIONS.path AND later.source_id > MINECRAFT_SERVER_REGIONS.source_id
+            )
+        ''')
+
+    con.execute("CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_REGION_DIFF(source_id, region_id INTEGER, previous_region_id INTEGER, path TEXT, region_x INTEGER, region_z INTEGER, change TEXT, st_size INTEGER, size_delta INTEGER, chunks INTEGER, chunks_delta INTEGER)")
+    con.execute("CREATE INDEX IF NOT EXISTS MINECRAFT_SERVER_REGION_DIFF_SOURCE ON MINECRAFT_SERVER_REGION_DIFF(source_id, change)")
+    con.execute('''
+        CREATE VIEW IF NOT EXISTS MINECRAFT_SERVER_WORLD_REGIONS AS
+        SELECT
+            snapshot.rowid AS snapshot_source_id,
+            regions.rowid AS region_id,
+            regions.*
+        FROM MINECRAFT_SERVER_REGIONS AS regions
+        JOIN MINECRAFT_SERVER_SOURCE AS origin ON origin.rowid = regions.source_id
+        JOIN MINECRAFT_SERVER_SOURCE AS snapshot ON
+            snapshot.input_path = origin.input_path AND
+            snapshot.rowid >= regions.source_id AND
+            (regions.superseded_source_id IS NULL OR snapshot.rowid < regions.superseded_source_id)
+    ''')
+
+def create_position_index(con: sqlite3.Connection, table: str, player: str = "player", interned: bool = False):
+    '''
+    Keeps the x and z of each row of a table in MINECRAFT_SERVER_POSITIONS_RTREE, with where it came from and who was there
+    '''
+    con.execute("CREATE VIRTUAL TABLE IF NOT EXISTS MINECRAFT_SERVER_POSITIONS_RTREE USING rtree(id, min_x, max_x, min_z, max_z, +source_table, +source_rowid, +source_id, +player, +log_datetime)")
+    trigger = f"{table}_POSITIONS_RTREE_INSERT"
+    if table_exists(con, trigger):
+        return
 
-def parse_stats(database: Union[bytes, Text], world_path: pathlib.Path, source_id: int):
+    # The compact schema stores the player as an id into MINECRAFT_SERVER_STRINGS
+    player_sql = "(SELECT value FROM MINECRAFT_SERVER_STRINGS WHERE string_id = {row}.%s)" % player if interned else "{row}.%s" % player
+    con.execute(f'''
+        CREATE TRIGGER {trigger} AFTER INSERT ON {table} BEGIN
+            INSERT INTO MINECRAFT_SERVER_POSITIONS_RTREE VALUES(NULL, NEW.x, NEW.x, NEW.z, NEW.z, '{table}', NEW.rowid, NEW.source_id, {player_sql.format(row="NEW")}, NEW.log_datetime);
+        END
+    ''')
+    # Rows recorded before the index existed
+    con.execute(f"INSERT INTO MINECRAFT_SERVER_POSITIONS_RTREE SELECT NULL, x, x, z, z, '{table}', rowid, source_id, {player_sql.format(row=table)}, log_datetime FROM {table}")
+    con.execute(f"CREATE INDEX IF NOT EXISTS {table}_PLAYER ON {table}({player})")
+
+def find_player_regions(con: sqlite3.Connection, player: str, source_id: Optional[int] = None) -> List[Tuple[Any, ...]]:
+    '''
+    Returns (log_datetime, source_table, x, y, z, region_x, region_z, chunk_x, chunk_z) for each recorded position of a player.
+
+    Positions come from logins and crash reports. Each is matched to the regions of the world as it was at its
+    source through MINECRAFT_SERVER_REGIONS_RTREE, rather than by comparing against every region.
+    '''
+    results = []
+    for table, player_column in [("MINECRAFT_SERVER_LOGS_LOGGED_IN", "player"), ("MINECRAFT_SERVER_CRASH_REPORTS_PLAYER_DETAILS", "player_name")]:
+        if not table_exists(con, table):
+            continue
+        res = con.execute(f'''
+            SELECT
+                positions.log_datetime,
+                '{table}',
+                positions.x,
+                positions.y,
+                positions.z,
+                MINECRAFT_SERVER_REGIONS.region_x,
+                MINECRAFT_SERVER_REGIONS.region_z
+            FROM {table} AS positions
+            LEFT JOIN MINECRAFT_SERVER_REGIONS_RTREE ON
+                MINECRAFT_SERVER_REGIONS_RTREE.min_x <= positions.x AND
+                MINECRAFT_SERVER_REGIONS_RTREE.max_x >= positions.x AND
+                MINECRAFT_SERVER_REGIONS_RTREE.min_z <= positions.z AND
+                MINECRAFT_SERVER_REGIONS_RTREE.max_z >= positions.z
+            LEFT JOIN MINECRAFT_SERVER_REGIONS ON
+                MINECRAFT_SERVER_REGIONS.rowid = MINECRAFT_SERVER_REGIONS_RTREE.id AND
+                MINECRAFT_SERVER_REGIONS.source_id <= positions.source_id AND
+                (MINECRAFT_SERVER_REGIONS.superseded_source_id IS NULL OR MINECRAFT_SERVER_REGIONS.superseded_source_id > positions.source_id) AND
+                (SELECT input_path FROM MINECRAFT_SERVER_SOURCE WHERE rowid = MINECRAFT_SERVER_REGIONS.source_id) = (SELECT input_path FROM MINECRAFT_SERVER_SOURCE WHERE rowid = positions.source_id)
+            WHERE positions.{player_column} = ? AND (? IS NULL OR positions.source_id = ?)
+        ''', (player, source_id, source_id))
+        for log_datetime, source_table, x, y, z, region_x, region_z in res:
+            # Chunks are 16 blocks wide, so they are worked out rather than looked up
+            chunk_x = math.floor(float(x)) >> 4 if x is not None else None
+            chunk_z = math.floor(float(z)) >> 4 if z is not None else None
+            results.append((log_datetime, source_table, x, y, z, region_x, region_z, chunk_x, chunk_z))
+    results.sort(key=lambda row: str(row[0]))
+    return results
+
+def find_players_near(con: sqlite3.Connection, x: float, z: float, radius: float, source_id: Optional[int] = None) -> List[Tuple[Any, ...]]:
+    '''
+    Returns (player, log_datetime, source_table, source_rowid, x, z) for each recorded position within radius blocks of (x, z)
+    '''
+    if not table_exists(con, "MINECRAFT_SERVER_POSITIONS_RTREE"):
+        return []
+    res = con.execute('''
+        SELECT player, log_datetime, source_table, source_rowid, min_x, min_z
+        FROM MINECRAFT_SERVER_POSITIONS_RTREE
+        WHERE min_x >= ? AND max_x <= ? AND min_z >= ? AND max_z <= ? AND (? IS NULL OR source_id = ?)
+    ''', (x - radius, x + radius, z - radius, z + radius, source_id, source_id))
+
+    # The R*Tree finds the square around the point, the corners are trimmed here
+    return [row for row in res if (row[4] - x) ** 2 + (row[5] - z) ** 2 <= radius ** 2]
+
+def parse_stats(database: Union[bytes, Text], world_path: pathlib.Path, source_id: int, options: Optional[IngestOptions] = None):
+    options = options or IngestOptions()
     stats_path = world_path / 'stats'
-    print(f"Parsing {stats_path}")
-    for path in stats_path.iterdir():
-        ...
+    if not stats_path.is_dir():
+        return
 
-def parse_server_properties(database: Union[bytes, Text], input_path: pathlib.Path, source_id: int):
+    log_progress(f"Parsing {stats_path}")
+    with connect(database, options) as con:
+        # The digests each stats file was last recorded with, looked up once rather than per file. Only --incremental
+        # skips unchanged files, a full run records every file under its new source.
+        previous = dict()
+        if options.incremental:
+            for path, *digests in con.execute(
+                "SELECT path, md5, sha1, blake2b FROM MINECRAFT_SERVER_FILE WHERE path >= ? AND path < ? ORDER BY rowid",
+                (str(stats_path) + os.sep, str(stats_path) + os.sep + "\uffff"),
+            ):
+                previous[path] = dict(zip(DIGESTS, digests))
+
+        writer = BatchWriter(con=con, batch_size=options.batch_size, commit_interval=options.commit_interval, metrics=options.metrics)
+        skipped = 0
+        for path in sorted(stats_path.iterdir()):
+            if path.suffix != ".json":
+                continue
+
+            data, hexdigests = read_hashed(path=path, algorithms=options.digests)
+            recorded = previous.get(str(path), dict())
+            compared = [algorithm for algorithm in options.digests if recorded.get(algorithm)]
+            if compared and all(recorded[algorithm] == hexdigests[algorithm] for algorithm in compared):
+                skipped += 1
+                continue
+
+            uuid = path.stem
+            with writer.file(path):
+                # A malformed file is skipped along with its rows
+                stats = loads_json(data)
+                writer.read(bytes_read=len(data))
+                file_id = insert_file_info(con=con, path=path, source_id=source_id, hexdigests=hexdigests)
+                for category, key, value in iter_stats(stats):
+                    writer.insert("INSERT INTO MINECRAFT_SERVER_STATS VALUES(?, ?, ?, ?, ?, ?)", (
+                        source_id, # source_id
+                        file_id, # file_id
+                        uuid, # uuid
+                        category, # category
+                        key, # key
+                        value, # value
+                    ))
+
+                # The leaderboards only hold the latest totals of each player
+                con.execute("DELETE FROM MINECRAFT_SERVER_STATS_LEADERBOARD WHERE path = ?", (str(path),))
+                for leaderboard, value in sum_leaderboards(stats).items():
+                    writer.insert("INSERT INTO MINECRAFT_SERVER_STATS_LEADERBOARD VALUES(?, ?, ?, ?, ?, ?)", (
+                        source_id, # source_id
+                        file_id, # file_id
+                        str(path), # path
+                        uuid, # uuid
+                        leaderboard, # leaderboard
+                        value, # value
+                    ))
+        writer.commit()
+
+    if skipped:
+        log_progress(f"Skipped {skipped} unchanged files in {stats_path}")
+
+def parse_server_properties(database: Union[bytes, Text], input_path: pathlib.Path, source_id: int, options: Optional[IngestOptions] = None):
+    options = options or IngestOptions()
     path = input_path / 'server.properties'
-    file_id = write_file_info(database=database, path=path, source_id=source_id)
-
-    level_name = 'world'
 
-    with sqlite3.connect(database=database) as con:
-        con.execute("CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_SERVER_PROPERTIES(source_id, file_id, key, value)")
-        con.commit()
-
-        print(f"Parsing {path}")
-        with path.open("r") as fp:
-            for line in fp.readlines():
+    with connect(database, options) as con:
+        log_progress(f"Parsing {path}")
+        with open_hashed(path=path, algorithms=options.digests) as hashing, io.TextIOWrapper(io.BufferedReader(hashing)) as fp:
+            # The file is hashed while it is parsed, so the digests are filled in afterwards
+            file_id = insert_file_info(con=con, path=path, source_id=source_id, hexdigests=dict())
+            lines, rows = 0, 0
+            for lines, line in enumerate(fp, 1):
                 if line.startswith("#"):
                     continue
+                rows += 1
                 key, value = line.split("=", 1)
-                if key == "level-name":
-                    level_name = value.strip()
                 con.execute(
                     "INSERT INTO MINECRAFT_SERVER_SERVER_PROPERTIES VALUES(?, ?, ?, ?)", (
                         source_id,
@@ -377,96 +2214,315 @@ def parse_server_properties(database: Union[bytes, Text], input_path: pathlib.Pa
                         value,
                     )
                 )
+            hashing.drain()
+            update_file_digests(con=con, file_id=file_id, hexdigests=hashing.hexdigests())
         con.commit()
+        if options.metrics is not None:
+            options.metrics.count(rows=rows, commits=1, bytes_read=path.stat().st_size, lines=lines)
+
+def find_world_path(con: sqlite3.Connection, input_path: pathlib.Path, source_id: int) -> pathlib.Path:
+    '''
+    The world directory named by the level-name parse_server_properties recorded for the source
+    '''
+    row = con.execute(
+        "SELECT value FROM MINECRAFT_SERVER_SERVER_PROPERTIES WHERE source_id = ? AND key = 'level-name' ORDER BY rowid DESC LIMIT 1",
+        (source_id,),
+    ).fetchone()
+    return input_path / (row[0].strip() if row is not None else 'world')
+
+def parse_world_regions(database: Union[bytes, Text], input_path: pathlib.Path, source_id: int, options: Optional[IngestOptions] = None):
+    with ingest_session(database, options) as options:
+        parse_regions(database=database, world_path=find_world_path(con=options.session.con, input_path=input_path, source_id=source_id), source_id=source_id, options=options)
+
+def parse_world_stats(database: Union[bytes, Text], input_path: pathlib.Path, source_id: int, options: Optional[IngestOptions] = None):
+    with ingest_session(database, options) as options:
+        parse_stats(database=database, world_path=find_world_path(con=options.session.con, input_path=input_path, source_id=source_id), source_id=source_id, options=options)
+
+def parse_logs(database: Union[bytes, Text], input_path: pathlib.Path, source_id: int, options: Optional[IngestOptions] = None):
+    logs_path = input_path / 'logs'
 
-    world_path = input_path / level_name
+    with ingest_session(database, options) as options, connect(database, options) as con:
+        writer = BatchWriter(con=con, batch_size=options.batch_size, commit_interval=options.commit_interval, schema=options.session.schema, metrics=options.metrics)
+        dispatcher = LogDispatcher(parsers)
+
+        log_progress(f"Parsing {logs_path}")
+        log_paths = list()
+        for log_path in logs_path.iterdir():
+            if not is_log(log_path):
+                continue
+            if options.incremental and is_file_unchanged(con=con, path=log_path, algorithms=options.digests):
+                continue
+            log_paths.append(log_path)
+
+        if options.jobs > 1:
+            parse_logs_parallel(writer=writer, log_paths=log_paths, source_id=source_id, options=options)
+        else:
+            for log_path in log_paths:
+                if is_mappable(log_path, options.log_engine):
+                    parse_mapped_log(writer=writer, log_path=log_path, source_id=source_id, dispatcher=dispatcher, incremental=options.incremental, algorithms=options.digests)
+                    continue
+                with open_hashed(path=log_path, algorithms=options.digests) as hashing, open_log(log_path, buffer_size=options.read_buffer_size, raw=hashing) as log_file:
+                    parse_log(writer=writer, log_path=log_path, log_file=log_file, source_id=source_id, dispatcher=dispatcher, incremental=options.incremental, hashing=hashing)
 
-    for parse in [
-        parse_regions
-    ]:
-        parse(database=database, world_path=world_path, source_id=source_id)
+        writer.commit()
 
-def parse_logs(database: Union[bytes, Text], input_path: pathlib.Path, source_id: int):
-    with sqlite3.connect(database=database) as con:
-        for parser in parsers:
-            parser.create(con)
-        con.commit()
+CRASH_REPORT_PLAYER_COUNT_PATTERN = "\tPlayer Count: (?P<current_player_count>[0-9]+) / (?P<max_player_count>[0-9]+); \[(?P<player_details>.+)\]"
+CRASH_REPORT_PLAYER_DETAILS_PATTERN = "ServerPlayer\[\'(?P<player_name>[^\']+)\'/(?P<entityid>\d+), l=\'(?P<level_name>[^\']+)\', x=(?P<x>[^,]+), y=(?P<y>[^,]+), z=(?P<z>[^,]+)\]"
 
-    logs_path = input_path / 'logs'
+# Bytes of the details section of a crash report read at a time
+CRASH_REPORT_CHUNK_SIZE = 65536
 
-    print(f"Parsing {logs_path}")
-    for log_path in logs_path.iterdir():
-        if log_path.name.endswith(".log"):
-            with log_path.open('rt') as log_file:
-                parse_log(database=database, log_path=log_path, log_file=log_file, source_id=source_id)
-            continue
+# Frames of each exception in a trace that its fingerprint is taken from
+FINGERPRINT_FRAMES = 10
+
+# Generated names that differ between runs of the same code
+STACK_FRAME_NORMALIZATION = [
+    (r"\$\$Lambda\$\d+/0x[0-9a-f]+", "$$Lambda"),
+    (r"\$\$Lambda/0x[0-9a-f]+", "$$Lambda"),
+    (r"lambda\$(\w+?)\$\d+", r"lambda$\1"),
+    (r"0x[0-9a-f]+", "0x"),
+]
 
-        if log_path.name.endswith(".log.gz"):            
-            with gzip.open(log_path, 'rt') as log_file:
-                parse_log(database=database, log_path=log_path, log_file=log_file, source_id=source_id)
+@dataclass
+class CrashReportScan:
+    hexdigests: Dict[str, str]
+    log_datetime: Optional[datetime.datetime]
+    description: Optional[str]
+    # The first line of the trace, the exception and its message
+    exception: Optional[str]
+    # The innermost cause, which the fingerprint groups by along with the frames
+    root_cause: Optional[str]
+    stack: Optional[str]
+    fingerprint: Optional[str]
+    player_count_line: Optional[str]
+    players: List[Tuple[str, str, str, str, str, str]]
+    bytes_read: int
+    lines: int
+
+def normalize_stack_trace(lines: List[str]) -> Tuple[Optional[str], str]:
+    '''
+    Reduces a Java stack trace to the class of each exception in its chain and the methods of their top frames.
+
+    Messages, line numbers, jars, mixin notes and generated lambda names are dropped, so the same crash gets the
+    same text however often it happens. Returns the class of the innermost cause, and the text.
+    '''
+    normalized = list()
+    root_cause = None
+    frames = 0
+    for line in lines:
+        line = line.rstrip()
+        if not line.strip() or line.startswith("\t\t") or line.lstrip().startswith("..."):
+            # Suppressed exceptions are nested a level deeper, and "... 5 more" repeats the enclosing trace
+            continue
+        if line.startswith("\tat "):
+            if root_cause is None or frames >= FINGERPRINT_FRAMES:
+                continue
+            frame = line[4:].split("(", 1)[0]
+            for pattern, replacement in STACK_FRAME_NORMALIZATION:
+                frame = compiled(pattern).sub(replacement, frame)
+            # java.base/java.lang.Thread.run, the module is left out
+            normalized.append(f"\tat {frame.rsplit('/', 1)[-1]}")
+            frames += 1
+        elif line.startswith("Caused by: ") or root_cause is None:
+            text = line[len("Caused by: "):] if line.startswith("Caused by: ") else line
+            root_cause = text.split(": ", 1)[0].strip()
+            normalized.append(root_cause if not normalized else f"Caused by: {root_cause}")
+            frames = 0
+    return root_cause, "\n".join(normalized)
+
+def crash_report_time(text: str) -> Optional[datetime.datetime]:
+    # Newer JDKs put a narrow no-break space before AM and PM
+    text = text.strip().replace("\u202f", " ")
+    for time_format in CRASH_REPORT_TIME_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, time_format)
+        except ValueError:
             continue
+    return None
+
+def scan_crash_report(path: pathlib.Path, algorithms: Iterable[str] = DEFAULT_DIGESTS) -> CrashReportScan:
+    '''
+    Parses a crash report without a database, so it can run in a worker process.
+
+    Only the header and the stack trace under it are split into lines and decoded. The sections after them, which
+    are most of a report, are read in fixed size chunks for the digests and only searched for the player count line,
+    so memory stays flat however large a report is.
+    '''
+    # Reports are written by the JVM in the platform's encoding, which is not always UTF-8
+    decode = functools.partial(decode_log_line, errors="replace")
+    description, time_text, trace = None, None, None
+    player_count_line, players = None, list()
+    lines = 0
+    with open_hashed(path=path, algorithms=algorithms) as hashing, io.BufferedReader(hashing) as file:
+        # The header, then the trace under it, are read line by line until the first section of details
+        in_trace = False
+        for lines, raw_line in enumerate(file, 1):
+            if raw_line.startswith(b"A detailed walkthrough") or raw_line.startswith(b"-- "):
+                break
+            if in_trace:
+                trace.append(decode(raw_line))
+            elif raw_line.startswith(b"Description: "):
+                description = decode(raw_line)[len("Description: "):].strip()
+            elif raw_line.startswith(b"Time: "):
+                time_text = decode(raw_line)[len("Time: "):]
+            elif description is not None and raw_line.strip():
+                trace = [decode(raw_line)]
+                in_trace = True
+
+        # The rest is read in chunks, which go through the digests and are only searched for the player count line
+        marker = b"\n\tPlayer Count: "
+        # The trace ended on a whole line, so the details start on one as well
+        carry, player_count = b"\n", None
+        while True:
+            chunk = file.read(CRASH_REPORT_CHUNK_SIZE)
+            if not chunk:
+                break
+            lines += chunk.count(b"\n")
+            if player_count is None:
+                data = carry + chunk
+                start = data.find(marker)
+                if start < 0:
+                    carry = data[1 - len(marker):]
+                    continue
+                player_count = bytearray()
+                chunk = data[start + 1:]
+            if player_count_line is None:
+                end = chunk.find(b"\n")
+                player_count += chunk if end < 0 else chunk[:end + 1]
+                if end >= 0:
+                    player_count_line = decode(bytes(player_count))
+        if player_count is not None and player_count_line is None:
+            # The report ends on the player count line
+            player_count_line = decode(bytes(player_count))
+        if player_count_line is not None:
+            match = compiled(CRASH_REPORT_PLAYER_COUNT_PATTERN).match(player_count_line)
+            if match is None:
+                player_count_line = None
+            else:
+                for player_details in compiled(CRASH_REPORT_PLAYER_DETAILS_PATTERN).finditer(match["player_details"]):
+                    players.append(player_details.group("player_name", "entityid", "level_name", "x", "y", "z"))
+        bytes_read = hashing.raw.tell()
+
+    log_datetime = TimestampParser().parse_crash_report(path.name)
+    if log_datetime is None and time_text is not None:
+        log_datetime = crash_report_time(time_text)
+    if log_datetime is None:
+        # Neither the name nor the report say when it crashed, the report was written right after
+        log_datetime = datetime.datetime.fromtimestamp(path.stat().st_mtime)
+
+    exception, root_cause, stack, fingerprint = None, None, None, None
+    if trace:
+        exception = trace[0].strip()
+        root_cause, stack = normalize_stack_trace(trace)
+        fingerprint = hashlib.sha1(stack.encode(LOG_ENCODING)).hexdigest()
+
+    return CrashReportScan(
+        hexdigests=hashing.hexdigests(),
+        log_datetime=log_datetime,
+        description=description,
+        exception=exception,
+        root_cause=root_cause,
+        stack=stack,
+        fingerprint=fingerprint,
+        player_count_line=player_count_line,
+        players=players,
+        bytes_read=bytes_read,
+        lines=lines,
+    )
+
+def try_scan_crash_report(path: pathlib.Path, algorithms: Iterable[str] = DEFAULT_DIGESTS) -> Union[CrashReportScan, Exception]:
+    '''
+    Returns the error a report could not be scanned with instead of raising it, so one report does not end the map over the rest
+    '''
+    try:
+        return scan_crash_report(path=path, algorithms=algorithms)
+    except Exception as e:
+        return e
+
+def scan_crash_reports(paths: List[pathlib.Path], options: IngestOptions) -> Iterator[Union[CrashReportScan, Exception]]:
+    '''
+    Scans the reports in order, in --jobs worker processes when there are several.
+    A report that failed to be scanned is yielded as its error.
+    '''
+    if options.jobs <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield try_scan_crash_report(path=path, algorithms=options.digests)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=options.jobs) as executor:
+        # Reports are small, so they are sent to the workers several at a time
+        yield from executor.map(try_scan_crash_report, paths, itertools.repeat(options.digests), chunksize=max(1, min(64, len(paths) // (options.jobs * 4))))
 
-def parse_crash_reports(database: Union[bytes, Text], input_path: pathlib.Path, source_id: int):
+CRASH_REPORTS_INSERT_SQL = "INSERT INTO MINECRAFT_SERVER_CRASH_REPORTS VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)"
+CRASH_REPORTS_PLAYER_DETAILS_INSERT_SQL = "INSERT INTO MINECRAFT_SERVER_CRASH_REPORTS_PLAYER_DETAILS VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+def parse_crash_reports(database: Union[bytes, Text], input_path: pathlib.Path, source_id: int, options: Optional[IngestOptions] = None):
+    '''
+    Records the players online in each crash report, and the fingerprint of its stack trace in MINECRAFT_SERVER_CRASH_REPORTS.
+
+    Reports recorded before fingerprints were kept are scanned once more by an --incremental run, which only adds
+    their fingerprint under the source and file_id they were recorded with.
+    '''
+    options = options or IngestOptions()
     crash_reports_path = input_path / 'crash-reports'
-    print(f"Parsing {crash_reports_path}")
+    log_progress(f"Parsing {crash_reports_path}")
 
-    #TODO: use LogParser???
     #TODO: player_name to player? for consistancy?
-    line_pattern = re.compile("\tPlayer Count: (?P<current_player_count>[0-9]+) / (?P<max_player_count>[0-9]+); \[(?P<player_details>.+)\]")
-    player_details_pattern = re.compile("ServerPlayer\[\'(?P<player_name>[^\']+)\'/(?P<entityid>\d+), l=\'(?P<level_name>[^\']+)\', x=(?P<x>[^,]+), y=(?P<y>[^,]+), z=(?P<z>[^,]+)\]")
-
-    with sqlite3.connect(database=database) as con:
-        cur = con.cursor()
-        cur.execute(
-            "CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_CRASH_REPORTS_PLAYER_DETAILS(source_id, file_id, path, log_datetime timestamp, line, player_name, entityid, level_name, x, y, z)"
-        )
-        con.commit()
-        
-        insert_sql="INSERT INTO MINECRAFT_SERVER_CRASH_REPORTS_PLAYER_DETAILS VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    with connect(database, options) as con:
+        writer = BatchWriter(con=con, batch_size=options.batch_size, commit_interval=options.commit_interval, metrics=options.metrics)
 
+        paths = list()
+        # Unchanged reports without a fingerprint, to the (file_id, source_id) they were recorded with
+        unfingerprinted = dict()
         for crash_report_path in crash_reports_path.iterdir():
-            file_id = write_file_info(database=database, path=crash_report_path, source_id=source_id)
-
-            # TODO: Use the parse thing used in logs
-            log_datetime = datetime.datetime(
-                int(crash_report_path.name[6:10]),
-                int(crash_report_path.name[11:13]),
-                int(crash_report_path.name[14:16]),
-                int(crash_report_path.name[17:19]),
-                int(crash_report_path.name[20:22]),
-                int(crash_report_path.name[23:25]),
-            )
-
-            with crash_report_path.open("r") as file:
-                for line in file.readlines():
-                    match = line_pattern.match(line)
-                    if match is None:
-                        continue
-                    player_count_details = match.groupdict()
-                    players_details = player_count_details['player_details']
-
-                    for player_details_match in player_details_pattern.finditer(players_details):
-                        player_details = player_details_match.groupdict()
-                        params = (
-                            source_id, 
-                            file_id, 
+            if not crash_report_path.is_file():
+                continue
+            if options.incremental and is_file_unchanged(con=con, path=crash_report_path, algorithms=options.digests):
+                file_id, recorded_source_id, *_ = find_file_info(con=con, path=crash_report_path)
+                if con.execute("SELECT 1 FROM MINECRAFT_SERVER_CRASH_REPORTS WHERE file_id = ?", (file_id,)).fetchone() is not None:
+                    continue
+                unfingerprinted[crash_report_path] = (file_id, recorded_source_id)
+            paths.append(crash_report_path)
+
+        for crash_report_path, scan in zip(paths, scan_crash_reports(paths=paths, options=options)):
+            with writer.file(crash_report_path):
+                if isinstance(scan, Exception):
+                    # Raised inside the file, so the report is skipped like one that failed to be written
+                    raise scan
+                if crash_report_path in unfingerprinted:
+                    file_id, report_source_id = unfingerprinted[crash_report_path]
+                else:
+                    file_id, report_source_id = insert_file_info(con=con, path=crash_report_path, source_id=source_id, hexdigests=scan.hexdigests), source_id
+                    writer.read(bytes_read=scan.bytes_read, lines=scan.lines)
+                    for player_name, entityid, level_name, x, y, z in scan.players:
+                        writer.insert(CRASH_REPORTS_PLAYER_DETAILS_INSERT_SQL, (
+                            source_id,
+                            file_id,
                             #TODO: Remove paths, file_id will do
-                            str(crash_report_path), # path 
-                            log_datetime, # log_datetime
-                            line,        
-                            player_details["player_name"], # player_name, 
-                            player_details["entityid"], # entityid, 
-                            player_details["level_name"], # level_name, 
-                            player_details["x"], # x, 
-                            player_details["y"], # y, 
-                            player_details["z"],
-                        )
-                        con.execute(
-                            insert_sql, 
-                            params,
-                        )
-
-                    con.commit()
+                            str(crash_report_path), # path
+                            scan.log_datetime, # log_datetime
+                            scan.player_count_line, # line
+                            player_name, # player_name
+                            entityid, # entityid
+                            level_name, # level_name
+                            x, # x
+                            y, # y
+                            z, # z
+                        ))
+
+                writer.insert(CRASH_REPORTS_INSERT_SQL, (
+                    report_source_id, # source_id
+                    file_id, # file_id
+                    str(crash_report_path), # path
+                    scan.log_datetime, # log_datetime
+                    scan.description, # description
+                    scan.exception, # exception
+                    scan.root_cause, # root_cause
+                    scan.fingerprint, # fingerprint
+                    scan.stack, # stack
+                ))
+
+        writer.commit()
 
 SESSION_SELECT_SQL = '''
 SELECT
@@ -504,48 +2560,815 @@ WHERE source_id = ?
 ORDER BY player, log_datetime
 '''
 
-def parse_sessions(database: Union[bytes, Text], input_path: pathlib.Path, source_id: int):
-    players = list()
+SESSION_CREATE_SQL = "CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_SESSIONS(source_id, player, left_id, login_id, left_time timestamp, login_time timestamp, left_type, login_type, duration)"
+SESSION_INSERT_SQL = "INSERT INTO MINECRAFT_SERVER_SESSIONS VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)"
 
-    print(f"Parsing sessions")
+# Tables read by parse_sessions, with the player column and whether an event in them opens or closes a session
+SESSION_EVENTS = [
+    ("MINECRAFT_SERVER_LOGS_LOGGED_IN", "player", "joined"),
+    ("MINECRAFT_SERVER_LOGS_LEFT_GAME", "player", "left"),
+    ("MINECRAFT_SERVER_CRASH_REPORTS_PLAYER_DETAILS", "player_name", "left"),
+]
 
-    with sqlite3.connect(database=database, detect_types=sqlite3.PARSE_DECLTYPES) as con:
-        cur = con.cursor()
-        cur.execute("CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_SESSIONS(source_id, player, left_id, login_id, left_time timestamp, login_time timestamp, left_type, login_type, duration)")
-        con.commit()
+def create_session_tables(con: sqlite3.Connection):
+    con.execute(SESSION_CREATE_SQL)
+    # Play time per player per day and per week (starting on Monday), kept up to date as sessions are inserted
+    backfill = not table_exists(con, "MINECRAFT_SERVER_PLAYTIME_DAILY")
+    for rollup in PLAYTIME_ROLLUPS:
+        con.execute(f"CREATE TABLE IF NOT EXISTS {rollup}(source_id INTEGER, player TEXT, period TEXT, sessions INTEGER, duration REAL, first_login timestamp, last_left timestamp, PRIMARY KEY(source_id, player, period))")
+    if backfill:
+        # Sessions recorded before the rollups existed
+        for (source_id,) in con.execute("SELECT DISTINCT source_id FROM MINECRAFT_SERVER_SESSIONS").fetchall():
+            rollups = dict()
+            for player, login_time, left_time in con.execute("SELECT player, login_time, left_time FROM MINECRAFT_SERVER_SESSIONS WHERE source_id = ?", (source_id,)):
+                rollup_session(rollups=rollups, player=player, login_time=parse_timestamp(login_time), left_time=parse_timestamp(left_time))
+            write_playtime_rollups(con=con, source_id=source_id, rollups=rollups)
+    # Players still logged in on each server after the last events processed, and the time of those events for each source
+    if table_exists(con, "MINECRAFT_SERVER_OPEN_SESSIONS") and "input_path" not in {row[1] for row in con.execute("PRAGMA table_info(MINECRAFT_SERVER_OPEN_SESSIONS)")}:
+        # Open sessions used to be kept per player, whatever server they were on
+        con.execute("ALTER TABLE MINECRAFT_SERVER_OPEN_SESSIONS RENAME TO MINECRAFT_SERVER_OPEN_SESSIONS_OLD")
+        con.execute("CREATE TABLE MINECRAFT_SERVER_OPEN_SESSIONS(input_path TEXT, player TEXT, source_id, login_id, login_time timestamp, login_type, PRIMARY KEY(input_path, player))")
+        con.execute("INSERT OR REPLACE INTO MINECRAFT_SERVER_OPEN_SESSIONS SELECT source.input_path, old.player, old.source_id, old.login_id, old.login_time, old.login_type FROM MINECRAFT_SERVER_OPEN_SESSIONS_OLD AS old JOIN MINECRAFT_SERVER_SOURCE AS source ON source.rowid = old.source_id")
+        con.execute("DROP TABLE MINECRAFT_SERVER_OPEN_SESSIONS_OLD")
+    con.execute("CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_OPEN_SESSIONS(input_path TEXT, player TEXT, source_id, login_id, login_time timestamp, login_type, PRIMARY KEY(input_path, player))")
+    con.execute("CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_SESSION_PROGRESS(source_id INTEGER PRIMARY KEY, log_datetime timestamp)")
+
+def parse_timestamp(value: Union[datetime.datetime, str]) -> datetime.datetime:
+    # Connections made without PARSE_DECLTYPES return timestamp columns as text
+    if isinstance(value, str):
+        return datetime.datetime.fromisoformat(value)
+    return value
+
+PLAYTIME_ROLLUPS = {
+    "MINECRAFT_SERVER_PLAYTIME_DAILY": lambda day: day,
+    "MINECRAFT_SERVER_PLAYTIME_WEEKLY": lambda day: day - datetime.timedelta(days=day.weekday()),
+}
+
+def rollup_session(rollups: Dict[Tuple[str, str, str], List[Any]], player: str, login_time: datetime.datetime, left_time: datetime.datetime):
+    '''
+    Adds a session to in memory rollups, splitting its duration at midnight so each day gets the time played on it
+    '''
+    start = login_time
+    while True:
+        day = start.date()
+        end = min(left_time, datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time()))
+        for rollup, period in PLAYTIME_ROLLUPS.items():
+            key = (rollup, player, period(day).isoformat())
+            totals = rollups.get(key)
+            if totals is None:
+                totals = rollups[key] = [0, 0.0, login_time, left_time]
+            # A session is counted once, on the day it started
+            if start == login_time:
+                totals[0] += 1
+            totals[1] += (end - start).total_seconds()
+            totals[2] = min(totals[2], login_time)
+            totals[3] = max(totals[3], left_time)
+        if end >= left_time:
+            break
+        start = end
+
+def write_playtime_rollups(con: sqlite3.Connection, source_id: int, rollups: Dict[Tuple[str, str, str], List[Any]]):
+    for rollup in PLAYTIME_ROLLUPS:
+        con.executemany(
+            f'''
+            INSERT INTO {rollup} VALUES(?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(source_id, player, period) DO UPDATE SET
+                sessions = sessions + excluded.sessions,
+                duration = duration + excluded.duration,
+                first_login = MIN(first_login, excluded.first_login),
+                last_left = MAX(last_left, excluded.last_left)
+            ''',
+            [(source_id, player, period, *totals) for (table, player, period), totals in rollups.items() if table == rollup],
+        )
 
-        cur_player, login_id, login_time, login_type = None, None, None, None
+def iter_session_events(con: sqlite3.Connection, source_id: int, since: Optional[datetime.datetime] = None) -> Iterator[Tuple[datetime.datetime, int, str, str, str]]:
+    '''
+    Yields (log_datetime, rowid, table_type, event_type, player) for a source in time order.
+
+    Each table is read by its own cursor in log_datetime order, through a (source_id, log_datetime) index,
+    and the cursors are merged as they are read rather than sorted together in memory.
+    '''
+    cursors = []
+    for table, player, event_type in SESSION_EVENTS:
+        row = con.execute("SELECT type FROM sqlite_master WHERE name = ?", (table,)).fetchone()
+        if row is None:
+            continue
 
-        res = cur.execute(SESSION_SELECT_SQL, [source_id, source_id, source_id])
-        for row in res.fetchall():
-            source_id, rowid, log_datetime, table_type, event_type, player = row
+        cursors.append(con.execute(
+            f"SELECT log_datetime, rowid, '{table}', '{event_type}', {player} FROM {table} WHERE source_id = ? AND log_datetime > ? ORDER BY log_datetime",
+            (source_id, since or datetime.datetime.min),
+        ))
+    return heapq.merge(*cursors, key=lambda event: event[0])
+
+def parse_sessions(database: Union[bytes, Text], input_path: pathlib.Path, source_id: int, options: Optional[IngestOptions] = None):
+    '''
+    Pairs each player's logins with the next time they left, streaming the events of the source in time order.
+
+    Players still logged in at the end are kept in MINECRAFT_SERVER_OPEN_SESSIONS, so a later --incremental run
+    of the same server, whose source only holds new events, closes their sessions instead of losing them. Any other
+    run replays every event of the server under its new source, so it starts without the open sessions of the last one.
+    '''
+    options = options or IngestOptions()
+    log_progress("Parsing sessions")
+
+    with connect(database, options) as con:
+        # The events are read while sessions are written, so the write lock is taken before reading them, as in BatchFile
+        if not con.in_transaction:
+            con.execute("BEGIN IMMEDIATE")
+        row = con.execute("SELECT log_datetime FROM MINECRAFT_SERVER_SESSION_PROGRESS WHERE source_id = ?", (source_id,)).fetchone()
+        since = row[0] if row is not None else None
+
+        open_sessions = dict()
+        if options.incremental or since is not None:
+            for player, *session in con.execute("SELECT player, login_id, login_time, login_type FROM MINECRAFT_SERVER_OPEN_SESSIONS WHERE input_path = ?", (str(input_path),)):
+                open_sessions[player] = session
+
+        writer = BatchWriter(con=con, batch_size=options.batch_size, commit_interval=options.commit_interval, metrics=options.metrics)
+        rollups = dict()
+        last_datetime = since
+        for log_datetime, rowid, table_type, event_type, player in iter_session_events(con=con, source_id=source_id, since=since):
+            last_datetime = log_datetime
             if event_type == "joined":
-                cur_player, login_id, login_time, login_type = player, rowid, log_datetime, table_type
-            elif event_type == "left":
-                if player == cur_player:
-                    duration: datetime.timedelta = log_datetime - login_time
-                    params = (
-                        source_id, # source_id
-                        player, # player
-                        rowid, # left_id
-                        login_id, # login_id
-                        log_datetime, # left_time
-                        login_time, # login_time
-                        table_type, # left_type
-                        login_type, # login_type
-                        duration.total_seconds(),
-                    )
-                    cur.execute("INSERT INTO MINECRAFT_SERVER_SESSIONS VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)", params)
-                    con.commit()
-                cur_player, login_id, login_time, login_type = None, None, None, None
+                open_sessions[player] = (rowid, log_datetime, table_type)
+                continue
+
+            session = open_sessions.get(player)
+            # A departure before the login that is open, such as one from an older log, does not close it
+            if session is None or session[1] > log_datetime:
+                continue
+            del open_sessions[player]
+            login_id, login_time, login_type = session
+            duration: datetime.timedelta = log_datetime - login_time
+            writer.insert(SESSION_INSERT_SQL, (
+                source_id, # source_id
+                player, # player
+                rowid, # left_id
+                login_id, # login_id
+                log_datetime, # left_time
+                login_time, # login_time
+                table_type, # left_type
+                login_type, # login_type
+                duration.total_seconds(),
+            ))
+            rollup_session(rollups=rollups, player=player, login_time=login_time, left_time=log_datetime)
+
+        writer.flush()
+        write_playtime_rollups(con=con, source_id=source_id, rollups=rollups)
+        con.execute("DELETE FROM MINECRAFT_SERVER_OPEN_SESSIONS WHERE input_path = ?", (str(input_path),))
+        con.executemany(
+            "INSERT INTO MINECRAFT_SERVER_OPEN_SESSIONS VALUES(?, ?, ?, ?, ?, ?)",
+            [(str(input_path), player, source_id, login_id, login_time, login_type) for player, (login_id, login_time, login_type) in open_sessions.items()],
+        )
+        if last_datetime is not None:
+            con.execute("INSERT OR REPLACE INTO MINECRAFT_SERVER_SESSION_PROGRESS VALUES(?, ?)", (source_id, last_datetime))
+        writer.commit()
+
+DEFAULT_POLL_INTERVAL = 0.25
+DEFAULT_METRICS_INTERVAL = 10.0
+
+class LogFollower:
+    '''
+    Follows logs/latest.log, writing new events and sessions as they are logged.
+
+    When latest.log is renamed for rotation, the rest of the old file is read before the new one is
+    opened from the start. Offsets are kept in MINECRAFT_SERVER_LOG_OFFSET, so a later --incremental
+    run does not parse the followed lines, or the rotated .log.gz they end up in, a second time.
+    The lag behind the log is sampled into MINECRAFT_SERVER_FOLLOW_METRICS.
+    '''
+    def __init__(self, database: Union[bytes, Text], log_path: pathlib.Path, source_id: int, poll_interval: float = DEFAULT_POLL_INTERVAL, metrics_interval: float = DEFAULT_METRICS_INTERVAL, options: Optional[IngestOptions] = None):
+        self.database = database
+        self.log_path = log_path
+        self.source_id = source_id
+        self.poll_interval = poll_interval
+        self.metrics_interval = metrics_interval
+        self.options = dataclasses.replace(options or IngestOptions(), session=None, metrics=None)
+        self.buffer_size = self.options.read_buffer_size
+        self.schema: Optional[CompactSchema] = None
+        self.input_path: Optional[str] = None
+        self.stopped = threading.Event()
+
+        self.con: Optional[sqlite3.Connection] = None
+        self.file: Optional[BufferedIOBase] = None
+        self.file_id: Optional[int] = None
+        self.offset_id: Optional[int] = None
+        self.partial = b""
+        self.byte_offset = 0
+        self.line_offset = 0
+
+        self.dispatcher = LogDispatcher(parsers)
+        self.timestamps = TimestampParser()
+        self.open_sessions: Dict[str, Tuple[int, datetime.datetime]] = dict()
+
+        self.last_datetime: Optional[datetime.datetime] = None
+        self.lines = 0
+        self.rows = 0
+        self.sample_time = time.monotonic()
+        self.sample_lines = 0
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        # The session is opened here so its connection belongs to the thread that follows the log
+        session = IngestSession(database=self.database, options=self.options)
+        self.con = session.con
+        self.schema = session.schema
+        try:
+            (self.input_path,) = self.con.execute("SELECT input_path FROM MINECRAFT_SERVER_SOURCE WHERE rowid = ?", (self.source_id,)).fetchone()
+
+            while not self.stopped.is_set():
+                if self.file is None and not self.open():
+                    self.stopped.wait(self.poll_interval)
+                    continue
+
+                rotated = self.is_rotated()
+                lines = self.read_lines(final=rotated)
+                if lines:
+                    self.process(lines)
+                if rotated:
+                    self.close()
+
+                if time.monotonic() - self.sample_time >= self.metrics_interval:
+                    self.record_metrics()
+
+                # Keep reading without waiting while catching up
+                if not lines and not rotated:
+                    self.stopped.wait(self.poll_interval)
+        finally:
+            self.close()
+            session.close()
+
+    def open(self) -> bool:
+        try:
+            log_file = self.log_path.open('rb', buffering=self.buffer_size)
+        except FileNotFoundError:
+            return False
+
+        head = log_file.readline()
+        if not head.endswith(b"\n"):
+            # Wait until the first line is complete, it identifies the file
+            log_file.close()
+            return False
+        head_sha1 = hashlib.sha1(head).hexdigest()
+
+        self.byte_offset, self.line_offset = find_log_offset(con=self.con, log_path=self.log_path, head_sha1=head_sha1)
+        log_file.seek(self.byte_offset)
+        self.file = log_file
+        self.partial = b""
+
+        # The log is still being written, so no digests are recorded for it
+        self.file_id = insert_file_info(con=self.con, path=self.log_path, source_id=self.source_id, hexdigests=dict())
+        self.offset_id = insert_log_offset(con=self.con, log_path=self.log_path, source_id=self.source_id, file_id=self.file_id, head_sha1=head_sha1, byte_offset=self.byte_offset, line_offset=self.line_offset)
+
+        line = decode_log_line(head)
+        if line.startswith("["):
+            self.seed_sessions(since=self.timestamps.parse_log(line[1:23]))
+        self.con.commit()
+        log_progress(f"Following {self.log_path} from line {self.line_offset}")
+        return True
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            self.con.commit()
+
+    def is_rotated(self) -> bool:
+        try:
+            stat = self.log_path.stat()
+        except FileNotFoundError:
+            # Renamed but not yet recreated
+            return True
+        return stat.st_ino != os.fstat(self.file.fileno()).st_ino or stat.st_size < self.byte_offset + len(self.partial)
+
+    def read_lines(self, final: bool = False) -> List[bytes]:
+        data = self.partial + self.file.read(self.buffer_size if not final else -1)
+        lines = data.splitlines(keepends=True)
+        self.partial = b""
+        # An unfinished last line is kept until the rest of it is written, unless the file was rotated away
+        if lines and not final and not lines[-1].endswith(b"\n"):
+            self.partial = lines.pop()
+        return lines
+
+    def process(self, raw_lines: List[bytes]):
+        for raw_line in raw_lines:
+            self.byte_offset += len(raw_line)
+            self.line_offset += 1
+            line = decode_log_line(raw_line)
+
+            for parser, parameters in match_log_line(line=line, dispatcher=self.dispatcher, timestamps=self.timestamps):
+                insert_sql, row = parser.insert_sql, [
+                    self.source_id, # source_id
+                    self.file_id, # file_id
+                    str(self.log_path), # log_path
+                    *parameters,
+                ]
+                if self.schema is not None:
+                    insert_sql, row = self.schema.convert(insert_sql, row)
+                cur = self.con.execute(insert_sql, row)
+                self.rows += 1
+
+                # line, end_line, log_datetime, level, then the captured groups starting with the player
+                log_datetime, player = parameters[2], parameters[4] if len(parameters) > 4 else None
+                self.last_datetime = log_datetime
+                if parser.name == "logged_in":
+                    self.open_sessions[player] = (cur.lastrowid, log_datetime)
+                    self.con.execute("INSERT OR REPLACE INTO MINECRAFT_SERVER_OPEN_SESSIONS VALUES(?, ?, ?, ?, ?, ?)", (self.input_path, player, self.source_id, cur.lastrowid, log_datetime, "MINECRAFT_SERVER_LOGS_LOGGED_IN"))
+                elif parser.name == "left_game":
+                    self.close_session(player=player, left_id=cur.lastrowid, left_time=log_datetime)
+
+        self.lines += len(raw_lines)
+        self.con.execute("UPDATE MINECRAFT_SERVER_LOG_OFFSET SET byte_offset = ?, line_offset = ? WHERE rowid = ?", (self.byte_offset, self.line_offset, self.offset_id))
+        self.con.commit()
+
+    def close_session(self, player: str, left_id: int, left_time: datetime.datetime):
+        session = self.open_sessions.pop(player, None)
+        if session is None:
+            return
+        self.con.execute("DELETE FROM MINECRAFT_SERVER_OPEN_SESSIONS WHERE input_path = ? AND player = ?", (self.input_path, player))
+        login_id, login_time = session
+        duration: datetime.timedelta = left_time - login_time
+        self.con.execute(SESSION_INSERT_SQL, (
+            self.source_id, # source_id
+            player, # player
+            left_id, # left_id
+            login_id, # login_id
+            left_time, # left_time
+            login_time, # login_time
+            "MINECRAFT_SERVER_LOGS_LEFT_GAME", # left_type
+            "MINECRAFT_SERVER_LOGS_LOGGED_IN", # login_type
+            duration.total_seconds(),
+        ))
+        rollups = dict()
+        rollup_session(rollups=rollups, player=player, login_time=login_time, left_time=left_time)
+        write_playtime_rollups(con=self.con, source_id=self.source_id, rollups=rollups)
+
+    def seed_sessions(self, since: datetime.datetime):
+        '''
+        Replays the logins and departures of the followed server already recorded since it started, to find who is online.
+
+        Only the sources of this server are read. Each event counts once, from the latest source that holds it: a full
+        ingest records every event again, while --incremental sources each hold a part of them.
+        '''
+        self.open_sessions.clear()
+        sources = "source_id IN (SELECT rowid FROM MINECRAFT_SERVER_SOURCE WHERE input_path = ?)"
+        res = self.con.execute(f'''
+            SELECT log_datetime, 0, MAX(rowid), player FROM MINECRAFT_SERVER_LOGS_LOGGED_IN WHERE log_datetime >= ? AND {sources} GROUP BY log_datetime, player
+            UNION ALL
+            SELECT log_datetime, 1, MAX(rowid), player FROM MINECRAFT_SERVER_LOGS_LEFT_GAME WHERE log_datetime >= ? AND {sources} GROUP BY log_datetime, player
+            ORDER BY 1, 2
+        ''', (since, self.input_path, since, self.input_path))
+        for log_datetime, left, rowid, player in res:
+            if left:
+                self.open_sessions.pop(player, None)
+            else:
+                self.open_sessions[player] = (rowid, log_datetime)
+
+    def record_metrics(self):
+        now = time.monotonic()
+        lines_per_second = (self.lines - self.sample_lines) / max(now - self.sample_time, 1e-9)
+        self.sample_time, self.sample_lines = now, self.lines
+
+        lag_seconds = None
+        if self.last_datetime is not None:
+            lag_seconds = (datetime.datetime.now() - self.last_datetime).total_seconds()
+        bytes_behind = None
+        if self.file is not None:
+            bytes_behind = os.fstat(self.file.fileno()).st_size - self.byte_offset
+
+        self.con.execute("INSERT INTO MINECRAFT_SERVER_FOLLOW_METRICS VALUES(?, ?, ?, ?, ?, ?, ?)", (
+            self.source_id,
+            datetime.datetime.now(),
+            self.lines,
+            self.rows,
+            lines_per_second,
+            lag_seconds,
+            bytes_behind,
+        ))
+        self.con.commit()
+        log_progress(f"Followed {self.lines} lines, {self.rows} rows, {lines_per_second:,.0f} lines/sec, lag {lag_seconds if lag_seconds is None else round(lag_seconds, 3)}s, {bytes_behind} bytes behind")
+
+def follow_logs(database: Union[bytes, Text], input_path: pathlib.Path, source_id: int, options: Optional[IngestOptions] = None, poll_interval: float = DEFAULT_POLL_INTERVAL, metrics_interval: float = DEFAULT_METRICS_INTERVAL):
+    options = options or IngestOptions()
+    follower = LogFollower(
+        database=database,
+        log_path=input_path / 'logs' / 'latest.log',
+        source_id=source_id,
+        poll_interval=poll_interval,
+        metrics_interval=metrics_interval,
+        options=options,
+    )
+
+    thread = threading.Thread(target=follower.run, name="LogFollower")
+    thread.start()
+    try:
+        while thread.is_alive():
+            thread.join(timeout=1.0)
+    except KeyboardInterrupt:
+        follower.stop()
+        thread.join()
+
+def create_tables(con: sqlite3.Connection, options: IngestOptions) -> Optional[CompactSchema]:
+    '''
+    Creates every table and index the stages write to, returning the compact schema if it is used
+    '''
+    con.execute("CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_SOURCE(run_date timestamp, input_path TEXT)")
+    create_file_info(con)
+
+    con.execute("CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_CRASH_REPORTS_PLAYER_DETAILS(source_id, file_id, path, log_datetime timestamp, line, player_name, entityid, level_name, x, y, z)")
+    create_position_index(con=con, table="MINECRAFT_SERVER_CRASH_REPORTS_PLAYER_DETAILS", player="player_name")
+    con.execute("CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_CRASH_REPORTS(source_id, file_id, path TEXT, log_datetime timestamp, description TEXT, exception TEXT, root_cause TEXT, fingerprint TEXT, stack TEXT)")
+    # Grouping crashes by cause reads the index alone
+    con.execute("CREATE INDEX IF NOT EXISTS MINECRAFT_SERVER_CRASH_REPORTS_FINGERPRINT ON MINECRAFT_SERVER_CRASH_REPORTS(fingerprint, log_datetime)")
+
+    con.execute("CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_OPS(source_id, uuid, name, level, bypassesPlayerLimit)")
+    con.execute("CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_WHITELIST(source_id, uuid, name)")
+    con.execute("CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_USERCACHE(source_id, uuid, name, expiresOn)")
+    con.execute("CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_SERVER_PROPERTIES(source_id, file_id, key, value)")
+
+    con.execute("CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_REGIONS(source_id, file_id, path TEXT, region_x INTEGER, region_z INTEGER, min_x INTEGER, min_y INTEGER, min_z INTEGER, max_x INTEGER, max_y INTEGER, max_z INTEGER, chunks INTEGER, superseded_source_id INTEGER)")
+    create_region_history(con)
+    con.execute("CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_CHUNKS(source_id, file_id, region_x INTEGER, region_z INTEGER, chunk_x INTEGER, chunk_z INTEGER, sector_offset INTEGER, sector_count INTEGER, length INTEGER, compression INTEGER, last_modified timestamp)")
+    con.execute("CREATE INDEX IF NOT EXISTS MINECRAFT_SERVER_CHUNKS_COORDINATE ON MINECRAFT_SERVER_CHUNKS(chunk_x, chunk_z)")
+    create_region_index(con)
+    con.execute("CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_CHUNK_STATS(source_id, file_id, chunk_x INTEGER, chunk_z INTEGER, compression INTEGER, data_version INTEGER, status TEXT, inhabited_time INTEGER, last_update INTEGER, entities INTEGER, block_entities INTEGER)")
+
+    con.execute("CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_STATS(source_id, file_id, uuid TEXT, category TEXT, key TEXT, value)")
+    con.execute("CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_STATS_LEADERBOARD(source_id, file_id, path TEXT, uuid TEXT, leaderboard TEXT, value INTEGER)")
+    con.execute("CREATE INDEX IF NOT EXISTS MINECRAFT_SERVER_STATS_LEADERBOARD_VALUE ON MINECRAFT_SERVER_STATS_LEADERBOARD(leaderboard, value DESC)")
+    con.execute("CREATE INDEX IF NOT EXISTS MINECRAFT_SERVER_STATS_LEADERBOARD_PATH ON MINECRAFT_SERVER_STATS_LEADERBOARD(path)")
+
+    schema = create_log_tables(con=con, options=options)
+    con.execute("CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_LOG_OFFSET(source_id, file_id, path TEXT, head_sha1 TEXT, byte_offset INTEGER, line_offset INTEGER)")
+    con.execute("CREATE INDEX IF NOT EXISTS MINECRAFT_SERVER_LOG_OFFSET_HEAD ON MINECRAFT_SERVER_LOG_OFFSET(head_sha1)")
+
+    create_session_tables(con)
+    for table, player, event_type in SESSION_EVENTS:
+        (kind,) = con.execute("SELECT type FROM sqlite_master WHERE name = ?", (table,)).fetchone()
+        # The compact schema keeps the rows behind a view
+        indexed_table = table if kind == "table" else f"{table}_COMPACT"
+        con.execute(f"CREATE INDEX IF NOT EXISTS {indexed_table}_SOURCE_DATETIME ON {indexed_table}(source_id, log_datetime)")
+
+    con.execute("CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_RUN_METRICS(source_id, stage TEXT, path TEXT, wall_seconds REAL, cpu_seconds REAL, bytes_read INTEGER, lines INTEGER, rows INTEGER, commits INTEGER, matches TEXT)")
+    con.execute("CREATE INDEX IF NOT EXISTS MINECRAFT_SERVER_RUN_METRICS_SOURCE ON MINECRAFT_SERVER_RUN_METRICS(source_id, stage)")
+    con.execute("CREATE TABLE IF NOT EXISTS MINECRAFT_SERVER_FOLLOW_METRICS(source_id, sample_time timestamp, lines INTEGER, rows INTEGER, lines_per_second REAL, lag_seconds REAL, bytes_behind INTEGER)")
+
+    con.commit()
+    return schema
+
+class IngestSession:
+    '''
+    One connection for a whole run, shared by the stages run in its thread through IngestOptions.session.
+
+    The database is switched to WAL, so reports can be read while it is being written, and the
+    schema is created once up front rather than by each stage. Stages run in other threads fork
+    the session, for a connection of their own that shares the schema.
+    '''
+    def __init__(self, database: Union[bytes, Text], options: Optional[IngestOptions] = None, parent: Optional["IngestSession"] = None):
+        options = options or IngestOptions()
+        self.database = database
+        self.options = options
+        self.con = sqlite3.connect(database=database, detect_types=sqlite3.PARSE_DECLTYPES, timeout=BUSY_TIMEOUT)
+        self.con.execute("PRAGMA journal_mode = WAL")
+        self.con.execute(f"PRAGMA synchronous = {options.synchronous}")
+        # A negative cache_size is in KiB rather than pages
+        self.con.execute(f"PRAGMA cache_size = {-options.cache_size}")
+        self.con.execute(f"PRAGMA mmap_size = {options.mmap_size}")
+        self.con.execute(f"PRAGMA temp_store = {options.temp_store}")
+        if parent is None:
+            self.schema = create_tables(con=self.con, options=options)
+        else:
+            self.schema = parent.schema.bind(self.con) if parent.schema is not None else None
+
+    def fork(self) -> "IngestSession":
+        return IngestSession(database=self.database, options=self.options, parent=self)
+
+    def close(self):
+        self.con.commit()
+        self.con.close()
+
+    def __enter__(self) -> "IngestSession":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+@contextlib.contextmanager
+def ingest_session(database: Union[bytes, Text], options: Optional[IngestOptions] = None) -> Iterator[IngestOptions]:
+    '''
+    Yields the options with a session, opening one until the block ends if they have none
+    '''
+    options = options or IngestOptions()
+    if options.session is not None:
+        yield options
+        return
+    with IngestSession(database=database, options=options) as session:
+        yield dataclasses.replace(options, session=session)
+
+@contextlib.contextmanager
+def connect(database: Union[bytes, Text], options: Optional[IngestOptions] = None) -> Iterator[sqlite3.Connection]:
+    '''
+    The connection of the run's session, committed when the block ends like sqlite3.connect's
+    '''
+    with ingest_session(database, options) as options, options.session.con as con:
+        yield con
+
+@dataclass
+class Stage:
+    name: str
+    parse: Callable[..., None]
+    # Stages whose rows this one reads, which are done before it starts
+    depends: Tuple[str, ...] = ()
+
+STAGES = [
+    Stage(name="crash_reports", parse=parse_crash_reports),
+    Stage(name="ops", parse=parse_ops),
+    Stage(name="whitelist", parse=parse_whitelist),
+    Stage(name="usercache", parse=parse_usercache),
+    Stage(name="server_properties", parse=parse_server_properties),
+    Stage(name="regions", parse=parse_world_regions, depends=("server_properties",)),
+    Stage(name="stats", parse=parse_world_stats, depends=("server_properties",)),
+    Stage(name="logs", parse=parse_logs),
+    Stage(name="sessions", parse=parse_sessions, depends=("crash_reports", "logs")),
+]
+
+def select_stages(names: Optional[Iterable[str]] = None) -> List[Stage]:
+    '''
+    The named stages and every stage they depend on, in the order of STAGES. All of them without names.
+    '''
+    stages = {stage.name: stage for stage in STAGES}
+    if names is None:
+        return list(STAGES)
+
+    selected = set()
+    pending = list(names)
+    while pending:
+        name = pending.pop()
+        if name in selected:
+            continue
+        if name not in stages:
+            raise ValueError(f"unknown stage {name!r}, choose from {','.join(stages)}")
+        selected.add(name)
+        pending += stages[name].depends
+    return [stage for stage in STAGES if stage.name in selected]
+
+def run_stage(stage: Stage, database: Union[bytes, Text], input_path: pathlib.Path, source_id: int, options: IngestOptions):
+    with options.metrics.stage(stage.parse.__name__) if options.metrics is not None else contextlib.nullcontext():
+        stage.parse(database=database, input_path=input_path, source_id=source_id, options=options)
+
+def run_forked_stage(stage: Stage, database: Union[bytes, Text], input_path: pathlib.Path, source_id: int, options: IngestOptions):
+    # SQLite connections belong to the thread that opened them
+    with options.session.fork() as session:
+        run_stage(stage=stage, database=database, input_path=input_path, source_id=source_id, options=dataclasses.replace(options, session=session))
+
+def run_stages(database: Union[bytes, Text], input_path: pathlib.Path, source_id: int, stages: List[Stage], options: IngestOptions):
+    '''
+    Runs the stages on up to options.stage_threads threads, each as soon as the stages it depends on are done.
+
+    Every thread writes through its own connection and SQLite only has one writer at a time. Each file is parsed
+    inside the write transaction it is written with, so stages only overlap while one waits on disk, or on the
+    worker processes of --jobs, and the rest of the time they take turns. With one thread, the default, the
+    stages run in order on the session's connection.
+    '''
+    if options.stage_threads <= 1:
+        for stage in stages:
+            run_stage(stage=stage, database=database, input_path=input_path, source_id=source_id, options=options)
+        return
+
+    selected = {stage.name for stage in stages}
+    pending = list(stages)
+    done = set()
+    running: Dict[Future, Stage] = dict()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=options.stage_threads, thread_name_prefix="Stage") as executor:
+        try:
+            while pending or running:
+                # Dependencies that were not selected were left to an earlier run
+                ready = [stage for stage in pending if all(name in done or name not in selected for name in stage.depends)]
+                if not ready and not running:
+                    raise ValueError(f"stages {','.join(stage.name for stage in pending)} depend on each other")
+                for stage in ready:
+                    pending.remove(stage)
+                    running[executor.submit(run_forked_stage, stage, database, input_path, source_id, options)] = stage
+
+                finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    stage = running.pop(future)
+                    future.result()
+                    done.add(stage.name)
+        except BaseException:
+            # Stages that have not started are dropped, the running ones are waited for
+            for future in running:
+                future.cancel()
+            raise
+
+def ingest_server(database: Union[bytes, Text], input_path: pathlib.Path, options: Optional[IngestOptions] = None, stages: Optional[List[Stage]] = None) -> int:
+    '''
+    Runs the stages, every one by default, for one server directory under a new source_id, which is returned
+    '''
+    with ingest_session(database, options) as options:
+        source_id = write_source(database=database, input_path=input_path, options=options)
+        run_stages(database=database, input_path=input_path, source_id=source_id, stages=stages if stages is not None else STAGES, options=options)
+        if options.metrics is not None:
+            options.metrics.write(database=database, source_id=source_id, options=options)
+    return source_id
+
+# Columns holding the rowid of another table, which are shifted by the rows that table already held
+MERGED_REFERENCES = {
+    "source_id": "MINECRAFT_SERVER_SOURCE",
+    "superseded_source_id": "MINECRAFT_SERVER_SOURCE",
+    "file_id": "MINECRAFT_SERVER_FILE",
+    "region_id": "MINECRAFT_SERVER_REGIONS",
+}
+# previous_region_id is not shifted, staging databases compare their regions against the output's rows
+
+# Tables that only keep the latest rows for a key, whose rows are replaced by the staging database's
+MERGED_LATEST = {
+    "MINECRAFT_SERVER_STATS_LEADERBOARD": "path",
+}
+
+# Tables whose current rows for a key are superseded by the staging database's, as a later source
+MERGED_SUPERSEDED = {
+    "MINECRAFT_SERVER_REGIONS": "path",
+}
+
+def merge_database(con: sqlite3.Connection, staging: Union[bytes, Text]) -> List[int]:
+    '''
+    Copies every source of a staging database into the one con is connected to, returning their new source_ids.
+
+    Missing tables, views, indexes and triggers are created from the staging schema, then each table is copied
+    with one INSERT ... SELECT. Rowids are shifted past the rows already in the table, along with the source_id
+    and file_id columns, and the ids of SESSIONS and OPEN_SESSIONS rows by the table named in their *_type column.
+    Interned strings are matched by value. The R*Trees are not copied, their triggers fill them as rows are inserted.
+    '''
+    con.execute("ATTACH DATABASE ? AS staging", (staging,))
+    try:
+        objects = con.execute("SELECT type, name, sql FROM staging.sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%' ORDER BY rowid").fetchall()
+        virtual = {name for kind, name, sql in objects if sql.startswith("CREATE VIRTUAL TABLE")}
+        shadow = {f"{name}_{suffix}" for name in virtual for suffix in ("rowid", "node", "parent")}
+
+        tables = list()
+        for kind, name, sql in objects:
+            if name in shadow:
+                continue
+            existing = con.execute("SELECT type FROM main.sqlite_master WHERE name = ?", (name,)).fetchone()
+            if existing is None:
+                con.execute(sql)
+            elif existing[0] != kind:
+                raise ValueError(f"{name} is a {existing[0]} in the output database but a {kind} in {staging}, use the same --compact setting")
+            if kind == "table" and name not in virtual:
+                tables.append(name)
+
+        # Every offset is taken before anything is copied, so references resolve to the rowids the rows end up with
+        offsets = dict()
+        for table in tables:
+            (offset,) = con.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM main.{table}").fetchone()
+            offsets[table] = offset
+        for (name,) in con.execute("SELECT name FROM staging.sqlite_master WHERE type = 'view'").fetchall():
+            if f"{name}_COMPACT" in offsets:
+                offsets[name] = offsets[f"{name}_COMPACT"]
+
+        if "MINECRAFT_SERVER_STRINGS" in tables:
+            con.execute("INSERT OR IGNORE INTO main.MINECRAFT_SERVER_STRINGS(value) SELECT value FROM staging.MINECRAFT_SERVER_STRINGS ORDER BY string_id")
+            con.execute("DROP TABLE IF EXISTS temp.MERGED_STRINGS")
+            con.execute("CREATE TEMP TABLE MERGED_STRINGS(old INTEGER PRIMARY KEY, new INTEGER)")
+            con.execute("INSERT INTO temp.MERGED_STRINGS SELECT old.string_id, new.string_id FROM staging.MINECRAFT_SERVER_STRINGS AS old JOIN main.MINECRAFT_SERVER_STRINGS AS new ON new.value = old.value")
+            tables.remove("MINECRAFT_SERVER_STRINGS")
+            tables.insert(0, "MINECRAFT_SERVER_STRINGS")
+
+        interned = {"level_id"} | {f"{group}_id" for group in INTERNED_GROUPS}
+        for table in tables:
+            if table == "MINECRAFT_SERVER_STRINGS":
+                continue
+            info = con.execute(f"PRAGMA staging.table_info({table})").fetchall()
+            columns = [row[1] for row in info]
+            ensure_columns(con, table, {row[1]: row[2] for row in info})
+            # An INTEGER PRIMARY KEY is the rowid, and is remapped as the column it is
+            keys = [row for row in info if row[5]]
+            rowid_alias = len(keys) == 1 and keys[0][2].upper() == "INTEGER"
+
+            selects = list()
+            for column in columns:
+                if column in MERGED_REFERENCES:
+                    selects.append(f"{column} + {offsets.get(MERGED_REFERENCES[column], 0)}")
+                elif table.endswith("_COMPACT") and column in interned:
+                    selects.append(f"(SELECT new FROM temp.MERGED_STRINGS WHERE old = {column})")
+                elif column.endswith("_id") and f"{column[:-3]}_type" in columns:
+                    cases = " ".join(f"WHEN '{name}' THEN {offset}" for name, offset in offsets.items())
+                    selects.append(f"{column} + CASE {column[:-3]}_type {cases} ELSE 0 END")
+                else:
+                    selects.append(column)
+
+            targets = columns
+            if not rowid_alias:
+                targets = ["rowid", *columns]
+                selects = [f"rowid + {offsets[table]}", *selects]
+            conflict = "OR REPLACE " if keys and not rowid_alias else ""
+            if table in MERGED_LATEST:
+                key = MERGED_LATEST[table]
+                con.execute(f"DELETE FROM main.{table} WHERE {key} IN (SELECT {key} FROM staging.{table})")
+            if table in MERGED_SUPERSEDED:
+                key = MERGED_SUPERSEDED[table]
+                con.execute(f"UPDATE main.{table} SET superseded_source_id = (SELECT MIN(staged.source_id) + {offsets['MINECRAFT_SERVER_SOURCE']} FROM staging.{table} AS staged WHERE staged.{key} = main.{table}.{key}) WHERE superseded_source_id IS NULL AND {key} IN (SELECT {key} FROM staging.{table})")
+            con.execute(f"INSERT {conflict}INTO main.{table}({', '.join(targets)}) SELECT {', '.join(selects)} FROM staging.{table} ORDER BY rowid")
+
+        if "MINECRAFT_SERVER_REGION_DIFF" in tables:
+            # Deleted regions have no row in the staging database that supersedes theirs by path
+            con.execute(f"UPDATE main.MINECRAFT_SERVER_REGIONS SET superseded_source_id = (SELECT MIN(diff.source_id) + {offsets['MINECRAFT_SERVER_SOURCE']} FROM staging.MINECRAFT_SERVER_REGION_DIFF AS diff WHERE diff.previous_region_id = main.MINECRAFT_SERVER_REGIONS.rowid) WHERE superseded_source_id IS NULL AND rowid IN (SELECT previous_region_id FROM staging.MINECRAFT_SERVER_REGION_DIFF WHERE change = 'deleted')")
+
+        source_ids = [source_id + offsets["MINECRAFT_SERVER_SOURCE"] for (source_id,) in con.execute("SELECT rowid FROM staging.MINECRAFT_SERVER_SOURCE ORDER BY rowid")]
+        con.commit()
+    finally:
+        con.execute("DETACH DATABASE staging")
+    return source_ids
+
+def ingest_staged(staging: Union[bytes, Text], input_path: pathlib.Path, options: IngestOptions, stages: Optional[List[Stage]] = None) -> Union[bytes, Text]:
+    ingest_server(database=staging, input_path=input_path, options=options, stages=stages)
+    return staging
+
+def ingest_servers(database: Union[bytes, Text], input_paths: List[pathlib.Path], options: Optional[IngestOptions] = None, servers: Optional[int] = None, stages: Optional[List[Stage]] = None) -> List[int]:
+    '''
+    Ingests several server directories at once, each in its own process and staging database.
+
+    Staging databases are merged into the output in the order the servers were given, each as soon as
+    it and the ones before it are done, so the merging overlaps the servers that are still being ingested.
+    Their regions are compared against the output's, so a server ingested again only records what changed.
+    '''
+    import tempfile
+
+    options = options or IngestOptions()
+    source_ids = list()
+    with tempfile.TemporaryDirectory(dir=pathlib.Path(database).resolve().parent, prefix=".staging-") as directory, concurrent.futures.ProcessPoolExecutor(max_workers=servers or len(input_paths)) as executor:
+        futures = list()
+        for index, input_path in enumerate(input_paths):
+            staging = os.path.join(directory, f"{index}.db")
+            # Metrics are collected in the worker and merged with the rest of its database
+            futures.append(executor.submit(ingest_staged, staging, input_path, dataclasses.replace(options, metrics=RunMetrics() if options.metrics is not None else None, session=None, compared_database=str(database)), stages))
+
+        with IngestSession(database=database, options=options) as session:
+            for input_path, future in zip(input_paths, futures):
+                staging = future.result()
+                start = time.perf_counter()
+                source_ids += merge_database(con=session.con, staging=staging)
+                os.remove(staging)
+                log_progress(f"Merged {input_path} in {time.perf_counter() - start:.2f}s")
+    return source_ids
+
+def expand_inputs(values: Iterable[str]) -> List[pathlib.Path]:
+    '''
+    Expands glob patterns to the directories they match, other inputs are kept as they are
+    '''
+    import glob
+
+    input_paths = list()
+    for value in values:
+        if any(char in value for char in "*?["):
+            input_paths += [pathlib.Path(path) for path in sorted(glob.glob(value)) if os.path.isdir(path)]
+        else:
+            input_paths.append(pathlib.Path(value))
+    return input_paths
+
+def parse_digests(value: str) -> Tuple[str, ...]:
+    digests = tuple(digest.strip() for digest in value.split(",") if digest.strip())
+    for digest in digests:
+        if digest not in DIGESTS:
+            raise argparse.ArgumentTypeError(f"unsupported digest {digest!r}, choose from {','.join(DIGESTS)}")
+    return digests
+
+def parse_stage_names(value: str) -> Tuple[str, ...]:
+    names = tuple(name.strip() for name in value.split(",") if name.strip())
+    for name in names:
+        if name not in {stage.name for stage in STAGES}:
+            raise argparse.ArgumentTypeError(f"unknown stage {name!r}, choose from {','.join(stage.name for stage in STAGES)}")
+    return names
 
 def create_parser():
     parser = argparse.ArgumentParser(
         prog='MinecraftLogParser',
     )
 
-    parser.add_argument('-i', '--input', default="minecraftserver")
+    parser.add_argument('-i', '--input', nargs='+', default=["minecraftserver"], help="server directories or glob patterns, several servers are ingested at once and merged into the output")
     parser.add_argument('-o', '--output', default="results.db")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="rows buffered before they are written with executemany")
+    parser.add_argument('--commit-interval', type=int, default=DEFAULT_COMMIT_INTERVAL, help="rows written before committing at the next file boundary")
+    parser.add_argument('--incremental', action='store_true', help="skip logs and crash reports that are unchanged since they were last recorded, and resume logs that only grew")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="worker processes used to decompress and parse logs, and to scan crash reports")
+    parser.add_argument('--servers', type=int, help="servers ingested at once when several inputs are given, defaults to all of them")
+    parser.add_argument('--read-buffer-size', type=int, default=DEFAULT_READ_BUFFER_SIZE, help="bytes read and decompressed at a time from each log")
+    parser.add_argument('--digests', type=parse_digests, default=",".join(DEFAULT_DIGESTS), help=f"comma separated digests recorded for each file, from {','.join(DIGESTS)}")
+    parser.add_argument('--chunk-stats', action='store_true', help="decode every chunk of the world's region files for per chunk statistics, using --jobs worker processes")
+    parser.add_argument('--compact', action='store_true', help="store log events typed and interned behind views, with covering indexes, in a new output database")
+    parser.add_argument('--raw-lines', action='store_true', help="keep the raw line and message of each event in the compact schema")
+    parser.add_argument('--follow', action='store_true', help="after ingesting, keep following logs/latest.log until interrupted")
+    parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL, help="seconds to wait for new lines when following")
+    parser.add_argument('--metrics-interval', type=float, default=DEFAULT_METRICS_INTERVAL, help="seconds between lag samples when following")
+    parser.add_argument('--log-engine', choices=LOG_ENGINES, default="mmap", help="how plain .log files are read, mmap searches the whole file for the parsers' literals and only decodes the lines they are in, text decodes every line")
+    parser.add_argument('--synchronous', type=str.upper, choices=SYNCHRONOUS_MODES, default="NORMAL", help="PRAGMA synchronous of the output database, NORMAL is safe with WAL and only a power loss can undo the last commits")
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE, help="KiB of SQLite page cache")
+    parser.add_argument('--mmap-size', type=int, default=DEFAULT_MMAP_SIZE, help="bytes of the output database SQLite reads through mmap, 0 to turn it off")
+    parser.add_argument('--temp-store', type=str.upper, choices=TEMP_STORES, default="MEMORY", help="where SQLite keeps temporary tables and indexes")
+    parser.add_argument('--stages', type=parse_stage_names, help=f"comma separated stages to run, from {', '.join(stage.name for stage in STAGES)}, along with the stages they depend on, defaults to all of them")
+    parser.add_argument('--stage-threads', type=int, default=DEFAULT_STAGE_THREADS, help="stages run at once when they do not depend on each other, 1 runs them in order. Only stages waiting on disk gain, as each file is parsed holding the write lock")
+    parser.add_argument('--profile', metavar='PATH', help="profile the ingestion stages with cProfile and write the stats to PATH, the stages run in order and worker processes are not profiled")
 
     return parser
 
@@ -554,19 +3377,52 @@ def main(args=None, namespace=None):
     args = parser.parse_args(args=args, namespace=namespace)
 
     database = args.output
-    input_path = pathlib.Path(args.input)
-
-    source_id = write_source(database=database, input_path=input_path)
-    for parse in [
-        parse_crash_reports,
-        parse_ops, 
-        parse_whitelist, 
-        parse_usercache, 
-        parse_server_properties, 
-        parse_logs,
-        parse_sessions,
-    ]:
-        parse(database=database, input_path=input_path, source_id=source_id)
+    input_paths = expand_inputs(args.input)
+    if not input_paths:
+        parser.error(f"no server directories match {' '.join(args.input)}")
+    if len(input_paths) > 1 and (args.incremental or args.follow):
+        parser.error("--incremental and --follow need a single --input")
+    options = IngestOptions(
+        batch_size=args.batch_size,
+        commit_interval=args.commit_interval,
+        incremental=args.incremental,
+        jobs=args.jobs,
+        read_buffer_size=args.read_buffer_size,
+        digests=args.digests,
+        chunk_stats=args.chunk_stats,
+        compact=args.compact,
+        raw_lines=args.raw_lines,
+        metrics=RunMetrics(),
+        synchronous=args.synchronous,
+        cache_size=args.cache_size,
+        mmap_size=args.mmap_size,
+        temp_store=args.temp_store,
+        log_engine=args.log_engine,
+        # cProfile only sees the thread it was enabled in
+        stage_threads=1 if args.profile else args.stage_threads,
+    )
+    stages = select_stages(args.stages)
+
+    profile = None
+    if args.profile:
+        import cProfile, pstats
+
+        profile = cProfile.Profile()
+        profile.enable()
+    try:
+        if len(input_paths) > 1:
+            ingest_servers(database=database, input_paths=input_paths, options=options, servers=args.servers, stages=stages)
+        else:
+            source_id = ingest_server(database=database, input_path=input_paths[0], options=options, stages=stages)
+    finally:
+        if profile is not None:
+            profile.disable()
+            profile.dump_stats(args.profile)
+            log_progress(f"Wrote profile to {args.profile}")
+            pstats.Stats(profile).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(20)
+
+    if args.follow:
+        follow_logs(database=database, input_path=input_paths[0], source_id=source_id, options=options, poll_interval=args.poll_interval, metrics_interval=args.metrics_interval)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file